@@ -0,0 +1,163 @@
+"""
+Exportação e importação em massa de eco_messages e love_notes (NDJSON ou CSV).
+
+Exportar: o cursor do SQLite vira um gerador de pedaços de ~EXPORT_CHUNK bytes;
+no HTTP/1.1 sai chunked, no HTTP/2 em DATA frames, sem juntar a tabela em memória.
+Importar: registros são lidos um a um do arquivo e gravados em lotes
+(db.import_rows: executemany, um lote por transação).
+
+Linha de comando (não precisa do servidor no ar):
+    python -m app.backup export love_notes --formato csv -o recados.csv
+    python -m app.backup import love_notes recados.csv
+"""
+import csv
+import io
+import json
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO, Iterable, Iterator
+
+from app.db import EXPORT_TABLES, iter_table, import_rows
+
+EXPORT_CHUNK = 64 * 1024    # bytes por pedaço da resposta
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# campos de texto obrigatórios (NOT NULL); vazio aqui = registro descartado
+_REQUIRED = {"eco_messages": (), "love_notes": ("message",)}
+
+def export_chunks(table: str, fmt: str) -> Iterator[bytes]:
+    """Tabela inteira no formato pedido, em pedaços de ~EXPORT_CHUNK bytes."""
+    cols = EXPORT_TABLES[table]
+    if fmt == "csv":
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator="\n")
+        w.writerow(cols)
+        for rows in iter_table(table):
+            w.writerows(rows)
+            if buf.tell() >= EXPORT_CHUNK:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode("utf-8")
+        return
+    out: list[bytes] = []
+    size = 0
+    for rows in iter_table(table):
+        for r in rows:
+            line = json.dumps(dict(zip(cols, r)), ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+            out.append(line)
+            size += len(line)
+        if size >= EXPORT_CHUNK:
+            yield b"".join(out)
+            out, size = [], 0
+    if out:
+        yield b"".join(out)
+
+def read_records(fp: BinaryIO, fmt: str) -> Iterator[dict]:
+    """Registros (dicts) de um arquivo NDJSON ou CSV, um de cada vez."""
+    if fmt == "csv":
+        try:
+            yield from csv.DictReader(io.TextIOWrapper(fp, encoding="utf-8-sig", newline=""))
+        except csv.Error as e:
+            raise ValueError(f"CSV inválido: {e}") from None
+        return
+    for n, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            raise ValueError(f"linha {n}: JSON inválido") from None
+        if isinstance(rec, dict):
+            yield rec
+
+@dataclass
+class ImportStats:
+    read: int = 0       # registros no arquivo
+    skipped: int = 0    # descartados (campo obrigatório vazio)
+    inserted: int = 0   # gravados (o resto já existia com o mesmo id)
+
+def _to_rows(table: str, records: Iterable[dict], stats: ImportStats) -> Iterator[tuple]:
+    """dict -> tupla na ordem das colunas; sem id = id novo, sem data = agora."""
+    cols = EXPORT_TABLES[table]
+    required = _REQUIRED[table]
+    now = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    for rec in records:
+        stats.read += 1
+        row = []
+        for c in cols:
+            v = rec.get(c)
+            if c == "id":
+                try:
+                    v = int(v) if v not in (None, "") else None
+                except (TypeError, ValueError):
+                    v = None
+            elif c == "created_at":
+                v = str(v) if v else now
+            else:
+                v = "" if v is None else str(v)
+            row.append(v)
+        if any(not rec.get(c) for c in required):
+            stats.skipped += 1
+            continue
+        yield tuple(row)
+
+def import_file(table: str, fp: BinaryIO, fmt: str) -> ImportStats:
+    """Importa um arquivo inteiro em lotes. ValueError se o conteúdo não parseia (lotes já gravados ficam)."""
+    stats = ImportStats()
+    n = import_rows(table, _to_rows(table, read_records(fp, fmt), stats))
+    stats.inserted = n
+    return stats
+
+def guess_format(name: str, default: str = "ndjson") -> str:
+    return "csv" if name.lower().endswith(".csv") else default
+
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+    from app.db import init_db
+    ap = argparse.ArgumentParser(prog="python -m app.backup", description="Exporta/importa tabelas do BrasaHTTP.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="tabela -> NDJSON/CSV")
+    ex.add_argument("tabela", choices=sorted(EXPORT_TABLES))
+    ex.add_argument("--formato", choices=sorted(FORMATS))
+    ex.add_argument("-o", "--saida", default="-", help="arquivo (padrão: stdout)")
+    im = sub.add_parser("import", help="NDJSON/CSV -> tabela (ids existentes são ignorados)")
+    im.add_argument("tabela", choices=sorted(EXPORT_TABLES))
+    im.add_argument("arquivo", help="arquivo ('-' = stdin)")
+    im.add_argument("--formato", choices=sorted(FORMATS))
+    args = ap.parse_args(argv)
+
+    init_db()
+    if args.cmd == "export":
+        fmt = args.formato or guess_format(args.saida)
+        out = sys.stdout.buffer if args.saida == "-" else open(args.saida, "wb")
+        try:
+            for chunk in export_chunks(args.tabela, fmt):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        return 0
+    fmt = args.formato or guess_format(args.arquivo)
+    fp = sys.stdin.buffer if args.arquivo == "-" else open(args.arquivo, "rb")
+    try:
+        stats = import_file(args.tabela, fp, fmt)
+    except ValueError as e:
+        print(f"erro: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if fp is not sys.stdin.buffer:
+            fp.close()
+    print(f"{args.tabela}: lidos {stats.read}, importados {stats.inserted}, "
+          f"descartados {stats.skipped}, já existiam {stats.read - stats.skipped - stats.inserted}",
+          file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import json, os
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -11,6 +11,19 @@ class ServerCfg:
     host: str = "0.0.0.0"
     port: int = 8080
     backlog: int = 50
+    workers: int = 0            # > 0 = pool fixo; 0 = adaptativo entre min/max_workers
+    min_workers: int = 4
+    max_workers: int = 0        # 0 = automático: min(32, cpu*5)
+    target_queue_wait: float = 0.05  # espera média na fila (s) acima da qual o pool cresce
+    queue_size: int = 128       # conexões aceitas esperando worker; acima disso -> 503
+    queue_timeout: float = 5.0  # segundos máximos na fila antes de descartar
+    retry_after: int = 2        # valor do Retry-After nos 503 de sobrecarga
+    header_timeout: float = 10.0  # prazo absoluto p/ handshake TLS + headers
+    body_min_rate: float = 1024   # bytes/s mínimos ao receber o corpo
+    body_grace: float = 5.0       # folga fixa somada ao prazo do corpo
+    max_conns_per_ip: int = 16    # 0 = sem teto
+    drain_timeout: float = 10.0   # SIGTERM/upgrade: tempo para terminar requests em andamento
+    processes: int = 1            # > 1 = pre-fork: um mestre + N processos atendendo no mesmo socket
 
 @dataclass
 class LoggingCfg:
@@ -27,17 +40,58 @@ class TLSCfg:
     port: int = 8443
     cert_file: str = "config/tls/server.crt"
     key_file: str = "config/tls/server.key"
+    http2: bool = True  # oferece "h2" no ALPN
+    h2_live_max: int = 0  # conexões h2 com SSE aberto por processo (cada uma prende um worker); 0 = max_workers/4
+
+@dataclass
+class RateLimitCfg:
+    enabled: bool = True
+    rate: float = 10.0          # fichas/segundo por IP (limite padrão)
+    burst: float = 40.0         # tamanho do balde
+    routes: dict = field(default_factory=dict)  # "METHOD /path" -> {"rate": .., "burst": ..}
+    max_keys: int = 10_000      # teto de baldes em memória
+    idle_ttl: float = 600.0     # balde sem uso há mais que isso pode sair
+
+@dataclass
+class DiagnosticsCfg:
+    slow_request_ms: float = 500.0  # request acima disso vai pro app log com as fases; 0 = off
+    profile_top: int = 10           # profiler guarda os N requests mais lentos
+    profile_dir: str = "logs/profiles"
+
+@dataclass
+class StaticCfg:
+    rescan_interval: float = 5.0    # segundos entre varreduras de app/static; 0 = só no boot/SIGHUP
+    negative_cache: int = 1024      # caminhos inexistentes lembrados (LRU)
+    memory_max_file: int = 262_144  # arquivos até esse tamanho ficam em memória (com o gzip)
+
+@dataclass
+class CacheCfg:
+    enabled: bool = True            # cache de respostas das rotas marcadas com cache_ttl
+    max_bytes: int = 16_777_216     # orçamento de memória (identidade + gzip); LRU acima disso
+    coalesce_timeout: float = 5.0   # quanto um GET espera pelo idêntico em andamento antes de rodar sozinho
+    prerender: bool = True          # rotas prerender servidas do snapshot (HTML + gzip feitos no boot)
+
+@dataclass
+class SharedCfg:
+    enabled: bool = False           # força ligado com 1 processo (ex.: upgrade); com processes > 1 liga sozinho
+    slots: int = 16384              # slots das tabelas de sessões e de rate limit (tamanho fixo)
 
 @dataclass
 class Settings:
     server: ServerCfg
     logging: LoggingCfg
     tls: TLSCfg
+    ratelimit: RateLimitCfg
+    diagnostics: DiagnosticsCfg
+    static: StaticCfg = field(default_factory=StaticCfg)
+    cache: CacheCfg = field(default_factory=CacheCfg)
+    shared: SharedCfg = field(default_factory=SharedCfg)
 
 def _merge_env(s: Settings) -> Settings:
     host = os.getenv("BRASA_HOST") or s.server.host
     port = int(os.getenv("BRASA_PORT") or s.server.port)
     level = (os.getenv("BRASA_LOG_LEVEL") or s.logging.level).upper()
+    processes = int(os.getenv("BRASA_PROCESSES") or s.server.processes)
 
     tls_enabled = os.getenv("BRASA_TLS_ENABLED")
     tls_port = os.getenv("BRASA_TLS_PORT")
@@ -45,7 +99,7 @@ def _merge_env(s: Settings) -> Settings:
     tls_key  = os.getenv("BRASA_TLS_KEY")
 
     return Settings(
-        server=ServerCfg(host=host, port=port, backlog=s.server.backlog),
+        server=replace(s.server, host=host, port=port, processes=processes),
         logging=LoggingCfg(
             level=level, dir=s.logging.dir, app_file=s.logging.app_file,
             access_file=s.logging.access_file, max_bytes=s.logging.max_bytes,
@@ -56,7 +110,14 @@ def _merge_env(s: Settings) -> Settings:
             port= int(tls_port or s.tls.port),
             cert_file= tls_cert or s.tls.cert_file,
             key_file= tls_key  or s.tls.key_file,
-        )
+            http2=s.tls.http2,
+            h2_live_max=s.tls.h2_live_max,
+        ),
+        ratelimit=s.ratelimit,
+        diagnostics=s.diagnostics,
+        static=s.static,
+        cache=s.cache,
+        shared=s.shared,
     )
 
 
@@ -66,11 +127,29 @@ def load_settings(path: Path | None = None) -> Settings:
     srv = data.get("server", {})
     log = data.get("logging", {})
     tls = data.get("tls", {})
+    rl = data.get("ratelimit", {})
+    diag = data.get("diagnostics", {})
+    stc = data.get("static", {})
+    cch = data.get("cache", {})
+    shr = data.get("shared", {})
     settings = Settings(
         server=ServerCfg(
             host=srv.get("host", "0.0.0.0"),
             port=int(srv.get("port", 8080)),
             backlog=int(srv.get("backlog", 50)),
+            workers=int(srv.get("workers", 0)),
+            min_workers=int(srv.get("min_workers", 4)),
+            max_workers=int(srv.get("max_workers", 0)),
+            target_queue_wait=float(srv.get("target_queue_wait", 0.05)),
+            queue_size=int(srv.get("queue_size", 128)),
+            queue_timeout=float(srv.get("queue_timeout", 5.0)),
+            retry_after=int(srv.get("retry_after", 2)),
+            header_timeout=float(srv.get("header_timeout", 10.0)),
+            body_min_rate=float(srv.get("body_min_rate", 1024)),
+            body_grace=float(srv.get("body_grace", 5.0)),
+            max_conns_per_ip=int(srv.get("max_conns_per_ip", 16)),
+            drain_timeout=float(srv.get("drain_timeout", 10.0)),
+            processes=int(srv.get("processes", 1)),
         ),
         logging=LoggingCfg(
             level=(log.get("level", "INFO")).upper(),
@@ -85,6 +164,36 @@ def load_settings(path: Path | None = None) -> Settings:
             port=int(tls.get("port", 8443)),
             cert_file=tls.get("cert_file", "config/tls/server.crt"),
             key_file=tls.get("key_file",  "config/tls/server.key"),
+            http2=bool(tls.get("http2", True)),
+            h2_live_max=int(tls.get("h2_live_max", 0)),
+        ),
+        ratelimit=RateLimitCfg(
+            enabled=bool(rl.get("enabled", True)),
+            rate=float(rl.get("rate", 10.0)),
+            burst=float(rl.get("burst", 40.0)),
+            routes=dict(rl.get("routes", {})),
+            max_keys=int(rl.get("max_keys", 10_000)),
+            idle_ttl=float(rl.get("idle_ttl", 600.0)),
+        ),
+        diagnostics=DiagnosticsCfg(
+            slow_request_ms=float(diag.get("slow_request_ms", 500.0)),
+            profile_top=int(diag.get("profile_top", 10)),
+            profile_dir=diag.get("profile_dir", "logs/profiles"),
+        ),
+        static=StaticCfg(
+            rescan_interval=float(stc.get("rescan_interval", 5.0)),
+            negative_cache=int(stc.get("negative_cache", 1024)),
+            memory_max_file=int(stc.get("memory_max_file", 262_144)),
+        ),
+        cache=CacheCfg(
+            enabled=bool(cch.get("enabled", True)),
+            max_bytes=int(cch.get("max_bytes", 16_777_216)),
+            coalesce_timeout=float(cch.get("coalesce_timeout", 5.0)),
+            prerender=bool(cch.get("prerender", True)),
+        ),
+        shared=SharedCfg(
+            enabled=bool(shr.get("enabled", False)),
+            slots=int(shr.get("slots", 16384)),
         ),
     )
     return _merge_env(settings)
\ No newline at end of file
@@ -1,11 +1,19 @@
 from __future__ import annotations
+import itertools
+import re
 import sqlite3
 from pathlib import Path
 from datetime import datetime
-from typing import Iterable
+from typing import Iterable, Iterator
+from app.timing import timed
+from app import pubsub
 
 DB_PATH = Path(__file__).resolve().parent.parent / "data" / "brasa.db"
 
+# escritas que outros processos precisam saber (cache de respostas, SSE)
+pubsub.share("eco_messages")
+pubsub.share("love_notes")
+
 def _connect() -> sqlite3.Connection:
     """Abre conexão nova por operação (bom com threads)."""
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -42,7 +50,159 @@ def init_db() -> None:
         """)
         conn.execute("CREATE INDEX IF NOT EXISTS idx_love_created ON love_notes(created_at DESC);")
 
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid         TEXT    PRIMARY KEY,
+            payload     TEXT    NOT NULL,   -- JSON
+            expires_at  INTEGER NOT NULL    -- epoch (segundos)
+        );
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_exp ON sessions(expires_at);")
+        # faxina no boot: sessões vencidas não precisam sobreviver ao restart
+        conn.execute("DELETE FROM sessions WHERE expires_at < CAST(strftime('%s','now') AS INTEGER);")
+
+        _init_fts(conn)
+
+
+# ---------- Busca textual (FTS5) ----------
+#
+# Tabelas FTS5 de "conteúdo externo": o índice guarda só os termos; o texto
+# continua nas tabelas originais (sem duplicar dados). Triggers mantêm o índice
+# em dia a cada INSERT/UPDATE/DELETE. O ranking é bm25 e o índice invertido faz
+# a busca custar ~proporcional aos resultados, não ao tamanho da tabela.
+
+SCHEMA_VERSION = 1          # PRAGMA user_version: migrações já aplicadas
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50        # OFFSET grande custa caro; ninguém lê a página 51
+_SEARCH_MAX_TERMS = 8
+_HL_OPEN, _HL_CLOSE = "\x02", "\x03"  # marcadores do snippet (escapados depois, na view)
+FTS_ENABLED = False
+
+_FTS_TABLES = (
+    # (índice, tabela, colunas indexadas)
+    ("eco_fts", "eco_messages", ("nome", "mensagem")),
+    ("love_fts", "love_notes", ("author", "message")),
+)
 
+def _init_fts(conn: sqlite3.Connection) -> None:
+    """Cria índices FTS5 + triggers e reconstrói o índice na primeira vez."""
+    global FTS_ENABLED
+    try:
+        for fts, table, cols in _FTS_TABLES:
+            c = ", ".join(cols)
+            new = ", ".join(f"new.{x}" for x in cols)
+            old = ", ".join(f"old.{x}" for x in cols)
+            # remove_diacritics: "coracao" acha "coração"
+            conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({c}, "
+                f"content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2');"
+            )
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {c}) VALUES (new.id, {new});
+            END;""")
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {c}) VALUES ('delete', old.id, {old});
+            END;""")
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {c}) VALUES ('delete', old.id, {old});
+                INSERT INTO {fts}(rowid, {c}) VALUES (new.id, {new});
+            END;""")
+    except sqlite3.OperationalError:
+        # SQLite compilado sem FTS5: o site funciona, só a busca fica desligada
+        FTS_ENABLED = False
+        return
+
+    version = conn.execute("PRAGMA user_version;").fetchone()[0]
+    if version < 1:
+        # migração: linhas que já existiam antes dos triggers entram no índice
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            for fts, _table, _cols in _FTS_TABLES:
+                conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild');")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+    FTS_ENABLED = True
+
+def fts_query(q: str) -> str:
+    """
+    Converte texto livre em expressão FTS5 segura: cada palavra vira um termo
+    entre aspas (sem operadores/colunas vindos do usuário), todas obrigatórias;
+    a última casa por prefixo ("amo" acha "amor").
+    """
+    terms = re.findall(r"\w+", q or "")[:_SEARCH_MAX_TERMS]
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+@timed("db")
+def search(q: str, page: int = 1, per_page: int = SEARCH_PAGE_SIZE) -> tuple[list[dict], bool]:
+    """
+    Busca em recados e mensagens do /eco, ordenado por relevância (bm25).
+    Retorna (resultados da página, há_próxima_página). Cada resultado traz
+    `trecho` com os termos entre _HL_OPEN/_HL_CLOSE.
+    """
+    expr = fts_query(q)
+    if not expr or not FTS_ENABLED:
+        return [], False
+    page = max(1, min(int(page), SEARCH_MAX_PAGE))
+    per_page = max(1, min(int(per_page), 100))
+    off = (page - 1) * per_page
+    # 1) só rowid + bm25 (texto pesa mais que nome/autor), cada índice cortado no
+    #    que a página pode precisar; nada de JOIN nem snippet para o resto dos matches
+    ranked = """
+        SELECT * FROM (SELECT 'eco' AS tipo, rowid AS id, rank AS score FROM eco_fts
+                        WHERE eco_fts MATCH :q AND rank MATCH 'bm25(1.0, 4.0)'
+                        ORDER BY rank, rowid DESC LIMIT :top)
+        UNION ALL
+        SELECT * FROM (SELECT 'recado' AS tipo, rowid AS id, rank AS score FROM love_fts
+                        WHERE love_fts MATCH :q AND rank MATCH 'bm25(1.0, 4.0)'
+                        ORDER BY rank, rowid DESC LIMIT :top)
+        ORDER BY score, id DESC
+        LIMIT :lim OFFSET :off
+    """
+    with _connect() as conn:
+        # uma linha a mais diz se existe próxima página sem COUNT(*)
+        hits = conn.execute(ranked, {"q": expr, "top": off + per_page + 1,
+                                     "lim": per_page + 1, "off": off}).fetchall()
+        page_hits = hits[:per_page]
+        # 2) JOIN e snippet só das linhas da página
+        found: dict[tuple[str, int], dict] = {}
+        for tipo, sql in _SEARCH_DETAIL.items():
+            ids = [h["id"] for h in page_hits if h["tipo"] == tipo]
+            if not ids:
+                continue
+            marks = ", ".join("?" * len(ids))
+            for r in conn.execute(sql.format(ids=marks), (_HL_OPEN, _HL_CLOSE, expr, *ids)):
+                found[(tipo, r["id"])] = dict(r, tipo=tipo)
+    out = []
+    for h in page_hits:
+        row = found.get((h["tipo"], h["id"]))
+        if row is not None:  # apagado entre as duas consultas
+            row["score"] = h["score"]
+            out.append(row)
+    return out, len(hits) > per_page
+
+_SEARCH_DETAIL = {
+    "eco": """
+        SELECT e.id, e.created_at, e.nome AS autor, snippet(eco_fts, 1, ?, ?, '…', 16) AS trecho
+          FROM eco_fts JOIN eco_messages e ON e.id = eco_fts.rowid
+         WHERE eco_fts MATCH ? AND eco_fts.rowid IN ({ids})""",
+    "recado": """
+        SELECT n.id, n.created_at, n.author AS autor, snippet(love_fts, 1, ?, ?, '…', 16) AS trecho
+          FROM love_fts JOIN love_notes n ON n.id = love_fts.rowid
+         WHERE love_fts MATCH ? AND love_fts.rowid IN ({ids})""",
+}
+
+
+@timed("db")
 def insert_eco(ip: str, nome: str, mensagem: str, ua: str) -> int:
     """Insere uma mensagem e retorna o id."""
     ts = datetime.utcnow().isoformat(timespec="seconds") + "Z"
@@ -56,8 +216,11 @@ def insert_eco(ip: str, nome: str, mensagem: str, ua: str) -> int:
             "INSERT INTO eco_messages (created_at, ip, nome, mensagem, ua) VALUES (?, ?, ?, ?, ?)",
             (ts, ip, nome, mensagem, ua),
         )
-        return cur.lastrowid
+        eco_id = cur.lastrowid
+    pubsub.publish("eco_messages", {"id": eco_id, "created_at": ts, "nome": nome})
+    return eco_id
 
+@timed("db")
 def fetch_recent(limit: int = 20) -> list[dict]:
     """Busca mensagens mais recentes, como dicts."""
     limit = max(1, min(int(limit or 20), 200))
@@ -68,6 +231,7 @@ def fetch_recent(limit: int = 20) -> list[dict]:
         )
         return [dict(row) for row in cur.fetchall()]
     
+@timed("db")
 def insert_love_note(author: str, message: str) -> int:
     from datetime import datetime
     ts = datetime.utcnow().isoformat(timespec="seconds") + "Z"
@@ -80,8 +244,12 @@ def insert_love_note(author: str, message: str) -> int:
             "INSERT INTO love_notes (created_at, author, message) VALUES (?, ?, ?)",
             (ts, author, message)
         )
-        return cur.lastrowid
+        note_id = cur.lastrowid
+    # autocommit: aqui o recado já está gravado; avisa quem estiver ouvindo (SSE)
+    pubsub.publish("love_notes", {"id": note_id, "created_at": ts, "author": author, "message": message})
+    return note_id
 
+@timed("db")
 def fetch_love_notes(limit: int = 20) -> list[dict]:
     limit = max(1, min(int(limit or 20), 200))
     with _connect() as conn:
@@ -89,4 +257,112 @@ def fetch_love_notes(limit: int = 20) -> list[dict]:
             "SELECT id, created_at, author, message FROM love_notes ORDER BY id DESC LIMIT ?",
             (limit,)
         )
-        return [dict(r) for r in cur.fetchall()]
\ No newline at end of file
+        return [dict(r) for r in cur.fetchall()]
+
+@timed("db")
+def fetch_love_notes_since(after_id: int, limit: int = 50) -> list[dict]:
+    """Recados com id > after_id, do mais antigo ao mais novo (reconexão SSE com Last-Event-ID)."""
+    limit = max(1, min(int(limit or 50), 200))
+    with _connect() as conn:
+        cur = conn.execute(
+            "SELECT id, created_at, author, message FROM love_notes WHERE id > ? ORDER BY id LIMIT ?",
+            (int(after_id), limit)
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+@timed("db")
+def latest_love_note_id() -> int:
+    with _connect() as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM love_notes").fetchone()[0]
+
+def warm_up() -> None:
+    """Roda uma vez as leituras quentes (boot): arquivo, WAL e índices já no cache do SO."""
+    fetch_recent()
+    fetch_love_notes()
+    latest_love_note_id()
+
+@timed("db")
+def save_session(sid: str, payload: str, expires_at: int) -> None:
+    """Grava (ou substitui) uma sessão do lado do servidor."""
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (sid, payload, expires_at) VALUES (?, ?, ?)",
+            (sid, payload, int(expires_at)),
+        )
+
+@timed("db")
+def load_session(sid: str) -> tuple[str, int] | None:
+    """Retorna (payload_json, expires_at) ou None se não existir."""
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT payload, expires_at FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+        return (row["payload"], row["expires_at"]) if row else None
+
+@timed("db")
+def delete_session(sid: str) -> None:
+    with _connect() as conn:
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+# ---------- Exportação / importação em massa ----------
+#
+# Tabelas inteiras em memória constante: a leitura anda num cursor (fetchmany)
+# e a escrita vai em lotes com executemany, um lote por transação.
+
+EXPORT_TABLES = {
+    "eco_messages": ("id", "created_at", "ip", "nome", "mensagem", "ua"),
+    "love_notes": ("id", "created_at", "author", "message"),
+}
+EXPORT_BATCH = 500          # linhas por fetchmany
+IMPORT_BATCH = 5000         # linhas por transação
+
+def iter_table(table: str, batch: int = EXPORT_BATCH) -> Iterator[list[tuple]]:
+    """
+    Lotes de linhas (tuplas na ordem de EXPORT_TABLES[table]) em ordem de id.
+    É um SELECT só: com WAL, a foto é consistente e escritas seguem em paralelo.
+    A conexão abre no primeiro next() — na thread que consome o gerador.
+    """
+    cols = EXPORT_TABLES[table]
+    conn = _connect()
+    try:
+        conn.row_factory = None
+        cur = conn.execute(f"SELECT {', '.join(cols)} FROM {table} ORDER BY id")
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def import_rows(table: str, rows: Iterable[tuple], batch: int = IMPORT_BATCH) -> int:
+    """
+    Insere tuplas (ordem de EXPORT_TABLES[table]; id None = id novo) com
+    executemany, `batch` linhas por transação. id que já existe é ignorado:
+    reimportar o mesmo arquivo não duplica. Retorna quantas linhas entraram.
+    """
+    cols = EXPORT_TABLES[table]
+    sql = f"INSERT OR IGNORE INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+    it = iter(rows)
+    inserted = 0
+    conn = _connect()
+    try:
+        while True:
+            chunk = list(itertools.islice(it, batch))
+            if not chunk:
+                break
+            # IMMEDIATE: pega a trava de escrita já; requests que gravam esperam o lote (busy timeout)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted += conn.executemany(sql, chunk).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.close()
+    if inserted:
+        # None = "mudou em massa, releia" (cache de respostas, SSE)
+        pubsub.publish(table, None)
+    return inserted
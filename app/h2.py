@@ -0,0 +1,908 @@
+"""
+HTTP/2 sobre TLS (negociado por ALPN "h2"), só com a stdlib.
+
+O que tem aqui:
+- framing (RFC 9113): DATA, HEADERS/CONTINUATION, SETTINGS, PING, WINDOW_UPDATE,
+  RST_STREAM, GOAWAY, PRIORITY (ignorado);
+- HPACK (RFC 7541): decodificador completo (tabela dinâmica + Huffman) e um
+  codificador simples (tabela estática + literais sem indexação, sem Huffman);
+- multiplexação: vários streams na mesma conexão; cada request completo vai
+  para o `handle` (to_request/dispatch do servidor) e as respostas saem
+  intercaladas em DATA frames, em rodízio entre os streams;
+- controle de fluxo nos dois sentidos (janela da conexão e de cada stream).
+
+Uma conexão h2 ocupa um worker enquanto estiver aberta (inclusive ociosa até
+IDLE_TIMEOUT): é a thread que lê e escreve frames. Com `submit` (o servidor
+passa o pool de streams), cada request completo roda num worker DESSE outro
+pool, até MAX_INFLIGHT por conexão ao mesmo tempo: um handler lento não segura
+os outros streams da conexão. A resposta volta para a thread da conexão (fila +
+socketpair para acordá-la), que é a única a mexer no estado do protocolo. Sem
+`submit`, os handlers rodam na própria thread, um por vez.
+
+Um stream sem fim (SSE) prende o worker da conexão até a aba fechar, então no
+máximo LIVE_CONN_LIMIT conexões por processo podem ter um; acima disso o SSE
+recebe só "retry:" e termina — o EventSource reconecta depois (com
+Last-Event-ID) sem segurar worker nenhum enquanto espera.
+
+Corpo iterável que devolve None significa "nada por enquanto" (ex.: SSE): o
+stream fica aberto e é bombeado de novo no próximo frame ou a cada _POLL_LIVE s.
+Streams text/event-stream não têm fim natural; no encerramento são fechados.
+"""
+import collections
+import select
+import socket
+import struct
+import threading
+import time
+from typing import Callable
+
+from app import metrics
+from app.responses import Response, SERVER_NAME, http_date
+
+PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+# Tipos de frame
+DATA, HEADERS, PRIORITY, RST_STREAM, SETTINGS, PUSH_PROMISE, PING, GOAWAY, WINDOW_UPDATE, CONTINUATION = range(10)
+
+# Flags
+FLAG_END_STREAM = 0x1
+FLAG_ACK = 0x1
+FLAG_END_HEADERS = 0x4
+FLAG_PADDED = 0x8
+FLAG_PRIORITY = 0x20
+
+# SETTINGS
+SETTINGS_HEADER_TABLE_SIZE = 0x1
+SETTINGS_ENABLE_PUSH = 0x2
+SETTINGS_MAX_CONCURRENT_STREAMS = 0x3
+SETTINGS_INITIAL_WINDOW_SIZE = 0x4
+SETTINGS_MAX_FRAME_SIZE = 0x5
+SETTINGS_MAX_HEADER_LIST_SIZE = 0x6
+
+# Códigos de erro
+NO_ERROR = 0x0
+PROTOCOL_ERROR = 0x1
+INTERNAL_ERROR = 0x2
+FLOW_CONTROL_ERROR = 0x3
+STREAM_CLOSED = 0x5
+FRAME_SIZE_ERROR = 0x6
+REFUSED_STREAM = 0x7
+CANCEL = 0x8
+COMPRESSION_ERROR = 0x9
+ENHANCE_YOUR_CALM = 0xb
+
+DEFAULT_WINDOW = 65_535
+MAX_WINDOW = 2**31 - 1
+MAX_FRAME = 16_384          # o que aceitamos receber (padrão do protocolo)
+MAX_STREAMS = 100           # streams simultâneos por conexão
+RECV_WINDOW = 1024 * 1024   # janela que anunciamos (corpo inteiro cabe sem esperar)
+IDLE_TIMEOUT = 10.0         # conexão sem streams e sem frames por isso -> GOAWAY
+_POLL = 1.0                 # recv acorda a cada _POLL s para checar ociosidade/encerramento
+_POLL_LIVE = 0.2            # ...ou a cada _POLL_LIVE s se há corpo iterável esperando dados
+LIVE_CONN_LIMIT = 8         # conexões com stream sem fim (SSE) por processo (o servidor ajusta)
+SHED_RETRY_MS = 15_000      # "retry:" mandado ao SSE recusado por LIVE_CONN_LIMIT
+MAX_INFLIGHT = 8            # handlers da mesma conexão rodando ao mesmo tempo no pool de streams
+
+# Headers hop-by-hop não existem em HTTP/2
+_HOP_BY_HOP = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"}
+
+_live_lock = threading.Lock()
+_live_conns = 0             # conexões deste processo segurando um worker por causa de SSE
+metrics.gauge_fn("h2_live_conns", lambda: _live_conns)
+
+class H2Error(Exception):
+    """Erro de conexão: manda GOAWAY com `code` e fecha."""
+    def __init__(self, code: int, msg: str):
+        super().__init__(msg)
+        self.code = code
+
+class HPACKError(H2Error):
+    def __init__(self, msg: str):
+        super().__init__(COMPRESSION_ERROR, msg)
+
+class HeaderListTooLarge(HPACKError):
+    """Lista decodificada passou do limite; o bloco foi lido até o fim (tabela dinâmica em dia)."""
+
+# ---------- HPACK ----------
+
+_STATIC_TABLE = [
+    (":authority", ""), (":method", "GET"), (":method", "POST"), (":path", "/"),
+    (":path", "/index.html"), (":scheme", "http"), (":scheme", "https"), (":status", "200"),
+    (":status", "204"), (":status", "206"), (":status", "304"), (":status", "400"),
+    (":status", "404"), (":status", "500"), ("accept-charset", ""), ("accept-encoding", "gzip, deflate"),
+    ("accept-language", ""), ("accept-ranges", ""), ("accept", ""), ("access-control-allow-origin", ""),
+    ("age", ""), ("allow", ""), ("authorization", ""), ("cache-control", ""),
+    ("content-disposition", ""), ("content-encoding", ""), ("content-language", ""), ("content-length", ""),
+    ("content-location", ""), ("content-range", ""), ("content-type", ""), ("cookie", ""),
+    ("date", ""), ("etag", ""), ("expect", ""), ("expires", ""),
+    ("from", ""), ("host", ""), ("if-match", ""), ("if-modified-since", ""),
+    ("if-none-match", ""), ("if-range", ""), ("if-unmodified-since", ""), ("last-modified", ""),
+    ("link", ""), ("location", ""), ("max-forwards", ""), ("proxy-authenticate", ""),
+    ("proxy-authorization", ""), ("range", ""), ("referer", ""), ("refresh", ""),
+    ("retry-after", ""), ("server", ""), ("set-cookie", ""), ("strict-transport-security", ""),
+    ("transfer-encoding", ""), ("user-agent", ""), ("vary", ""), ("via", ""),
+    ("www-authenticate", ""),
+]
+_STATIC_EXACT = {entry: i for i, entry in enumerate(_STATIC_TABLE, 1)}
+_STATIC_NAME: dict[str, int] = {}
+for _i, (_n, _v) in enumerate(_STATIC_TABLE, 1):
+    _STATIC_NAME.setdefault(_n, _i)
+
+# O código de Huffman do HPACK (RFC 7541, Apêndice B) é canônico: basta o
+# comprimento em bits de cada símbolo (0..255 + EOS=256) para reconstruí-lo.
+_HUFFMAN_LENGTHS = (
+    13, 23, 28, 28, 28, 28, 28, 28, 28, 24, 30, 28, 28, 30, 28, 28,
+    28, 28, 28, 28, 28, 28, 30, 28, 28, 28, 28, 28, 28, 28, 28, 28,
+    6, 10, 10, 12, 13, 6, 8, 11, 10, 10, 8, 11, 8, 6, 6, 6,
+    5, 5, 5, 6, 6, 6, 6, 6, 6, 6, 7, 8, 15, 6, 12, 10,
+    13, 6, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7,
+    7, 7, 7, 7, 7, 7, 7, 7, 8, 7, 8, 13, 19, 13, 14, 6,
+    15, 5, 6, 5, 6, 5, 6, 6, 6, 5, 7, 7, 6, 6, 6, 5,
+    6, 7, 6, 5, 5, 6, 7, 7, 7, 7, 7, 15, 11, 14, 13, 28,
+    20, 22, 20, 20, 22, 22, 22, 23, 22, 23, 23, 23, 23, 23, 24, 23,
+    24, 24, 22, 23, 24, 23, 23, 23, 23, 21, 22, 23, 22, 23, 23, 24,
+    22, 21, 20, 22, 22, 23, 23, 21, 23, 22, 22, 24, 21, 22, 23, 23,
+    21, 21, 22, 21, 23, 22, 23, 23, 20, 22, 22, 22, 23, 22, 22, 23,
+    26, 26, 20, 19, 22, 23, 22, 25, 26, 26, 26, 27, 27, 26, 24, 25,
+    19, 21, 26, 27, 27, 26, 27, 24, 21, 21, 26, 26, 28, 27, 27, 27,
+    20, 24, 20, 21, 22, 21, 21, 23, 22, 22, 25, 25, 24, 24, 26, 23,
+    26, 27, 26, 26, 27, 27, 27, 27, 27, 28, 27, 27, 27, 27, 27, 26,
+    30,
+)
+
+def _build_huffman_decoder() -> dict[tuple[int, int], int]:
+    table, code, prev = {}, 0, None
+    for sym in sorted(range(257), key=lambda s: (_HUFFMAN_LENGTHS[s], s)):
+        n = _HUFFMAN_LENGTHS[sym]
+        if prev is not None:
+            code = (code + 1) << (n - prev)
+        prev = n
+        table[(n, code)] = sym
+    return table
+
+_HUFFMAN_DECODE = _build_huffman_decoder()
+
+def huffman_decode(data: bytes) -> bytes:
+    out = bytearray()
+    code = nbits = 0
+    for byte in data:
+        for shift in range(7, -1, -1):
+            code = (code << 1) | ((byte >> shift) & 1)
+            nbits += 1
+            sym = _HUFFMAN_DECODE.get((nbits, code))
+            if sym is not None:
+                if sym == 256:
+                    raise HPACKError("EOS dentro de string Huffman")
+                out.append(sym)
+                code = nbits = 0
+            elif nbits > 30:
+                raise HPACKError("código Huffman inválido")
+    # sobra: no máximo 7 bits, todos 1 (prefixo do EOS)
+    if nbits > 7 or code != (1 << nbits) - 1:
+        raise HPACKError("padding Huffman inválido")
+    return bytes(out)
+
+def _decode_int(data: bytes, pos: int, prefix: int) -> tuple[int, int]:
+    if pos >= len(data):
+        raise HPACKError("bloco truncado")
+    limit = (1 << prefix) - 1
+    value = data[pos] & limit
+    pos += 1
+    if value < limit:
+        return value, pos
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise HPACKError("inteiro truncado")
+        b = data[pos]
+        pos += 1
+        value += (b & 0x7F) << shift
+        shift += 7
+        if not b & 0x80:
+            return value, pos
+        if shift > 28:
+            raise HPACKError("inteiro grande demais")
+
+def _encode_int(value: int, prefix: int, flags: int = 0) -> bytes:
+    limit = (1 << prefix) - 1
+    if value < limit:
+        return bytes([flags | value])
+    out = bytearray([flags | limit])
+    value -= limit
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _encode_str(s: str) -> bytes:
+    raw = s.encode("iso-8859-1", errors="replace")
+    return _encode_int(len(raw), 7) + raw
+
+def hpack_encode(headers: list[tuple[str, str]]) -> bytes:
+    """Sem estado: índice estático quando dá, senão literal sem indexação."""
+    out = bytearray()
+    for name, value in headers:
+        idx = _STATIC_EXACT.get((name, value))
+        if idx:
+            out += _encode_int(idx, 7, 0x80)
+            continue
+        idx = _STATIC_NAME.get(name, 0)
+        out += _encode_int(idx, 4, 0x00)
+        if not idx:
+            out += _encode_str(name)
+        out += _encode_str(value)
+    return bytes(out)
+
+class HPACKDecoder:
+    """Estado de decodificação de UMA conexão (tabela dinâmica compartilhada entre streams)."""
+    def __init__(self, max_size: int = 4096):
+        self.max_allowed = max_size   # o que anunciamos em SETTINGS_HEADER_TABLE_SIZE
+        self.max_size = max_size
+        self.size = 0
+        self.dynamic: collections.deque[tuple[str, str]] = collections.deque()
+
+    def _get(self, idx: int) -> tuple[str, str]:
+        if idx <= 0:
+            raise HPACKError("índice 0")
+        if idx <= len(_STATIC_TABLE):
+            return _STATIC_TABLE[idx - 1]
+        idx -= len(_STATIC_TABLE) + 1
+        if idx >= len(self.dynamic):
+            raise HPACKError("índice fora da tabela")
+        return self.dynamic[idx]
+
+    def _add(self, name: str, value: str) -> None:
+        entry_size = len(name) + len(value) + 32
+        self.dynamic.appendleft((name, value))
+        self.size += entry_size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.size > self.max_size and self.dynamic:
+            n, v = self.dynamic.pop()
+            self.size -= len(n) + len(v) + 32
+
+    def _read_str(self, data: bytes, pos: int) -> tuple[str, int]:
+        if pos >= len(data):
+            raise HPACKError("string truncada")
+        huff = data[pos] & 0x80
+        length, pos = _decode_int(data, pos, 7)
+        if pos + length > len(data):
+            raise HPACKError("string truncada")
+        raw = data[pos:pos + length]
+        if huff:
+            raw = huffman_decode(raw)
+        return raw.decode("iso-8859-1"), pos + length
+
+    def decode(self, data: bytes, max_list: int = 0) -> list[tuple[str, str]]:
+        """
+        Decodifica um bloco inteiro. Com `max_list`, cada campo conta nome+valor+32
+        (SETTINGS_MAX_HEADER_LIST_SIZE): um bloco pequeno de referências a uma
+        entrada grande da tabela não vira megabytes. Passou do limite: o resto do
+        bloco ainda é lido (a tabela precisa continuar igual à do cliente), mas
+        sem guardar campos, e no fim sobe HeaderListTooLarge.
+        """
+        headers: list[tuple[str, str]] = []
+        total = 0
+        over = False
+        pos = 0
+        while pos < len(data):
+            b = data[pos]
+            field = None
+            if b & 0x80:                       # indexado
+                idx, pos = _decode_int(data, pos, 7)
+                field = self._get(idx)
+            elif b & 0x40:                     # literal com indexação incremental
+                idx, pos = _decode_int(data, pos, 6)
+                name = self._get(idx)[0] if idx else None
+                if name is None:
+                    name, pos = self._read_str(data, pos)
+                value, pos = self._read_str(data, pos)
+                self._add(name, value)
+                field = (name, value)
+            elif b & 0x20:                     # atualização do tamanho da tabela
+                size, pos = _decode_int(data, pos, 5)
+                if size > self.max_allowed:
+                    raise HPACKError("tabela maior que o anunciado")
+                self.max_size = size
+                self._evict()
+            else:                              # literal sem indexação / nunca indexado
+                idx, pos = _decode_int(data, pos, 4)
+                name = self._get(idx)[0] if idx else None
+                if name is None:
+                    name, pos = self._read_str(data, pos)
+                value, pos = self._read_str(data, pos)
+                field = (name, value)
+            if field is None or over:
+                continue
+            total += len(field[0]) + len(field[1]) + 32
+            if max_list and total > max_list:
+                over = True
+                headers = []
+                continue
+            headers.append(field)
+        if over:
+            raise HeaderListTooLarge("lista de headers grande demais")
+        return headers
+
+# ---------- Conexão ----------
+
+class _Stream:
+    __slots__ = ("sid", "headers", "body", "send_window", "remote_closed", "out", "out_iter", "sending", "endless")
+
+    def __init__(self, sid: int, send_window: int):
+        self.sid = sid
+        self.headers: list[tuple[str, str]] = []
+        self.body = bytearray()
+        self.send_window = send_window
+        self.remote_closed = False
+        self.out: collections.deque[memoryview] = collections.deque()
+        self.out_iter = None
+        self.sending = False
+        self.endless = False
+
+    def pull(self, want: int) -> None:
+        """Garante até `want` pedaços na fila (puxando do iterável, se houver)."""
+        while len(self.out) < want and self.out_iter is not None:
+            try:
+                chunk = next(self.out_iter)
+            except StopIteration:
+                self.out_iter = None
+                break
+            if chunk is None:
+                break  # iterável sem dados agora; tenta de novo depois
+            if chunk:
+                self.out.append(memoryview(chunk))
+
+Handler = Callable[[str, str, dict, bytes], Response]
+# submit(run, expire) -> False se o pool recusou; expire() roda no lugar de run() se esperou demais
+Submit = Callable[[Callable[[], None], Callable[[], None]], bool]
+
+_BUSY = b"<!doctype html><meta charset='utf-8'><h1>503</h1><p>Servidor ocupado, tente de novo.</p>"
+
+class H2Connection:
+    def __init__(self, conn: socket.socket, handle: Handler, *, max_body: int,
+                 max_header: int, stop: threading.Event | None = None, submit: Submit | None = None):
+        self.conn = conn
+        self.handle = handle
+        self.submit = submit
+        self.max_body = max_body
+        self.max_header = max_header
+        self.stop = stop
+        self.decoder = HPACKDecoder()
+        self.streams: dict[int, _Stream] = {}
+        self.last_sid = 0
+        self.send_window = DEFAULT_WINDOW
+        self.peer_initial_window = DEFAULT_WINDOW
+        self.peer_max_frame = MAX_FRAME
+        self.recv_window = DEFAULT_WINDOW
+        self.going_away = False
+        self._cont: tuple[int, int, bytearray] | None = None   # HEADERS aguardando CONTINUATION
+        self._wbuf = bytearray()    # frames prontos; o payload é copiado uma vez só, para cá
+        self._rbuf = bytearray()
+        self._live = False          # conta em _live_conns
+        # streams no pool: aguardando vaga, rodando (contagem) e respostas prontas
+        self._queued: collections.deque[tuple[_Stream, tuple, bool]] = collections.deque()
+        self._inflight = 0
+        self._done: collections.deque[tuple[_Stream, Response, bool]] = collections.deque()
+        self._done_lock = threading.Lock()
+        self._closed = False
+        self._wake_r = self._wake_w = None
+        if submit is not None:
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+
+    # --- E/S ---
+
+    def _recv_exact(self, n: int) -> bytes:
+        while len(self._rbuf) < n:
+            self._wait_readable()
+            chunk = self.conn.recv(max(n - len(self._rbuf), 16_384))
+            if not chunk:
+                raise ConnectionError("peer fechou")
+            self._rbuf += chunk
+        out = bytes(self._rbuf[:n])
+        del self._rbuf[:n]
+        return out
+
+    def _wait_readable(self) -> None:
+        """
+        Espera o socket ter dados (até o timeout dele), entregando no caminho as
+        respostas que o pool de streams terminou. Sem pool: o recv espera sozinho.
+        """
+        if self._wake_r is None:
+            return
+        timeout = self.conn.gettimeout()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self._done:
+                self._deliver()
+            # TLS: bytes já decifrados no buffer do SSL não aparecem para o select
+            pending = getattr(self.conn, "pending", None)
+            if pending is not None and pending():
+                return
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                raise socket.timeout("timed out")
+            ready, _, _ = select.select([self.conn, self._wake_r], [], [], left)
+            if self._wake_r in ready:
+                try:
+                    while self._wake_r.recv(4096):
+                        pass
+                except OSError:
+                    pass
+            if self.conn in ready:
+                return
+
+    def _frame(self, ftype: int, flags: int, sid: int, payload=b"") -> None:
+        self._wbuf += struct.pack(">I", len(payload))[1:] + struct.pack(">BBI", ftype, flags, sid & MAX_WINDOW)
+        if payload:
+            self._wbuf += payload
+
+    def _write(self) -> None:
+        if self._wbuf:
+            self.conn.sendall(self._wbuf)
+            self._wbuf.clear()
+
+    # --- loop principal ---
+
+    def serve(self) -> None:
+        self.conn.settimeout(_POLL)
+        if self._read_with_idle(len(PREFACE)) != PREFACE:
+            return
+        self._frame(SETTINGS, 0, 0, struct.pack(
+            ">HIHIHIHI",
+            SETTINGS_MAX_CONCURRENT_STREAMS, MAX_STREAMS,
+            SETTINGS_INITIAL_WINDOW_SIZE, RECV_WINDOW,
+            SETTINGS_MAX_FRAME_SIZE, MAX_FRAME,
+            SETTINGS_MAX_HEADER_LIST_SIZE, self.max_header,
+        ))
+        # janela da conexão: 65535 -> RECV_WINDOW
+        self._frame(WINDOW_UPDATE, 0, 0, struct.pack(">I", RECV_WINDOW - DEFAULT_WINDOW))
+        self.recv_window = RECV_WINDOW
+        self._write()
+        first = True
+        try:
+            while True:
+                if self.going_away and not self.streams:
+                    break
+                head = self._read_with_idle(9)
+                if head is None:
+                    break
+                length = int.from_bytes(head[:3], "big")
+                ftype, flags, sid = head[3], head[4], int.from_bytes(head[5:9], "big") & MAX_WINDOW
+                if length > MAX_FRAME:
+                    raise H2Error(FRAME_SIZE_ERROR, "frame grande demais")
+                payload = self._read_with_idle(length) if length else b""
+                if payload is None:
+                    break
+                if first and ftype != SETTINGS:
+                    raise H2Error(PROTOCOL_ERROR, "primeiro frame precisa ser SETTINGS")
+                first = False
+                self._on_frame(ftype, flags, sid, payload)
+                self._flush()
+                self._write()
+        except H2Error as e:
+            self._goaway(e.code)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            # libera iteráveis pendentes (assinaturas SSE, geradores com recursos abertos)
+            for st in self.streams.values():
+                if st.out_iter is not None:
+                    _close_iter(st.out_iter)
+            self.streams.clear()
+            self._release_live()
+            # handlers ainda no pool: a resposta deles é descartada ao chegar (_complete)
+            with self._done_lock:
+                self._closed = True
+                done, self._done = list(self._done), collections.deque()
+            for _st, resp, _head in done:
+                _close_iter(resp.body)
+            if self._wake_r is not None:
+                self._wake_r.close()
+                self._wake_w.close()
+
+    def _read_with_idle(self, n: int) -> bytes | None:
+        """Lê n bytes; None se ficou ocioso (sem streams) por IDLE_TIMEOUT ou se o servidor está parando."""
+        idle_since = time.monotonic()
+        while True:
+            live = any(st.sending and st.out_iter is not None for st in self.streams.values())
+            self.conn.settimeout(_POLL_LIVE if live else _POLL)
+            try:
+                return self._recv_exact(n)
+            except socket.timeout:
+                if self.stop is not None and self.stop.is_set() and not self.going_away:
+                    self.going_away = True
+                    self._goaway(NO_ERROR)
+                    for st in self.streams.values():
+                        if st.endless and st.out_iter is not None:
+                            _close_iter(st.out_iter)
+                if live:
+                    self._flush()
+                    self._write()
+                if self.going_away and not self.streams:
+                    return None
+                if not self.streams and time.monotonic() - idle_since >= IDLE_TIMEOUT:
+                    self._goaway(NO_ERROR)
+                    return None
+
+    # --- teto de conexões com SSE ---
+
+    def _hold_live(self) -> bool:
+        """Conta esta conexão entre as que seguram worker com SSE; False se o teto já foi atingido."""
+        global _live_conns
+        if self._live:
+            return True
+        with _live_lock:
+            if _live_conns >= LIVE_CONN_LIMIT:
+                return False
+            _live_conns += 1
+        self._live = True
+        return True
+
+    def _release_live(self) -> None:
+        global _live_conns
+        if not self._live or any(st.endless for st in self.streams.values()):
+            return
+        self._live = False
+        with _live_lock:
+            _live_conns -= 1
+
+    def _goaway(self, code: int) -> None:
+        self._frame(GOAWAY, 0, 0, struct.pack(">II", self.last_sid, code))
+        try:
+            self._write()
+        except OSError:
+            pass
+
+    def _rst(self, sid: int, code: int) -> None:
+        self._frame(RST_STREAM, 0, sid, struct.pack(">I", code))
+        st = self.streams.pop(sid, None)
+        if st is not None and st.out_iter is not None:
+            _close_iter(st.out_iter)
+
+    # --- frames recebidos ---
+
+    def _on_frame(self, ftype: int, flags: int, sid: int, payload: bytes) -> None:
+        if self._cont is not None and ftype != CONTINUATION:
+            raise H2Error(PROTOCOL_ERROR, "esperava CONTINUATION")
+        if ftype == DATA:
+            self._on_data(flags, sid, payload)
+        elif ftype == HEADERS:
+            self._on_headers(flags, sid, payload)
+        elif ftype == CONTINUATION:
+            if self._cont is None or self._cont[0] != sid:
+                raise H2Error(PROTOCOL_ERROR, "CONTINUATION inesperado")
+            self._cont[2].extend(payload)
+            if len(self._cont[2]) > self.max_header:
+                raise H2Error(PROTOCOL_ERROR, "headers grandes demais")
+            if flags & FLAG_END_HEADERS:
+                csid, cflags, block = self._cont
+                self._cont = None
+                self._on_header_block(csid, cflags, bytes(block))
+        elif ftype == SETTINGS:
+            self._on_settings(flags, sid, payload)
+        elif ftype == PING:
+            if sid or len(payload) != 8:
+                raise H2Error(PROTOCOL_ERROR, "PING inválido")
+            if not flags & FLAG_ACK:
+                self._frame(PING, FLAG_ACK, 0, payload)
+        elif ftype == WINDOW_UPDATE:
+            self._on_window_update(sid, payload)
+        elif ftype == RST_STREAM:
+            st = self.streams.pop(sid, None)
+            if st is not None and st.out_iter is not None:
+                _close_iter(st.out_iter)
+        elif ftype == GOAWAY:
+            self.going_away = True
+        elif ftype == PUSH_PROMISE:
+            raise H2Error(PROTOCOL_ERROR, "cliente não envia PUSH_PROMISE")
+        # PRIORITY e tipos desconhecidos: ignorados
+
+    def _on_settings(self, flags: int, sid: int, payload: bytes) -> None:
+        if sid:
+            raise H2Error(PROTOCOL_ERROR, "SETTINGS em stream")
+        if flags & FLAG_ACK:
+            return
+        if len(payload) % 6:
+            raise H2Error(FRAME_SIZE_ERROR, "SETTINGS malformado")
+        for off in range(0, len(payload), 6):
+            key, value = struct.unpack_from(">HI", payload, off)
+            if key == SETTINGS_INITIAL_WINDOW_SIZE:
+                if value > MAX_WINDOW:
+                    raise H2Error(FLOW_CONTROL_ERROR, "janela inicial grande demais")
+                delta = value - self.peer_initial_window
+                self.peer_initial_window = value
+                for st in self.streams.values():
+                    st.send_window += delta
+            elif key == SETTINGS_MAX_FRAME_SIZE:
+                if not (MAX_FRAME <= value <= 16_777_215):
+                    raise H2Error(PROTOCOL_ERROR, "MAX_FRAME_SIZE inválido")
+                self.peer_max_frame = value
+            # HEADER_TABLE_SIZE: nosso codificador não usa tabela dinâmica
+        self._frame(SETTINGS, FLAG_ACK, 0)
+
+    def _on_window_update(self, sid: int, payload: bytes) -> None:
+        if len(payload) != 4:
+            raise H2Error(FRAME_SIZE_ERROR, "WINDOW_UPDATE malformado")
+        inc = int.from_bytes(payload, "big") & MAX_WINDOW
+        if sid == 0:
+            if inc == 0:
+                raise H2Error(PROTOCOL_ERROR, "incremento zero")
+            self.send_window += inc
+            if self.send_window > MAX_WINDOW:
+                raise H2Error(FLOW_CONTROL_ERROR, "janela da conexão estourou")
+            return
+        st = self.streams.get(sid)
+        if st is None:
+            return
+        if inc == 0:
+            self._rst(sid, PROTOCOL_ERROR)
+            return
+        st.send_window += inc
+        if st.send_window > MAX_WINDOW:
+            self._rst(sid, FLOW_CONTROL_ERROR)
+
+    def _strip_padding(self, flags: int, payload: bytes) -> bytes:
+        if not flags & FLAG_PADDED:
+            return payload
+        if not payload or payload[0] >= len(payload):
+            raise H2Error(PROTOCOL_ERROR, "padding inválido")
+        return payload[1:len(payload) - payload[0]]
+
+    def _on_headers(self, flags: int, sid: int, payload: bytes) -> None:
+        if sid == 0 or sid % 2 == 0:
+            raise H2Error(PROTOCOL_ERROR, "stream id inválido")
+        block = self._strip_padding(flags, payload)
+        if flags & FLAG_PRIORITY:
+            block = block[5:]
+        if flags & FLAG_END_HEADERS:
+            self._on_header_block(sid, flags, block)
+        else:
+            self._cont = (sid, flags, bytearray(block))
+
+    def _on_header_block(self, sid: int, flags: int, block: bytes) -> None:
+        # decodifica SEMPRE: a tabela dinâmica é da conexão, mesmo se o stream for recusado
+        try:
+            headers = self.decoder.decode(block, self.max_header)
+        except HeaderListTooLarge:
+            metrics.inc("h2_headers_too_large")
+            headers = None
+        st = self.streams.get(sid)
+        if headers is None:
+            if st is None:
+                if sid <= self.last_sid:
+                    raise H2Error(PROTOCOL_ERROR, "stream id não crescente")
+                self.last_sid = sid
+            self._rst(sid, ENHANCE_YOUR_CALM)
+            return
+        if st is not None:
+            if st.remote_closed:
+                # cliente já fechou o lado dele: HEADERS de novo não pode rodar o handler outra vez
+                self._rst(sid, STREAM_CLOSED)
+                return
+            # trailers depois do corpo: só nos importa o END_STREAM
+            if flags & FLAG_END_STREAM:
+                self._end_remote(st)
+            return
+        if sid <= self.last_sid:
+            raise H2Error(PROTOCOL_ERROR, "stream id não crescente")
+        self.last_sid = sid
+        if self.going_away or len(self.streams) >= MAX_STREAMS:
+            self._rst(sid, REFUSED_STREAM)
+            return
+        st = self.streams[sid] = _Stream(sid, self.peer_initial_window)
+        st.headers = headers
+        if flags & FLAG_END_STREAM:
+            self._end_remote(st)
+
+    def _on_data(self, flags: int, sid: int, payload: bytes) -> None:
+        if sid == 0:
+            raise H2Error(PROTOCOL_ERROR, "DATA no stream 0")
+        n = len(payload)
+        if n > self.recv_window:
+            raise H2Error(FLOW_CONTROL_ERROR, "cliente passou da janela")
+        # devolvemos a janela da conexão na hora (o corpo já está limitado por max_body)
+        if n:
+            self._frame(WINDOW_UPDATE, 0, 0, struct.pack(">I", n))
+        st = self.streams.get(sid)
+        if st is None or st.remote_closed:
+            if sid > self.last_sid:
+                raise H2Error(PROTOCOL_ERROR, "DATA em stream ocioso")
+            return
+        data = self._strip_padding(flags, payload)
+        st.body += data
+        if len(st.body) > self.max_body:
+            self._rst(sid, CANCEL)
+            return
+        if flags & FLAG_END_STREAM:
+            self._end_remote(st)
+        elif n:
+            self._frame(WINDOW_UPDATE, 0, sid, struct.pack(">I", n))
+
+    # --- request/resposta ---
+
+    def _end_remote(self, st: _Stream) -> None:
+        st.remote_closed = True
+        method = path = authority = None
+        fields: dict[str, list[str]] = {}
+        for name, value in st.headers:
+            if name.startswith(":"):
+                if name == ":method":
+                    method = value
+                elif name == ":path":
+                    path = value
+                elif name == ":authority":
+                    authority = value
+                continue
+            if name != name.lower() or name in _HOP_BY_HOP:
+                self._rst(st.sid, PROTOCOL_ERROR)
+                return
+            fields.setdefault(name, []).append(value)
+        # repetidos juntados uma vez só (somar string a string seria quadrático)
+        headers = {name: ("; " if name == "cookie" else ", ").join(values) for name, values in fields.items()}
+        if not method or not path:
+            self._rst(st.sid, PROTOCOL_ERROR)
+            return
+        if authority and "host" not in headers:
+            headers["host"] = authority
+        req = (method, path, headers, bytes(st.body))
+        st.body = bytearray()
+        if self.submit is not None:
+            self._queued.append((st, req, method == "HEAD"))
+            self._dispatch()
+            return
+        try:
+            resp = self.handle(*req)
+        except Exception:
+            self._rst(st.sid, INTERNAL_ERROR)
+            return
+        self._start_response(st, resp, head_only=(method == "HEAD"))
+
+    # --- pool de streams ---
+
+    def _dispatch(self) -> None:
+        """Manda ao pool os requests na fila, até MAX_INFLIGHT rodando por conexão."""
+        while self._queued and self._inflight < MAX_INFLIGHT:
+            st, req, head_only = self._queued.popleft()
+            if self.streams.get(st.sid) is not st:
+                continue  # resetado enquanto esperava vaga
+
+            def run(st=st, req=req, head_only=head_only):
+                try:
+                    resp = self.handle(*req)
+                except Exception:
+                    resp = None
+                self._complete(st, resp, head_only)
+
+            def expire(st=st, head_only=head_only):
+                self._complete(st, Response(503, [_BUSY], {"Retry-After": "2"}), head_only)
+
+            if not self.submit(run, expire):
+                metrics.inc("h2_streams_refused")
+                self._rst(st.sid, REFUSED_STREAM)  # seguro repetir: o handler não rodou
+                continue
+            self._inflight += 1
+
+    def _complete(self, st: _Stream, resp: Response | None, head_only: bool) -> None:
+        """Chamado no worker do pool: entrega a resposta à thread da conexão e a acorda."""
+        with self._done_lock:
+            if not self._closed:
+                self._done.append((st, resp, head_only))
+                try:
+                    self._wake_w.send(b"\0")
+                except OSError:
+                    pass  # buffer cheio = já tem acordar pendente
+                return
+        if resp is not None:
+            _close_iter(resp.body)
+
+    def _deliver(self) -> None:
+        """Thread da conexão: respostas prontas viram HEADERS/DATA."""
+        while self._done:
+            st, resp, head_only = self._done.popleft()
+            self._inflight -= 1
+            if self.streams.get(st.sid) is not st:
+                if resp is not None:
+                    _close_iter(resp.body)  # cliente cancelou o stream (RST_STREAM)
+                continue
+            if resp is None:
+                self._rst(st.sid, INTERNAL_ERROR)
+            else:
+                self._start_response(st, resp, head_only=head_only)
+        self._dispatch()
+        self._flush()
+        self._write()
+
+    def _start_response(self, st: _Stream, resp: Response, *, head_only: bool) -> None:
+        if (resp.chunked and resp.content_type.startswith("text/event-stream")
+                and not head_only and not self._hold_live()):
+            # teto de SSE atingido: o cliente tenta de novo em SHED_RETRY_MS, sem prender este worker
+            _close_iter(resp.body)
+            metrics.inc("h2_sse_shed")
+            resp = Response(200, [f"retry: {SHED_RETRY_MS}\n\n".encode("ascii")],
+                            {"Cache-Control": "no-cache"}, content_type=resp.content_type)
+        hdrs = [(":status", str(resp.status)), ("date", http_date()), ("server", SERVER_NAME),
+                ("content-type", resp.content_type)]
+        if not resp.chunked and "Content-Length" not in resp.headers:
+            hdrs.append(("content-length", str(resp.content_length)))
+        for k, v in resp.headers.items():
+            k = k.lower()
+            if k not in _HOP_BY_HOP:
+                hdrs.append((k, str(v)))
+        block = hpack_encode(hdrs)
+        no_body = head_only or resp.status in (204, 304)
+        if not no_body:
+            if resp.chunked and not isinstance(resp.body, (list, tuple)):
+                st.out_iter = iter(resp.body)
+                st.endless = resp.content_type.startswith("text/event-stream")
+            else:
+                st.out.extend(memoryview(b) for b in resp.body if b)
+            st.pull(1)
+            no_body = not st.out and st.out_iter is None
+        flags_end = FLAG_END_STREAM if no_body else 0
+        # HEADERS + CONTINUATION se o bloco passar do frame máximo do cliente
+        first, rest = block[:self.peer_max_frame], block[self.peer_max_frame:]
+        self._frame(HEADERS, flags_end | (0 if rest else FLAG_END_HEADERS), st.sid, first)
+        while rest:
+            part, rest = rest[:self.peer_max_frame], rest[self.peer_max_frame:]
+            self._frame(CONTINUATION, 0 if rest else FLAG_END_HEADERS, st.sid, part)
+        if no_body:
+            self.streams.pop(st.sid, None)
+        else:
+            st.sending = True
+
+    def _flush(self) -> None:
+        """Distribui a janela da conexão entre os streams com dados, em rodízio."""
+        while self.send_window > 0:
+            progressed = False
+            for st in [s for s in self.streams.values() if s.sending]:
+                if self.send_window <= 0:
+                    break
+                if st.send_window <= 0:
+                    continue
+                try:
+                    st.pull(2)  # olha um pedaço à frente para saber se é o último
+                except Exception:
+                    self._rst(st.sid, INTERNAL_ERROR)
+                    continue
+                if not st.out:
+                    if st.out_iter is not None:
+                        continue  # iterável vivo mas sem dados agora
+                    self._frame(DATA, FLAG_END_STREAM, st.sid)
+                    self.streams.pop(st.sid, None)
+                    progressed = True
+                    continue
+                chunk = st.out[0]
+                n = min(len(chunk), st.send_window, self.send_window, self.peer_max_frame)
+                part = chunk[:n]
+                if n == len(chunk):
+                    st.out.popleft()
+                else:
+                    st.out[0] = chunk[n:]
+                last = not st.out and st.out_iter is None
+                self._frame(DATA, FLAG_END_STREAM if last else 0, st.sid, part)
+                st.send_window -= n
+                self.send_window -= n
+                progressed = True
+                if last:
+                    self.streams.pop(st.sid, None)
+            if not progressed:
+                break
+        self._release_live()
+
+def _close_iter(it) -> None:
+    close = getattr(it, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+def serve_h2(conn: socket.socket, handle: Handler, *, max_body: int, max_header: int,
+             stop: threading.Event | None = None, submit: Submit | None = None) -> None:
+    """Atende uma conexão TLS cujo ALPN escolheu "h2"."""
+    H2Connection(conn, handle, max_body=max_body, max_header=max_header, stop=stop, submit=submit).serve()
@@ -6,8 +6,18 @@ from app.config import PROJECT_ROOT, LoggingCfg
 
 _APP_LOG_NAME = "brasa.app"
 _ACC_LOG_NAME = "brasa.access"
+_active: LoggingCfg | None = None  # config dos handlers montados (SIGHUP sem mudança não reabre nada)
+
+def _drop_handlers(logger: logging.Logger) -> None:
+    # fecha antes de soltar: senão cada SIGHUP vaza os fds dos arquivos de log
+    for h in list(logger.handlers):
+        logger.removeHandler(h)
+        h.close()
 
 def setup_logging(cfg: LoggingCfg) -> Tuple[logging.Logger, logging.Logger]:
+    global _active
+    if cfg == _active:
+        return logging.getLogger(_APP_LOG_NAME), logging.getLogger(_ACC_LOG_NAME)
     log_dir = (PROJECT_ROOT / cfg.dir)
     log_dir.mkdir(parents=True, exist_ok=True)
 
@@ -19,7 +29,7 @@ def setup_logging(cfg: LoggingCfg) -> Tuple[logging.Logger, logging.Logger]:
     # App logger (erro/infos do servidor)
     app_logger = logging.getLogger(_APP_LOG_NAME)
     app_logger.setLevel(getattr(logging, cfg.level, logging.INFO))
-    app_logger.handlers.clear()
+    _drop_handlers(app_logger)
     fh_app = RotatingFileHandler(log_dir / cfg.app_file, maxBytes=cfg.max_bytes, backupCount=cfg.backup_count, encoding="utf-8")
     fh_app.setFormatter(fmt)
     app_logger.addHandler(fh_app)
@@ -32,10 +42,11 @@ def setup_logging(cfg: LoggingCfg) -> Tuple[logging.Logger, logging.Logger]:
     # Access logger (um por request)
     acc_logger = logging.getLogger(_ACC_LOG_NAME)
     acc_logger.setLevel(logging.INFO)  # access log fica em INFO
-    acc_logger.handlers.clear()
+    _drop_handlers(acc_logger)
     fh_acc = RotatingFileHandler(log_dir / cfg.access_file, maxBytes=cfg.max_bytes, backupCount=cfg.backup_count, encoding="utf-8")
     fh_acc.setFormatter(logging.Formatter("%(message)s"))
     acc_logger.addHandler(fh_acc)
     acc_logger.propagate = False
 
+    _active = cfg
     return app_logger, acc_logger
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Métricas simples em memória (contadores e gauges), sem dependências.
+Exposição em texto: uma linha "nome valor" por métrica (ver rota /metrics).
+
+Com o estado compartilhado ligado, os contadores viram totais de todos os
+processos: cada um soma aqui (sem syscall) e flush() empurra a diferença para a
+tabela compartilhada. Gauges continuam sendo do processo que responde.
+"""
+import threading
+from typing import Callable
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, float] = {}
+_gauge_fns: dict[str, Callable[[], float]] = {}
+_shared = None                      # shm.SharedTable dos contadores
+_pushed: dict[str, float] = {}      # quanto de cada contador local já está na tabela
+
+def inc(name: str, n: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = value
+
+def gauge_fn(name: str, fn: Callable[[], float]) -> None:
+    """Gauge calculado na leitura (ex.: profundidade atual da fila)."""
+    with _lock:
+        _gauge_fns[name] = fn
+
+def share_counters(table) -> None:
+    global _shared
+    _shared = table
+
+def flush() -> None:
+    """Soma na tabela compartilhada o que os contadores locais andaram desde o último flush."""
+    if _shared is None:
+        return
+    with _lock:
+        deltas = {k: v - _pushed.get(k, 0) for k, v in _counters.items() if v != _pushed.get(k, 0)}
+        _pushed.update((k, _counters[k]) for k in deltas)
+    for k, d in deltas.items():
+        _shared.add(k, d)
+
+def snapshot() -> dict[str, float]:
+    with _lock:
+        out = dict(_counters)
+        pushed = dict(_pushed)
+        gauges = dict(_gauges)
+        fns = list(_gauge_fns.items())
+    if _shared is not None:
+        # total compartilhado + o que este processo ainda não empurrou
+        for name, total, _ in _shared.items():
+            out[name] = total + out.get(name, 0) - pushed.get(name, 0)
+    out.update(gauges)
+    for name, fn in fns:
+        try:
+            out[name] = fn()
+        except Exception:
+            pass
+    return out
+
+def render_text() -> str:
+    snap = snapshot()
+    return "".join(f"{k} {v:g}\n" for k, v in sorted(snap.items()))
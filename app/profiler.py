@@ -0,0 +1,88 @@
+"""
+Profiler sob demanda: cProfile nos requests, guardando só os N mais lentos.
+
+Desligado (padrão), o custo é um `if` por request. Liga/desliga por SIGUSR1 ou
+pela rota admin /admin/profile. Ao desligar (ou em ?acao=dump) os N perfis vão
+para PROFILE_DIR como arquivos .pstats (abrir com `python -m pstats arquivo`).
+"""
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from app.config import PROJECT_ROOT
+
+if TYPE_CHECKING:
+    import cProfile
+
+_log = logging.getLogger("brasa.app")
+
+class Profiler:
+    def __init__(self, top_n: int = 10, out_dir: str = "logs/profiles"):
+        self.enabled = False
+        self.top_n = top_n
+        self.out_dir = PROJECT_ROOT / out_dir
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        # min-heap por duração: o topo é o "menos lento" dos guardados
+        self._slowest: list[tuple[float, int, str, cProfile.Profile]] = []
+
+    def start(self) -> "cProfile.Profile | None":
+        if not self.enabled:
+            return None
+        import cProfile  # só com o profiler ligado (import adiado: boot mais rápido)
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            return None  # outro profiler já ativo nesta thread/interpretador
+        return prof
+
+    def stop(self, prof: "cProfile.Profile | None", duration_ms: float, label: str) -> None:
+        if prof is None:
+            return
+        prof.disable()
+        item = (duration_ms, next(self._seq), label, prof)
+        with self._lock:
+            if len(self._slowest) < self.top_n:
+                heapq.heappush(self._slowest, item)
+            elif duration_ms > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def set_enabled(self, on: bool, top_n: int | None = None) -> list[Path]:
+        """Liga/desliga; ao desligar grava os perfis coletados e devolve os caminhos."""
+        if top_n:
+            self.top_n = top_n
+        was, self.enabled = self.enabled, on
+        _log.info("Profiler %s (top %d)", "ligado" if on else "desligado", self.top_n)
+        return self.dump() if was and not on else []
+
+    def toggle(self) -> None:
+        self.set_enabled(not self.enabled)
+
+    def dump(self) -> list[Path]:
+        with self._lock:
+            items, self._slowest = sorted(self._slowest, reverse=True), []
+        if not items:
+            return []
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        paths = []
+        for rank, (ms, _, label, prof) in enumerate(items, 1):
+            safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")[:60]
+            path = self.out_dir / f"{stamp}_{rank:02d}_{ms:.0f}ms_{safe}.pstats"
+            prof.dump_stats(path)
+            paths.append(path)
+        _log.info("Profiler: %d perfis gravados em %s", len(paths), self.out_dir)
+        return paths
+
+    def status(self) -> dict:
+        with self._lock:
+            kept = sorted(((ms, label) for ms, _, label, _ in self._slowest), reverse=True)
+        return {"enabled": self.enabled, "top_n": self.top_n, "kept": kept}
+
+PROFILER = Profiler()
@@ -0,0 +1,90 @@
+"""
+Pub/sub em processo, sem dependências.
+
+Quem publica chama, na própria thread, cada assinante do tópico. Assinantes
+precisam ser rápidos e não bloquear (no máximo enfileirar e acordar alguém):
+uma escrita no banco notifica todo mundo sem ninguém ficar consultando o SQLite.
+
+A lista de assinantes é copiada a cada (des)assinatura, então publicar não
+pega lock — o caminho quente é o publish, não o subscribe.
+
+Tópicos marcados com share() também atravessam processos (pre-fork, upgrade):
+publicar incrementa uma sequência do tópico em memória compartilhada, e
+poll_remote() (chamado periodicamente) entrega None aos assinantes locais quando
+outro processo publicou. None = "mudou algo, releia": a mensagem em si não viaja.
+"""
+import threading
+from typing import Any, Callable
+
+from app import metrics
+
+Subscriber = Callable[[Any], None]
+
+_lock = threading.Lock()
+_subs: dict[str, tuple[Subscriber, ...]] = {}
+_shared_topics: set[str] = set()
+_seq = None                         # shm.SharedTable: tópico -> sequência
+_seen: dict[str, float] = {}        # última sequência já entregue neste processo
+
+def subscribe(topic: str, fn: Subscriber) -> None:
+    with _lock:
+        _subs[topic] = _subs.get(topic, ()) + (fn,)
+
+def unsubscribe(topic: str, fn: Subscriber) -> None:
+    with _lock:
+        left = tuple(f for f in _subs.get(topic, ()) if f != fn)
+        if left:
+            _subs[topic] = left
+        else:
+            _subs.pop(topic, None)
+
+def share(topic: str) -> None:
+    """Publicações em `topic` passam a avisar os outros processos."""
+    _shared_topics.add(topic)
+
+def bridge(table) -> None:
+    """Liga a ponte entre processos (shm.SharedTable); o que já foi publicado antes não conta."""
+    global _seq
+    for topic in _shared_topics:
+        hit = table.get(topic)
+        _seen[topic] = hit[0] if hit else 0.0
+    _seq = table
+
+def poll_remote() -> int:
+    """Entrega None nos tópicos que outro processo publicou desde a última olhada. Retorna quantos."""
+    if _seq is None:
+        return 0
+    n = 0
+    for topic in list(_shared_topics):
+        hit = _seq.get(topic)
+        if hit is not None and hit[0] != _seen.get(topic, 0.0):
+            _seen[topic] = hit[0]
+            _deliver(topic, None)
+            n += 1
+    if n:
+        metrics.inc("pubsub_remote", n)
+    return n
+
+def publish(topic: str, msg: Any) -> int:
+    """Entrega `msg` a todos os assinantes de `topic`. Retorna quantos receberam."""
+    if _seq is not None and topic in _shared_topics:
+        seq = _seq.add(topic, 1)
+        # só avança se ninguém publicou no meio; senão o poll entrega o dos outros
+        if seq == _seen.get(topic, 0.0) + 1:
+            _seen[topic] = seq
+    return _deliver(topic, msg)
+
+def _deliver(topic: str, msg: Any) -> int:
+    subs = _subs.get(topic, ())
+    for fn in subs:
+        try:
+            fn(msg)
+        except Exception:
+            # assinante com defeito não pode derrubar quem publicou (ex.: um INSERT)
+            metrics.inc("pubsub_errors")
+    if subs:
+        metrics.inc("pubsub_delivered", len(subs))
+    return len(subs)
+
+def subscribers(topic: str) -> int:
+    return len(_subs.get(topic, ()))
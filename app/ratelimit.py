@@ -0,0 +1,195 @@
+"""
+Rate limiting em processo com token buckets (roteiro, item 16).
+
+Cada chave (IP, ou IP + rota quando a rota tem limite próprio) tem um balde com
+até `burst` fichas que recarrega a `rate` fichas/segundo; cada request gasta uma.
+Os baldes ficam em shards (um lock por shard, pouca disputa entre threads) e cada
+shard é um LRU limitado: chaves ociosas saem primeiro (balde ocioso já estaria
+cheio, então esquecê-lo não muda nada).
+
+Com o estado compartilhado ligado (config "shared"), baldes e contagens de
+conexões moram em memória compartilhada (shm.SharedTable): o limite vale para o
+conjunto dos processos, não para cada um.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app import metrics
+from app.config import RateLimitCfg
+
+class TokenBuckets:
+    def __init__(self, *, shards: int = 16, max_keys: int = 10_000, idle_ttl: float = 600.0):
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+        self.configure(max_keys=max_keys, idle_ttl=idle_ttl)
+
+    def configure(self, *, max_keys: int, idle_ttl: float) -> None:
+        """Novos tetos sem perder os baldes (shard acima do teto encolhe no próximo _evict)."""
+        self.idle_ttl = idle_ttl
+        self._per_shard = max(1, max_keys // len(self._shards))
+
+    def take(self, key, rate: float, burst: float) -> float:
+        """Gasta 1 ficha. Retorna 0.0 se liberado, ou segundos até haver ficha."""
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            b = buckets.get(key)
+            if b is None:
+                self._evict(buckets, now)
+                b = buckets[key] = [float(burst), now]
+            else:
+                buckets.move_to_end(key)
+                b[0] = min(burst, b[0] + (now - b[1]) * rate)
+                b[1] = now
+            if b[0] >= 1.0:
+                b[0] -= 1.0
+                return 0.0
+            return (1.0 - b[0]) / rate if rate > 0 else self.idle_ttl
+
+    def _evict(self, buckets: OrderedDict, now: float) -> None:
+        # início do OrderedDict = menos recentemente usado
+        while buckets:
+            _, oldest = next(iter(buckets.items()))
+            if now - oldest[1] < self.idle_ttl and len(buckets) < self._per_shard:
+                break
+            buckets.popitem(last=False)
+
+    def __len__(self) -> int:
+        return sum(len(b) for _, b in self._shards)
+
+class SharedBuckets:
+    """Mesma conta do TokenBuckets numa shm.SharedTable: a = fichas, b = último uso (monotonic)."""
+    def __init__(self, table, *, idle_ttl: float = 600.0):
+        self.idle_ttl = idle_ttl
+        self._table = table
+
+    def configure(self, *, max_keys: int, idle_ttl: float) -> None:
+        # max_keys não se aplica: a capacidade da tabela é fixa desde o boot
+        self.idle_ttl = idle_ttl
+
+    def take(self, key, rate: float, burst: float) -> float:
+        # CLOCK_MONOTONIC é do sistema (Linux): comparável entre processos
+        now = time.monotonic()
+        idle = self.idle_ttl
+
+        def fn(tokens, last):
+            if tokens is None:
+                tokens = float(burst)
+            else:
+                tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1.0:
+                return tokens - 1.0, now, 0.0
+            return tokens, now, (1.0 - tokens) / rate if rate > 0 else idle
+
+        k = key if isinstance(key, str) else "|".join(key)
+        return self._table.update(k, fn, idle)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._table.items())
+
+class RateLimiter:
+    """Limite padrão por IP + limites por rota ("METHOD /path") vindos do config."""
+    def __init__(self, cfg: RateLimitCfg, shared=None):
+        if shared is not None:
+            self.buckets = SharedBuckets(shared, idle_ttl=cfg.idle_ttl)
+        else:
+            self.buckets = TokenBuckets(max_keys=cfg.max_keys, idle_ttl=cfg.idle_ttl)
+        self.configure(cfg)
+        metrics.gauge_fn("ratelimit_keys", lambda: len(self.buckets))
+
+    def configure(self, cfg: RateLimitCfg) -> None:
+        """Aplica limites novos (SIGHUP) mantendo os baldes: cada um segue com as fichas
+        que tinha, só recarrega/limita pelos valores novos. Trocar o limiter encheria
+        todos os baldes de novo a cada reload."""
+        self.rate = cfg.rate
+        self.burst = cfg.burst
+        self.routes = {k: (float(v.get("rate", cfg.rate)), float(v.get("burst", cfg.burst)))
+                       for k, v in cfg.routes.items()}
+        self.buckets.configure(max_keys=cfg.max_keys, idle_ttl=cfg.idle_ttl)
+
+    def check(self, remote_addr: str, method: str, path: str) -> float:
+        """0.0 = pode seguir; > 0 = segundos para o Retry-After."""
+        route = f"{method} {path}"
+        limit = self.routes.get(route)
+        if limit is not None:
+            wait = self.buckets.take((remote_addr, route), *limit)
+        else:
+            wait = self.buckets.take(remote_addr, self.rate, self.burst)
+        if wait > 0:
+            metrics.inc("ratelimit_rejected")
+        return wait
+
+class ConnectionLimiter:
+    """
+    Teto de conexões simultâneas por IP (acquire no accept, release ao fechar).
+
+    Compartilhado: além do total por IP, cada processo anota as suas em
+    "<pid>|<ip>", na MESMA operação atômica que mexe no total (update_pair):
+    não existe instante em que um conte e o outro não. Se um processo morre
+    segurando conexões, o mestre do pre-fork chama forget_process(pid) e devolve
+    essas contagens ao total; não depende de TTL (que um IP movimentado
+    renovaria para sempre).
+    """
+    SHARED_TTL = 86400.0  # só rede de segurança: a limpeza de verdade é forget_process
+
+    def __init__(self, max_per_ip: int, shared=None):
+        self.max_per_ip = max_per_ip
+        self._open: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._shared = shared
+
+    def acquire(self, ip: str) -> bool:
+        if self._shared is not None:
+            def fn(n, b, mine, mb):
+                n = n or 0.0
+                if n >= self.max_per_ip:
+                    return n, b, mine, mb, False
+                return n + 1.0, b, (mine or 0.0) + 1.0, mb, True
+            if self._shared.update_pair(ip, f"{os.getpid()}|{ip}", fn, self.SHARED_TTL):
+                return True
+            metrics.inc("conn_cap_rejected")
+            return False
+        with self._lock:
+            n = self._open.get(ip, 0)
+            if n >= self.max_per_ip:
+                metrics.inc("conn_cap_rejected")
+                return False
+            self._open[ip] = n + 1
+            return True
+
+    def release(self, ip: str) -> None:
+        if self._shared is not None:
+            self._shared.update_pair(ip, f"{os.getpid()}|{ip}", _sub_both(1.0), self.SHARED_TTL)
+            return
+        with self._lock:
+            n = self._open.get(ip, 0) - 1
+            if n > 0:
+                self._open[ip] = n
+            else:
+                self._open.pop(ip, None)
+
+    def forget_process(self, pid: int) -> int:
+        """Processo `pid` morreu: tira do total por IP as conexões que ele segurava. Retorna quantas."""
+        if self._shared is None:
+            return 0
+        prefix = f"{pid}|"
+        freed = 0
+        for key, _n, _b in list(self._shared.items()):
+            if not key.startswith(prefix):
+                continue
+            # o dono morreu, ninguém mais mexe na anotação: apaga e desconta do total juntos
+            def fn(n, b, mine, mb):
+                mine = mine or 0.0
+                total = None if n is None or n <= mine else n - mine
+                return total, b, None, None, mine
+            freed += int(self._shared.update_pair(key[len(prefix):], key, fn, self.SHARED_TTL))
+        return freed
+
+def _sub_both(delta: float):
+    """update_pair que desconta `delta` do total e da anotação do processo (some ao chegar a zero)."""
+    def fn(n, b, mine, mb):
+        n = None if n is None or n <= delta else n - delta
+        mine = None if mine is None or mine <= delta else mine - delta
+        return n, b, mine, mb, None
+    return fn
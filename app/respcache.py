@@ -0,0 +1,179 @@
+"""
+Cache de respostas para rotas GET dinâmicas (opt-in por rota, ver add_route).
+
+Chave: caminho + query normalizada (parâmetros ordenados). Cada entrada guarda
+as DUAS versões do corpo — identidade e gzip — e a codificação é escolhida no
+hit pelo Accept-Encoding, sem renderizar nem comprimir de novo.
+
+Validade: TTL por rota e invalidação explícita por tópico do pubsub (ex.:
+insert_love_note publica "love_notes" -> some tudo que depende de recados).
+Memória: orçamento em bytes com despejo LRU.
+
+Corrida miss x escrita: cada tópico tem um contador de geração; se mudou
+enquanto o handler rodava, a resposta (possivelmente velha) não é guardada.
+"""
+import collections
+import gzip
+import threading
+import time
+from typing import Callable
+from urllib.parse import urlencode
+
+from app import metrics, pubsub
+from app.responses import Response
+
+GZIP_MIN = 512                      # mesmo limiar do render_page
+_ENTRY_OVERHEAD = 512               # estimativa de headers/objetos por entrada
+_COMPRESSIBLE = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+class _Entry:
+    __slots__ = ("plain", "gz", "expires", "size", "topics")
+
+    def __init__(self, plain: Response, gz: Response | None, expires: float, size: int, topics: tuple[str, ...]):
+        self.plain = plain
+        self.gz = gz
+        self.expires = expires
+        self.size = size
+        self.topics = topics
+
+def cache_key(path: str, query: dict) -> str:
+    """Caminho + query com chaves e valores em ordem (?b=2&a=1 == ?a=1&b=2)."""
+    if not query:
+        return path
+    pairs = sorted((k, v) for k, vs in query.items() for v in vs)
+    return path + "?" + urlencode(pairs)
+
+def _wants_gzip(accept_encoding: str | None) -> bool:
+    return bool(accept_encoding) and "gzip" in accept_encoding.lower()
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "collections.OrderedDict[str, _Entry]" = collections.OrderedDict()
+        self._by_topic: dict[str, set[str]] = {}
+        self._gen: dict[str, int] = {}
+        self._epoch = 0                 # muda a cada clear(): também invalida misses em andamento
+        self._bytes = 0
+        self.enabled = True
+        self._lock = threading.Lock()
+
+    # --- API ---
+
+    def watch(self, topic: str) -> None:
+        """Passa a invalidar por `topic` (idempotente)."""
+        with self._lock:
+            if topic in self._gen:
+                return
+            self._gen[topic] = 0
+        pubsub.subscribe(topic, lambda _msg: self.invalidate(topic))
+
+    def fetch(self, key: str, accept_encoding: str | None, ttl: float, topics: tuple[str, ...],
+              compute: Callable[[], Response]) -> Response:
+        """Hit -> resposta guardada (na codificação pedida); miss -> compute() e guarda se der."""
+        gz = _wants_gzip(accept_encoding)
+        now = time.monotonic()
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None:
+                if e.expires > now:
+                    self._entries.move_to_end(key)
+                    metrics.inc("cache_hits")
+                    return e.gz if gz and e.gz is not None else e.plain
+                self._drop(key)
+            gens = (self._epoch, *(self._gen.get(t, 0) for t in topics))
+        metrics.inc("cache_misses")
+        resp = compute()
+        if self._store(key, resp, ttl, topics, gens):
+            # o hit pode vir em gzip: caches intermediários precisam saber já no miss
+            resp.headers.setdefault("Vary", "Accept-Encoding")
+        resp.headers.setdefault("X-Cache", "MISS")
+        return resp
+
+    def invalidate(self, topic: str) -> int:
+        with self._lock:
+            self._gen[topic] = self._gen.get(topic, 0) + 1
+            keys = self._by_topic.pop(topic, set())
+            for k in keys:
+                self._drop(k)
+        if keys:
+            metrics.inc("cache_invalidated", len(keys))
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_topic.clear()
+            self._bytes = 0
+
+    def stats(self) -> tuple[int, int]:
+        """(entradas, bytes)"""
+        return len(self._entries), self._bytes
+
+    # --- interno ---
+
+    def _store(self, key: str, resp: Response, ttl: float, topics: tuple[str, ...], gens: tuple[int, ...]) -> bool:
+        """Guarda se der. True quando a entrada tem versão gzip."""
+        # só o que é igual para todo mundo: 200, corpo em memória, sem cookie
+        if resp.status != 200 or resp.chunked or "Set-Cookie" in resp.headers or not isinstance(resp.body, list):
+            return False
+        built = _variants(resp)
+        if built is None:
+            return False
+        plain, gzr, size = built
+        if size > self.max_bytes // 8:
+            return False  # uma entrada não pode varrer o cache sozinha
+        with self._lock:
+            if gens != (self._epoch, *(self._gen.get(t, 0) for t in topics)):
+                metrics.inc("cache_store_raced")
+                return False
+            self._drop(key)
+            self._entries[key] = _Entry(plain, gzr, time.monotonic() + ttl, size, topics)
+            self._bytes += size
+            for t in topics:
+                self._by_topic.setdefault(t, set()).add(key)
+            while self._bytes > self.max_bytes and self._entries:
+                old_key = next(iter(self._entries))
+                self._drop(old_key)
+                metrics.inc("cache_evicted")
+        return gzr is not None
+
+    def _drop(self, key: str) -> None:
+        # chamado com o lock
+        e = self._entries.pop(key, None)
+        if e is None:
+            return
+        self._bytes -= e.size
+        for t in e.topics:
+            keys = self._by_topic.get(t)
+            if keys is not None:
+                keys.discard(key)
+
+def _variants(resp: Response) -> tuple[Response, Response | None, int] | None:
+    """Monta as respostas guardadas (identidade e gzip) a partir da que o handler devolveu."""
+    headers = {k: v for k, v in resp.headers.items() if k not in ("Content-Encoding", "Content-Length", "Vary")}
+    body = resp.body_bytes()
+    if resp.headers.get("Content-Encoding") == "gzip":
+        gz_body, plain_body = body, gzip.decompress(body)
+    elif "Content-Encoding" in resp.headers:
+        return None  # outra codificação: não sabemos desfazer
+    else:
+        plain_body, gz_body = body, None
+        if len(body) >= GZIP_MIN and resp.content_type.startswith(_COMPRESSIBLE):
+            gz_body = gzip.compress(body, mtime=0)
+    hit = dict(headers, **{"X-Cache": "HIT"})
+    if gz_body is not None:
+        hit["Vary"] = "Accept-Encoding"
+    # objetos compartilhados entre requests: ninguém altera uma Response depois do dispatch
+    plain = Response(resp.status, [plain_body], hit, resp.content_type)
+    gzr = None
+    if gz_body is not None:
+        gzr = Response(resp.status, [gz_body], dict(hit, **{"Content-Encoding": "gzip"}), resp.content_type)
+    size = len(plain_body) + (len(gz_body) if gz_body is not None else 0) + _ENTRY_OVERHEAD
+    return plain, gzr, size
+
+CACHE = ResponseCache()
+metrics.gauge_fn("cache_entries", lambda: CACHE.stats()[0])
+metrics.gauge_fn("cache_bytes", lambda: CACHE.stats()[1])
+# páginas embutem URLs de estáticos com hash: mudou um asset, nada guardado serve mais
+pubsub.subscribe("static", lambda _names: CACHE.clear())
@@ -1,4 +1,7 @@
+import socket
+import time
 from email.utils import formatdate
+from typing import Iterable
 
 # Mapa de códigos HTTP -> razão (texto curto)
 STATUS_REASONS = {
@@ -11,37 +14,193 @@ STATUS_REASONS = {
     404: "Not Found",
     405: "Method Not Allowed",
     408: "Request Timeout",
+    413: "Payload Too Large",
     415: "Unsupported Media Type",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
 }
 
+SERVER_NAME = "BrasaHTTP/0.4"
+
+# Blocos de cabeçalho constantes, já em bytes (ISO-8859-1, regra do HTTP/1.1)
+_CONST_HEADERS = f"Server: {SERVER_NAME}\r\nConnection: close\r\n".encode("iso-8859-1")
+_CHUNKED_HEADER = b"Transfer-Encoding: chunked\r\n"
+_CRLF = b"\r\n"
+_LAST_CHUNK = b"0\r\n\r\n"
+_status_lines: dict[int, bytes] = {}
+_IOV_BATCH = 64  # buffers por sendmsg (bem abaixo do IOV_MAX do sistema)
+_JOIN_MAX = 64 * 1024  # sem sendmsg (TLS): pedaços menores que isso saem juntos num sendall
+
+def _status_line(status: int) -> bytes:
+    line = _status_lines.get(status)
+    if line is None:
+        reason = STATUS_REASONS.get(status, "OK")
+        line = _status_lines[status] = f"HTTP/1.1 {status} {reason}\r\n".encode("iso-8859-1")
+    return line
+
+# Date muda uma vez por segundo: formata uma vez e reaproveita
+_date_sec = -1
+_date_str = ""
+_date_line = b""
+
 def http_date() -> str:
     """Data no padrão HTTP (GMT), ex.: Sun, 10 Aug 2025 17:12:00 GMT"""
-    return formatdate(usegmt=True)
+    global _date_sec, _date_str, _date_line
+    now = int(time.time())
+    if now != _date_sec:
+        # troca atômica o bastante para threads: no pior caso duas formatam o mesmo segundo
+        s = formatdate(now, usegmt=True)
+        _date_str, _date_line, _date_sec = s, f"Date: {s}\r\n".encode("ascii"), now
+    return _date_str
+
+def _date_header() -> bytes:
+    http_date()
+    return _date_line
+
+class Response:
+    """
+    Resposta HTTP pronta para envio, com cabeçalho e corpo SEPARADOS.
+    O corpo é uma lista de buffers (ou, se chunked, os pedaços/um iterável de
+    pedaços); o envio usa sendmsg (scatter-gather) sem concatenar nada.
+    """
+    __slots__ = ("status", "content_type", "headers", "body", "chunked", "_tail")
+
+    def __init__(
+        self,
+        status: int,
+        body: list | Iterable[bytes] = (),
+        headers: dict | None = None,
+        content_type: str = "text/html; charset=utf-8",
+        chunked: bool = False,
+    ):
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.body = body
+        self.chunked = chunked
+        self._tail = None
+
+    @property
+    def content_length(self) -> int:
+        """Tamanho declarado do corpo (Content-Length explícito vence, ex.: HEAD)."""
+        if "Content-Length" in self.headers:
+            return int(self.headers["Content-Length"])
+        if self.chunked:
+            return 0
+        return sum(len(b) for b in self.body)
+
+    def head(self) -> bytes:
+        """Status line + headers + linha vazia. Só Date muda entre envios."""
+        if self._tail is None:
+            parts = [f"Content-Type: {self.content_type}\r\n".encode("iso-8859-1")]
+            if self.chunked:
+                parts.append(_CHUNKED_HEADER)
+            elif "Content-Length" not in self.headers:
+                parts.append(b"Content-Length: %d\r\n" % self.content_length)
+            for k, v in self.headers.items():
+                parts.append(f"{k}: {v}\r\n".encode("iso-8859-1"))
+            parts.append(_CRLF)
+            self._tail = b"".join(parts)
+        return _status_line(self.status) + _date_header() + _CONST_HEADERS + self._tail
+
+    def body_bytes(self) -> bytes:
+        """Corpo sem framing (HTTP/2, caches, testes). Aqui sim junta os pedaços."""
+        return b"".join(self.body)
+
+    def __bytes__(self) -> bytes:
+        # útil para depurar/testar; o caminho quente usa send_response
+        frames = _chunk_frames(self.body) if self.chunked else self.body
+        return b"".join([self.head(), *frames])
+
+def _chunk_frames(chunks: Iterable[bytes]):
+    for c in chunks:
+        if c:
+            yield b"%X\r\n" % len(c)
+            yield c
+            yield _CRLF
+    yield _LAST_CHUNK
+
+def _sendmsg_all(conn: socket.socket, bufs: list) -> None:
+    """sendmsg até esvaziar a lista, tratando envios parciais."""
+    views = [memoryview(b) for b in bufs if len(b)]
+    while views:
+        sent = conn.sendmsg(views[:_IOV_BATCH])
+        while sent and views:
+            n = len(views[0])
+            if sent >= n:
+                sent -= n
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+_HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+def _sendall_joined(conn: socket.socket, bufs: list) -> None:
+    """
+    Sem sendmsg: junta buffers pequenos (head + corpo curto) até _JOIN_MAX num
+    sendall só — um registro TLS e um pacote, não um por buffer. Buffer grande
+    sai sozinho, sem cópia.
+    """
+    run: list = []
+    size = 0
+    for b in bufs:
+        n = len(b)
+        if not n:
+            continue
+        if run and size + n > _JOIN_MAX:
+            conn.sendall(b"".join(run))
+            run, size = [], 0
+        if n >= _JOIN_MAX:
+            conn.sendall(b)
+            continue
+        run.append(b)
+        size += n
+    if run:
+        conn.sendall(run[0] if len(run) == 1 else b"".join(run))
+
+def _send_bufs(conn: socket.socket, bufs: list) -> None:
+    # SSLSocket (subclasse) não tem sendmsg
+    if _HAS_SENDMSG and type(conn) is socket.socket:
+        _sendmsg_all(conn, bufs)
+    else:
+        _sendall_joined(conn, bufs)
+
+def send_response(conn: socket.socket, resp: Response, *, head_only: bool = False) -> int:
+    """
+    Envia head + corpo (ou frames chunked) sem concatenar o corpo.
+    Retorna quantos bytes saíram depois do head (corpo + framing chunked).
+    """
+    head = resp.head()
+    if head_only:
+        _send_bufs(conn, [head])
+        return 0
+    if not resp.chunked:
+        _send_bufs(conn, [head, *resp.body])
+        return sum(len(b) for b in resp.body)
+    # chunked: manda em lotes de frames (cada pedaço = tamanho, dados, CRLF)
+    batch, total = [head], 0
+    for frame in _chunk_frames(resp.body):
+        batch.append(frame)
+        total += len(frame)
+        if len(batch) >= _IOV_BATCH:
+            _send_bufs(conn, batch)
+            batch = []
+    if batch:
+        _send_bufs(conn, batch)
+    return total
 
 def build_response(
     status: int,
     body: bytes,
     extra_headers: dict | None = None,
     content_type: str = "text/html; charset=utf-8",
-) -> bytes:
-    """Monta uma resposta HTTP/1.1 completa em bytes."""
-    reason = STATUS_REASONS.get(status, "OK")
-    headers = {
-        "Date": http_date(),
-        "Server": "BrasaHTTP/0.4",
-        "Content-Type": content_type,
-        "Content-Length": str(len(body)),
-        "Connection": "close",
-    }
-    if extra_headers:
-        headers.update(extra_headers)
-
-    status_line = f"HTTP/1.1 {status} {reason}\r\n"
-    headers_blob = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
-    # Headers: ISO-8859-1 (regra do HTTP/1.1). Corpo: livre (usaremos UTF-8).
-    return (status_line + headers_blob + "\r\n").encode("iso-8859-1") + body
+) -> Response:
+    """Monta uma resposta HTTP/1.1 (head e corpo separados; ver send_response)."""
+    return Response(status, [body] if body else [], extra_headers, content_type)
 
-def redirect(location: str, status: int = 302, extra_headers: dict | None = None) -> bytes:
+def redirect(location: str, status: int = 302, extra_headers: dict | None = None) -> Response:
     hdrs = {"Location": location}
     if extra_headers:
         hdrs.update(extra_headers)
@@ -53,26 +212,6 @@ def build_chunked_response(
     chunks: list[bytes],
     extra_headers: dict | None = None,
     content_type: str = "text/plain; charset=utf-8",
-) -> bytes:
-    reason = STATUS_REASONS.get(status, "OK")
-    headers = {
-        "Date": http_date(),
-        "Server": "BrasaHTTP/0.4",
-        "Content-Type": content_type,
-        "Transfer-Encoding": "chunked",
-        "Connection": "close",
-    }
-    if extra_headers:
-        headers.update(extra_headers)
-
-    status_line = f"HTTP/1.1 {status} {reason}\r\n"
-    headers_blob = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
-    head = (status_line + headers_blob + "\r\n").encode("iso-8859-1")
-
-    # Monta o corpo no formato chunked (didático; ainda mandamos tudo de uma vez)
-    body = b""
-    for c in chunks:
-        size_hex = f"{len(c):X}\r\n".encode("ascii")
-        body += size_hex + c + b"\r\n"
-    body += b"0\r\n\r\n"
-    return head + body
\ No newline at end of file
+) -> Response:
+    """Transfer-Encoding: chunked; o framing é feito na hora do envio."""
+    return Response(status, chunks, extra_headers, content_type, chunked=True)
@@ -1,12 +1,20 @@
 from dataclasses import dataclass
 from typing import Callable, Dict, Tuple
 from html import escape as html_escape
-from app.responses import build_response, redirect, build_chunked_response
+import io
+from app.responses import Response, build_response, redirect, build_chunked_response
 from pathlib import Path
-from app.staticserve import serve_static, STATIC_ROOT
+from app.staticserve import serve_static, not_found_body
 from app.templating import render_page, Safe
-from app.sessions import verify_token, build_session_cookie, build_clear_session_cookie, COOKIE_NAME
-from app.db import insert_eco, fetch_recent, insert_love_note, fetch_love_notes
+from app.sessions import verify_token, revoke_token, build_session_cookie, build_clear_session_cookie, COOKIE_NAME
+from urllib.parse import quote_plus
+from app.db import insert_eco, fetch_recent, insert_love_note, fetch_love_notes, fetch_love_notes_since, latest_love_note_id, search, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE, EXPORT_TABLES
+from app import metrics
+from app.profiler import PROFILER
+from app.sse import Channel
+from app.respcache import CACHE, cache_key
+from app.singleflight import FLIGHT
+from app import snapshot
 
 @dataclass
 class Request:
@@ -22,17 +30,51 @@ class Request:
     cookies: dict
     is_secure: bool
 
-RouteKey = Tuple[str, str] # (METHOD, PATH)
-_routes: Dict[RouteKey, Callable[[Request], bytes]] = {}
+# recados novos -> eventos SSE (insert_love_note publica no tópico "love_notes")
+LOVE_EVENTS = Channel("love_notes", "recado", since=fetch_love_notes_since, head=latest_love_note_id)
 
-def add_route(method: str, path: str, handler: Callable[[Request], bytes]) -> None:
+RouteKey = Tuple[str, str] # (METHOD, PATH)
+_routes: Dict[RouteKey, Callable[[Request], Response]] = {}
+
+@dataclass(frozen=True)
+class RouteOpts:
+    """Opções por rota (todas opt-in)."""
+    cache_ttl: float = 0.0               # > 0: resposta vai pro cache compartilhado (só GET)
+    cache_topics: tuple[str, ...] = ()   # tópicos do pubsub que invalidam a entrada
+    coalesce: bool = False               # GETs idênticos simultâneos dividem uma execução
+    prerender: bool = False              # sem query string: página pré-renderizada (app/snapshot.py)
+
+_route_opts: Dict[RouteKey, RouteOpts] = {}
+
+def add_route(method: str, path: str, handler: Callable[[Request], Response], *,
+              cache_ttl: float = 0.0, cache_topics: tuple[str, ...] = (), coalesce: bool = False,
+              prerender: bool = False) -> None:
+    """
+    Registra um handler. cache_ttl e coalesce só valem para páginas iguais para
+    todo mundo (dependem só de path + query): nada de cookie, User-Agent etc.
+    prerender vai além: sem query a página só pode depender do template (nem do banco).
+    """
     method = method.upper()
     _routes[(method, path)] = handler
+    for t in cache_topics if cache_ttl > 0 else ():
+        CACHE.watch(t)
+    if prerender and method == "GET":
+        snapshot.register(path, lambda: handler(_snapshot_request(path)))
+    opts = RouteOpts(cache_ttl, tuple(cache_topics), coalesce, prerender)
+    if opts != RouteOpts():
+        _route_opts[(method, path)] = opts
+    else:
+        _route_opts.pop((method, path), None)
+
+def _snapshot_request(path: str) -> Request:
+    """GET "anônimo" (sem query, headers nem cookies) usado para pré-renderizar."""
+    return Request(method="GET", path=path, query={}, version="HTTP/1.1", headers={},
+                   remote_addr="-", body=b"", form={}, cookies={}, is_secure=False)
 
 def _allowed_methods_for_path(path: str):
     return sorted({m for (m, p) in _routes.keys() if p == path})
 
-def dispatch(req: Request) -> bytes:
+def dispatch(req: Request) -> Response:
     """Encontra o handler para (method, path). 404/405 conforme o caso."""
     # Estáticos por prefixo
     if req.path.startswith("/static/"):
@@ -40,7 +82,14 @@ def dispatch(req: Request) -> bytes:
 
     handler = _routes.get((req.method, req.path))
     if handler is not None:
-        return handler(req)
+        opts = _route_opts.get((req.method, req.path))
+        if opts is None or req.method != "GET":
+            return handler(req)
+        if opts.prerender and not req.query:
+            resp = snapshot.serve(req.path, req.headers)
+            if resp is not None:
+                return resp
+        return _run_route(req, handler, opts)
 
     methods = _allowed_methods_for_path(req.path)
     if methods:
@@ -51,48 +100,74 @@ def dispatch(req: Request) -> bytes:
         )
     return render_404()
 
+def _run_route(req: Request, handler: Callable[[Request], Response], opts: RouteOpts) -> Response:
+    """GET com opções: cache de respostas e/ou single-flight (coalescing) em volta do handler."""
+    key = cache_key(req.path, req.query)
+    ae = req.headers.get("accept-encoding")
+    if opts.cache_ttl > 0 and CACHE.enabled:
+        call = lambda: CACHE.fetch(key, ae, opts.cache_ttl, opts.cache_topics, lambda: handler(req))
+    else:
+        call = lambda: handler(req)
+    if not opts.coalesce:
+        return call()
+    # o corpo depende da codificação pedida (gzip ou não): entra na chave
+    gz = bool(ae) and "gzip" in ae.lower()
+    resp, shared = FLIGHT.do((key, gz), call)
+    if not shared:
+        return resp
+    if not isinstance(resp.body, list):
+        return handler(req)  # corpo iterável só pode ser consumido uma vez
+    # cópia rasa: cada request mexe nos próprios headers; os buffers do corpo são compartilhados
+    return Response(resp.status, resp.body, dict(resp.headers), resp.content_type, resp.chunked)
+
 # ---------- Handlers (views) de exemplo ----------
 
-def home(req: Request) -> bytes:
+def home(req: Request) -> Response:
     nome = req.query.get("nome", ["mundo"])[0]
     return render_page("home.html", title="BrasaHTTP", nome=nome)
 
 
-def sobre(req: Request) -> bytes:
+def sobre(req: Request) -> Response:
     ua = req.headers.get("user-agent", "desconhecido")
     return render_page("sobre.html", title="Sobre • BrasaHTTP", ua=ua)
 
-def saudacao(req: Request) -> bytes:
+def saudacao(req: Request) -> Response:
     nome = req.query.get("nome", ["mundo"])[0]
     return render_page("saudacao.html", title="Saudação • BrasaHTTP", nome=nome)
 
 def init_routes() -> None:
     """Registra as rotas iniciais do projeto."""
-    add_route("GET", "/", home)
-    add_route("GET", "/sobre", sobre)
-    add_route("GET", "/saudacao", saudacao)
-    add_route("GET", "/eco", eco_get)
+    add_route("GET", "/", home, cache_ttl=300, coalesce=True, prerender=True)
+    add_route("GET", "/sobre", sobre)   # mostra o User-Agent de quem pede: não dá para compartilhar
+    add_route("GET", "/saudacao", saudacao, cache_ttl=300, prerender=True)
+    add_route("GET", "/eco", eco_get, cache_ttl=300, prerender=True)
     add_route("POST", "/eco", eco_post)
     add_route("GET", "/favicon.ico", favicon)
     add_route("GET",  "/login", login_get)
     add_route("POST", "/login", login_post)
     add_route("GET",  "/area", area)
     add_route("GET",  "/logout", logout)   
-    add_route("GET", "/eco/list", eco_list)
+    add_route("GET", "/eco/list", eco_list, cache_ttl=60, cache_topics=("eco_messages",), coalesce=True)
     add_route("GET", "/stream", stream)
-    add_route("GET",  "/ninissa", love_home)
-    add_route("GET",  "/ninissa/recados", love_recados_get)
+    add_route("GET",  "/ninissa", love_home, cache_ttl=300, prerender=True)
+    add_route("GET",  "/ninissa/recados", love_recados_get, cache_ttl=60, cache_topics=("love_notes",), coalesce=True)
+    add_route("GET",  "/busca", busca, cache_ttl=60, cache_topics=("love_notes", "eco_messages"), coalesce=True)
     add_route("POST", "/ninissa/recados", love_recados_post)
+    add_route("GET",  "/ninissa/recados/eventos", love_eventos)
+    add_route("GET",  "/metrics", metrics_view)
+    add_route("GET",  "/admin/profile", admin_profile)
+    add_route("GET",  "/admin/export", admin_export)
+    add_route("POST", "/admin/import", admin_import)
 
 
-def favicon(req: Request) -> bytes:
+def favicon(req: Request) -> Response:
     # 204 sem corpo, só para silenciar o pedido do browser
     return build_response(204, b"", content_type="image/x-icon")
 
-def eco_get(req: Request) -> bytes:
+def eco_get(req: Request) -> Response:
     return render_page("eco.html", title="Echo • BrasaHTTP", accept_encoding=req.headers.get("accept-encoding"))
 
-def eco_post(req: Request) -> bytes:
+def eco_post(req: Request) -> Response:
     ctype = req.headers.get("content-type", "")
     if not ctype.lower().startswith("application/x-www-form-urlencoded"):
         return build_response(
@@ -115,7 +190,7 @@ def eco_post(req: Request) -> bytes:
 
     return render_page("eco_result.html", title="Echo • BrasaHTTP", nome=nome, mensagem=msg, accept_encoding=req.headers.get("accept-encoding"))
 
-def eco_list(req: Request) -> bytes:
+def eco_list(req: Request) -> Response:
     # pega limite via query (?n=50), default 20
     n = 20
     try:
@@ -150,23 +225,22 @@ def eco_list(req: Request) -> bytes:
 
     return render_page("eco_list.html", title="Mensagens • BrasaHTTP", qtd=len(rows), linhas=html_linhas, accept_encoding=req.headers.get("accept-encoding"))
 
-def render_404() -> bytes:
-    """Tenta servir o app/static/404.html; se não existir, usa fallback."""
-    custom = STATIC_ROOT / "404.html"
-    if custom.exists() and custom.is_file():
-        body = custom.read_bytes()
+def render_404() -> Response:
+    """Serve o app/static/404.html (em memória, via índice de estáticos); se não existir, usa fallback."""
+    body = not_found_body()
+    if body is not None:
         return build_response(404, body, content_type="text/html; charset=utf-8")
     # fallback simples
     return build_response(404, b"<!doctype html><meta charset='utf-8'><h1>404 Not Found</h1>")
 
-def login_get(req: Request) -> bytes:
+def login_get(req: Request) -> Response:
     # Se já tiver sessão válida, redireciona direto
     tok = req.cookies.get(COOKIE_NAME)
     if tok and verify_token(tok):
         return redirect("/area")
     return render_page("login.html", title="Login • BrasaHTTP", accept_encoding=req.headers.get("accept-encoding"))
 
-def login_post(req: Request) -> bytes:
+def login_post(req: Request) -> Response:
     nome = req.form.get("nome", [""])[0].strip()
     if not nome:
         return build_response(
@@ -176,7 +250,7 @@ def login_post(req: Request) -> bytes:
     cookie = build_session_cookie({"nome": nome}, max_age=7200, secure=req.is_secure)
     return redirect("/area", extra_headers={"Set-Cookie": cookie})
 
-def area(req: Request) -> bytes:
+def area(req: Request) -> Response:
     tok = req.cookies.get(COOKIE_NAME)
     data = verify_token(tok) if tok else None
     if not data:
@@ -184,11 +258,14 @@ def area(req: Request) -> bytes:
     nome = data.get("nome", "visitante")
     return render_page("area.html", title="Área • BrasaHTTP", nome=nome, accept_encoding=req.headers.get("accept-encoding"))
 
-def logout(req: Request) -> bytes:
+def logout(req: Request) -> Response:
+    tok = req.cookies.get(COOKIE_NAME)
+    if tok:
+        revoke_token(tok)
     clear = build_clear_session_cookie()
     return redirect("/", extra_headers={"Set-Cookie": clear})
 
-def stream(req: Request) -> bytes:
+def stream(req: Request) -> Response:
     # didático: 3 "pedacinhos" (não é streaming real; só mostra o formato)
     chunks = [
         b"primeiro pedaco\n",
@@ -197,11 +274,11 @@ def stream(req: Request) -> bytes:
     ]
     return build_chunked_response(200, chunks, content_type="text/plain; charset=utf-8")
 
-def love_home(req: Request) -> bytes:
+def love_home(req: Request) -> Response:
     return render_page("love_home.html", title="Ninissa & Mateus",
                        accept_encoding=req.headers.get("accept-encoding"))
 
-def love_recados_get(req: Request) -> bytes:
+def love_recados_get(req: Request) -> Response:
     rows = fetch_love_notes(30)
     itens = []
     for r in rows:
@@ -215,7 +292,7 @@ def love_recados_get(req: Request) -> bytes:
                        lista_recados=lista,
                        accept_encoding=req.headers.get("accept-encoding"))
 
-def love_recados_post(req: Request) -> bytes:
+def love_recados_post(req: Request) -> Response:
     ctype = (req.headers.get("content-type") or "").lower()
     if not ctype.startswith("application/x-www-form-urlencoded"):
         return build_response(415, b"<!doctype html><meta charset='utf-8'><h1>415</h1><p>Use form urlencoded</p>")
@@ -229,3 +306,141 @@ def love_recados_post(req: Request) -> bytes:
         return build_response(500, b"<!doctype html><meta charset='utf-8'><h1>500</h1><p>Erro salvando recado.</p>")
     # redireciona de volta (PRG pattern)
     return redirect("/ninissa/recados")
+
+
+def love_eventos(req: Request) -> Response:
+    """text/event-stream com cada recado novo; o servidor entrega o socket ao hub SSE."""
+    try:
+        last_id = int(req.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_id = 0
+    # reconexão: o canal reenvia o que o navegador perdeu enquanto estava fora
+    stream = LOVE_EVENTS.open(after=max(0, last_id))
+    if stream is None:
+        return build_response(503, b"<h1>503</h1><p>Muitas conexoes abertas.</p>", {"Retry-After": "10"})
+    return Response(200, stream,
+                    {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                    content_type="text/event-stream; charset=utf-8", chunked=True)
+
+def _highlight(trecho: str) -> str:
+    # escapa tudo e só então troca os marcadores do snippet por <mark>
+    return html_escape(trecho).replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+def busca(req: Request) -> Response:
+    q = req.query.get("q", [""])[0].strip()[:200]
+    try:
+        page = max(1, min(int(req.query.get("p", ["1"])[0]), SEARCH_MAX_PAGE))
+    except ValueError:
+        page = 1
+    itens, has_next = search(q, page) if q else ([], False)
+    if not q:
+        resultados = ""
+    elif not itens:
+        resultados = "<p>Nada encontrado.</p>"
+    else:
+        lis = []
+        for r in itens:
+            origem = "recado" if r["tipo"] == "recado" else "/eco"
+            lis.append(
+                f"<li><p>{_highlight(r['trecho'])}</p>"
+                f"<p><small>{origem} · {html_escape(r['autor'])} · "
+                f"<time datetime='{html_escape(r['created_at'])}'>{html_escape(r['created_at'])}</time></small></p></li>"
+            )
+        resultados = f"<ol start='{(page - 1) * SEARCH_PAGE_SIZE + 1}'>" + "\n".join(lis) + "</ol>"
+    links = []
+    if page > 1:
+        links.append(f"<a href='/busca?q={quote_plus(q)}&amp;p={page - 1}'>← anteriores</a>")
+    if has_next:
+        links.append(f"<a href='/busca?q={quote_plus(q)}&amp;p={page + 1}'>próximos →</a>")
+    return render_page("busca.html", title="Busca • BrasaHTTP", q=q,
+                       resultados=Safe(resultados), paginacao=Safe(" · ".join(links)),
+                       accept_encoding=req.headers.get("accept-encoding"))
+
+
+def _is_admin(req: Request) -> bool:
+    """Rotas administrativas: só a partir da própria máquina (loopback)."""
+    return req.remote_addr in ("127.0.0.1", "::1")
+
+def metrics_view(req: Request) -> Response:
+    if not _is_admin(req):
+        return build_response(403, b"<h1>403 Forbidden</h1>")
+    body = metrics.render_text().encode("utf-8")
+    return build_response(200, body, extra_headers={"Cache-Control": "no-store"}, content_type="text/plain; charset=utf-8")
+
+def admin_profile(req: Request) -> Response:
+    """?acao=on[&n=10] liga; ?acao=off desliga e grava; ?acao=dump grava sem desligar."""
+    if not _is_admin(req):
+        return build_response(403, b"<h1>403 Forbidden</h1>")
+    acao = req.query.get("acao", [""])[0]
+    paths = []
+    if acao == "on":
+        try:
+            n = int(req.query.get("n", ["0"])[0])
+        except ValueError:
+            n = 0
+        PROFILER.set_enabled(True, top_n=n or None)
+    elif acao == "off":
+        paths = PROFILER.set_enabled(False)
+    elif acao == "dump":
+        paths = PROFILER.dump()
+    st = PROFILER.status()
+    lines = [f"enabled {st['enabled']}", f"top_n {st['top_n']}"]
+    lines += [f"kept {ms:.1f}ms {label}" for ms, label in st["kept"]]
+    lines += [f"wrote {p}" for p in paths]
+    body = ("\n".join(lines) + "\n").encode("utf-8")
+    return build_response(200, body, extra_headers={"Cache-Control": "no-store"}, content_type="text/plain; charset=utf-8")
+
+def _backup_args(req: Request) -> tuple[str, str] | None:
+    """(tabela, formato) de ?tabela=...&formato=ndjson|csv; None se inválido."""
+    from app.backup import FORMATS  # adiado: csv só carrega quando alguém usa o backup
+    tabela = req.query.get("tabela", [""])[0]
+    formato = req.query.get("formato", [""])[0]
+    if not formato:
+        ctype = (req.headers.get("content-type") or "").lower()
+        formato = "csv" if "csv" in ctype else "ndjson"
+    if tabela not in EXPORT_TABLES or formato not in FORMATS:
+        return None
+    return tabela, formato
+
+def admin_export(req: Request) -> Response:
+    """?tabela=love_notes|eco_messages&formato=ndjson|csv -> tabela inteira, em streaming."""
+    if not _is_admin(req):
+        return build_response(403, b"<h1>403 Forbidden</h1>")
+    args = _backup_args(req)
+    if args is None:
+        return build_response(400, b"<h1>400</h1><p>Use ?tabela=love_notes|eco_messages&amp;formato=ndjson|csv</p>")
+    tabela, formato = args
+    from app.backup import FORMATS, export_chunks
+    headers = {
+        "Cache-Control": "no-store",
+        "Content-Disposition": f'attachment; filename="{tabela}.{formato}"',
+    }
+    # gerador: linhas saem do cursor direto para o socket (chunked / DATA do h2)
+    return Response(200, export_chunks(tabela, formato), headers, content_type=FORMATS[formato], chunked=True)
+
+def admin_import(req: Request) -> Response:
+    """POST com o arquivo no corpo (NDJSON ou CSV, até MAX_BODY); ids existentes são ignorados.
+    Acima disso o servidor já responde 413 sem ler o corpo (ver body_too_large)."""
+    if not _is_admin(req):
+        return build_response(403, b"<h1>403 Forbidden</h1>")
+    args = _backup_args(req)
+    if args is None:
+        return build_response(400, b"<h1>400</h1><p>Use ?tabela=love_notes|eco_messages&amp;formato=ndjson|csv</p>")
+    tabela, formato = args
+    from app.backup import import_file
+    try:
+        # BytesIO sobre bytes compartilha o buffer (só copiaria se alguém escrevesse nele)
+        st = import_file(tabela, io.BytesIO(req.body), formato)
+    except ValueError as e:
+        return build_response(400, f"erro: {e}\n".encode("utf-8"), content_type="text/plain; charset=utf-8")
+    body = f"lidos {st.read}\nimportados {st.inserted}\ndescartados {st.skipped}\n".encode("utf-8")
+    return build_response(200, body, extra_headers={"Cache-Control": "no-store"}, content_type="text/plain; charset=utf-8")
+
+def body_too_large(path: str, limit: int) -> Response:
+    """413 para corpo acima do limite; no import, aponta a CLI (lê o arquivo em streaming, sem limite)."""
+    if path == "/admin/import":
+        text = (f"arquivo grande demais para o upload (limite {limit // 1024} KiB).\n"
+                "importe pela linha de comando: python -m app.backup import <tabela> <arquivo>\n")
+        return build_response(413, text.encode("utf-8"), extra_headers={"Cache-Control": "no-store"},
+                              content_type="text/plain; charset=utf-8")
+    return build_response(413, f"<h1>413 Payload Too Large</h1><p>Limite: {limit // 1024} KiB</p>".encode("utf-8"))
@@ -1,15 +1,31 @@
+import time
+_BOOT_T0 = time.perf_counter() # antes dos demais imports: entram no relatório de startup
 import socket # comunicação tcp 
 from urllib.parse import urlsplit, parse_qs
-from app.responses import build_response
-from app.router import Request, dispatch, init_routes
+from app.responses import Response, build_response, send_response
+from app.router import Request, dispatch, init_routes, body_too_large
 import traceback
 import os
 import threading
-from concurrent.futures import ThreadPoolExecutor
-from app.db import init_db
-from app.config import load_settings
+from app.workers import WorkerPool
+from app.db import init_db, warm_up as warm_up_db
+from app.config import load_settings, Settings, PROJECT_ROOT
+from app.templating import clear_template_cache, preload as preload_templates
+from app import staticserve, snapshot, h2
+from app.respcache import CACHE as RESPONSE_CACHE
+from app.singleflight import FLIGHT
 from app.logging_setup import setup_logging
-import ssl
+from app.ratelimit import RateLimiter
+from app.ratelimit import ConnectionLimiter
+from app import metrics, timing, pubsub, sessions, shm
+from app.profiler import PROFILER
+from app.h2 import serve_h2
+from app.sse import EventStream, HUB as SSE_HUB
+import math
+import mimetypes
+from typing import Callable
+
+ssl = None # importado em serve_forever só com TLS ligado (~6ms a menos no boot sem TLS)
 
 HOST = '0.0.0.0' # escuta em todas as interfaces locais
 PORT = 8080 # porta do nosso servidor
@@ -17,17 +33,52 @@ BACKLOG = 50 # fila de conexões pendentes
 BUF_SIZE = 4096 # leitura de bloco de 4 kib
 MAX_HEADER = 16 * 1024 # limite de 16kib para cabeçalhos (defesa básica)
 MAX_BODY = 1 * 1024 * 1024 # 1MiB: limita para corpo
-MAX_WORKERS = min(32, (os.cpu_count() or 2) * 5)
+LINGER_TIME = 2.0 # s descartando o corpo recusado (413) antes de fechar, para o cliente ler a resposta
+MAX_WORKERS = min(32, (os.cpu_count() or 2) * 5) # teto padrão do pool adaptativo (server.max_workers = 0)
+HEADER_TIMEOUT = 10.0 # prazo ABSOLUTO para handshake TLS + headers (não renova a cada recv)
+BODY_MIN_RATE = 1024 # bytes/s mínimos no corpo (slowloris de corpo)
+BODY_GRACE = 5.0 # folga fixa somada ao prazo do corpo
+RETRY_AFTER = 2 # segundos no Retry-After das recusas por sobrecarga
+SLOW_REQUEST_MS = 500.0 # acima disso o request vai pro app log com as fases (0 = off)
+LISTEN_FD_ENV = "BRASA_LISTEN_FD" # fd do socket de escuta herdado no upgrade
+READY_FD_ENV = "BRASA_READY_FD" # pipe para o filho avisar "pronto" ao pai
+SHARED_POLL = 0.2 # s entre olhadas nos avisos de outros processos (pubsub); contadores vão a cada 5 voltas
+PROBE_PATHS = ("/healthz", "/readyz") # respondidos antes do router (ver _probe)
+
+# Sinais só marcam eventos; o loop de accept é quem age
+_STOP = threading.Event()
+_RELOAD = threading.Event()
+_UPGRADE = threading.Event()
+_PROFILE = threading.Event()
+# fase do processo para o /readyz: "warming" até o accept começar, "ready", "draining" no encerramento
+_PHASE = "warming"
+
+def _recv_until(conn: socket.socket, nbytes: int, deadline: float) -> bytes:
+    """recv com prazo absoluto: o timeout de cada chamada é só o que sobra até o deadline."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise socket.timeout("deadline excedido")
+    conn.settimeout(remaining)
+    return conn.recv(nbytes)
+
+class BodyTooLarge(ValueError):
+    """Content-Length acima de MAX_BODY: vira 413 antes de ler o corpo."""
+    def __init__(self, target: str):
+        super().__init__("request body too large")
+        self.target = target
 
-def read_request(conn: socket.socket):
+def read_request(conn: socket.socket, header_deadline: float | None = None):
     """
     Lê headers até \\r\\n\\r\\n, parseia Content-Length e lê o corpo (se houver).
     Retorna (method, target, version, headers, body_bytes).
+    Headers têm prazo absoluto (HEADER_TIMEOUT); o corpo precisa vir a pelo menos
+    BODY_MIN_RATE bytes/s (mais BODY_GRACE), senão vira 408.
     """
-    conn.settimeout(5.0)
+    if header_deadline is None:
+        header_deadline = time.monotonic() + HEADER_TIMEOUT
     data = b""
     while b"\r\n\r\n" not in data:
-        chunk = conn.recv(BUF_SIZE)
+        chunk = _recv_until(conn, BUF_SIZE, header_deadline)
         if not chunk:
             break
         data += chunk
@@ -61,8 +112,10 @@ def read_request(conn: socket.socket):
 
     # Corpo conforme Content-Length
     clen = int(headers.get("content-length", "0") or "0")
-    if clen < 0 or clen > MAX_BODY:
+    if clen < 0:
         raise ValueError("invalid content-length")
+    if clen > MAX_BODY:
+        raise BodyTooLarge(target)
 
     # rest = bytes depois de \r\n\r\n
     body = b""
@@ -73,8 +126,9 @@ def read_request(conn: socket.socket):
         body = rest
         if len(body) < clen:
             to_read = clen - len(body)
+            body_deadline = time.monotonic() + BODY_GRACE + to_read / BODY_MIN_RATE
             while to_read > 0:
-                chunk = conn.recv(min(BUF_SIZE, to_read))
+                chunk = _recv_until(conn, min(BUF_SIZE, to_read), body_deadline)
                 if not chunk:
                     raise ValueError("incomplete body")
                 body += chunk
@@ -139,51 +193,210 @@ def parse_cookies(header_value: str) -> dict:
             cookies[k.strip()] = v.strip()
     return cookies
 
-def _parse_status_and_cl(resp: bytes) -> tuple[int, int]:
+APP_LOG = None
+ACC_LOG = None
+RATE_LIMITER: RateLimiter | None = None
+CONN_LIMITER: ConnectionLimiter | None = None
+# streams HTTP/2: pool próprio, separado do das conexões (a thread de uma conexão
+# h2 espera os streams dela; no mesmo pool, conexões ocupando todos os workers
+# deixariam os streams sem ninguém para rodá-los)
+H2_POOL: WorkerPool | None = None
+
+def _rate_limited(req: Request) -> Response | None:
+    """429 + Retry-After se o cliente estourou o balde; None para seguir."""
+    if RATE_LIMITER is None:
+        return None
+    wait = RATE_LIMITER.check(req.remote_addr, req.method, req.path)
+    if wait <= 0:
+        return None
+    return build_response(
+        429,
+        b"<!doctype html><meta charset='utf-8'><h1>429 Too Many Requests</h1><p>Calma! Tente de novo em instantes.</p>",
+        extra_headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+def _probe_response(status: int, text: str) -> Response:
+    return build_response(status, text.encode("ascii") + b"\n",
+                          extra_headers={"Cache-Control": "no-store"}, content_type="text/plain; charset=utf-8")
+
+# prontas desde o import: o probe não monta nada por request
+_PROBES = {
+    "ok": _probe_response(200, "ok"),
+    "warming": _probe_response(503, "warming"),
+    "draining": _probe_response(503, "draining"),
+}
+
+def _probe(method: str, target: str) -> Response | None:
+    """
+    /healthz (processo vivo) e /readyz (aceitando tráfego) para o balanceador.
+    Saem antes do router, do rate limit e do access log: checados a cada
+    segundo, não podem ser barrados nem encher o log. None = request normal.
+    """
+    if method != "GET":
+        return None
+    path = target.split("?", 1)[0]
+    if path not in PROBE_PATHS:
+        return None
+    if path == "/healthz" or _PHASE == "ready":
+        return _PROBES["ok"]
+    return _PROBES[_PHASE]
+
+_SHED_TEXT = {
+    503: "Servidor ocupado, tente de novo.",
+    429: "Conexões simultâneas demais a partir do seu endereço; feche alguma e tente de novo.",
+}
+
+def _shed(conn: socket.socket, addr: tuple[str, int], status: int, retry_after: int, reason: str, *, can_block: bool = False) -> None:
+    """
+    Recusa rápida (503/429 + Retry-After) sem passar pelo handler.
+    No loop de accept (can_block=False) nunca bloqueia: um send só, com o socket
+    não bloqueante (a resposta cabe folgada no buffer de um socket novo); não
+    coube, a conexão só é fechada. TLS ainda sem handshake não dá para responder
+    assim: ali só fechamos. Dentro do worker (can_block) o envio espera até 1s.
+    """
+    if APP_LOG: APP_LOG.warning("%d para %s: %s", status, addr[0], reason)
     try:
-        head_end = resp.find(b"\r\n\r\n")
-        head = resp[:head_end if head_end != -1 else len(resp)]
-        first_line_end = head.find(b"\r\n")
-        status_line = head[:first_line_end if first_line_end != -1 else len(head)].decode("iso-8859-1", "replace")
-        parts = status_line.split(" ", 2)
-        status = int(parts[1]) if len(parts) >= 2 else 200
-        cl = None
-        for line in head.split(b"\r\n")[1:]:
-            if line.lower().startswith(b"content-length:"):
-                try:
-                    cl = int(line.split(b":", 1)[1].strip())
-                    break
-                except Exception:
-                    pass
-        if cl is None and head_end != -1:
-            cl = len(resp) - (head_end + 4)  # fallback
-        return status, int(cl or 0)
+        if ssl is not None and isinstance(conn, ssl.SSLSocket):
+            if not can_block:
+                return
+            conn.settimeout(1.0)
+            conn.do_handshake()
+        text = _SHED_TEXT.get(status, _SHED_TEXT[503])
+        resp = build_response(
+            status,
+            f"<!doctype html><meta charset='utf-8'><h1>{status}</h1><p>{text}</p>".encode("utf-8"),
+            extra_headers={"Retry-After": str(retry_after)},
+        )
+        if can_block:
+            conn.settimeout(1.0)
+            send_response(conn, resp)
+        else:
+            conn.setblocking(False)
+            conn.send(bytes(resp))
     except Exception:
-        return 200, 0
+        pass
+    finally:
+        try: conn.close()
+        except Exception: pass
 
+def _serve_and_release(conn: socket.socket, addr: tuple[str, int], is_secure: bool) -> None:
+    handed_off = False
+    try:
+        handed_off = serve_connection(conn, addr, is_secure)
+    finally:
+        # conexão entregue ao hub SSE continua contando; o hub libera ao fechar
+        if CONN_LIMITER and not handed_off: CONN_LIMITER.release(addr[0])
 
+def serve_connection(conn: socket.socket, addr: tuple[str, int], is_secure: bool) -> bool:
+    """Atende a conexão. True se o socket foi entregue ao hub SSE (segue aberto)."""
+    timer = timing.begin()
+    prof = PROFILER.start()  # None quando desligado
+    req, resp, sent = None, None, 0
+    try:
+        req, resp, sent = _serve(conn, addr, is_secure)
+    finally:
+        timing.end()
+        # resp None: nada servido aqui (handshake falhou, ou h2 — que registra cada stream)
+        PROFILER.stop(prof, timer.total_ms(), f"{req.method} {req.path}" if req else "h2/-")
+        if resp is not None:
+            _finish(addr, req, resp, sent, timer)
+    return resp is not None and isinstance(resp.body, EventStream)
 
-APP_LOG = None
-ACC_LOG = None
+def _finish(addr: tuple[str, int], req: Request | None, resp: Response, sent: int, timer: timing.RequestTimer) -> None:
+    """Métricas, log de request lento e access log de um request atendido."""
+    total_ms = timer.total_ms()
+    metrics.inc("requests")
+    metrics.inc("request_ms_total", total_ms)
+    if SLOW_REQUEST_MS and total_ms >= SLOW_REQUEST_MS and APP_LOG:
+        label = f"{req.method} {req.path}" if req else "-"
+        APP_LOG.warning("Request lento: %s de %s %.1fms [%s]", label, addr[0], total_ms, timer.summary())
+    _access_log(addr, req, resp, sent)
 
-def serve_connection(conn: socket.socket, addr: tuple[str, int], is_secure: bool) -> None:
-    global APP_LOG, ACC_LOG
+def _h2_request(addr: tuple[str, int], method: str, target: str, headers: dict, body: bytes) -> Response:
+    """Um stream HTTP/2 completo -> mesmo caminho do HTTP/1.1 (to_request + dispatch)."""
+    probe = _probe(method, target)
+    if probe is not None:
+        return probe
+    timer = timing.begin()
+    req = None
+    try:
+        req = to_request(method, target, "HTTP/2", headers, body, addr[0], True)
+        with timing.phase("dispatch"):
+            resp = _rate_limited(req) or dispatch(req)
+    except ValueError as e:
+        resp = build_response(400, f"<h1>400 Bad Request</h1><p>{e}</p>".encode("utf-8"))
+    except Exception:
+        if APP_LOG: APP_LOG.exception("Erro inesperado atendendo %s (h2)", addr[0])
+        resp = build_response(500, b"<h1>500 Internal Server Error</h1>")
+    timing.end()
+    _finish(addr, req, resp, resp.content_length, timer)
+    return resp
+
+def _serve(conn: socket.socket, addr: tuple[str, int], is_secure: bool) -> tuple[Request | None, Response | None, int]:
+    """Handshake, leitura, dispatch e envio de UMA conexão. Retorna (req, resp, bytes do corpo) p/ os logs."""
+    req = None
+    sent = 0
+    deadline = time.monotonic() + HEADER_TIMEOUT
+    if is_secure:
+        # handshake aqui (no worker) e sob o mesmo prazo dos headers
+        try:
+            with timing.phase("tls"):
+                conn.settimeout(HEADER_TIMEOUT)
+                conn.do_handshake()
+        except (ssl.SSLError, OSError) as e:
+            if APP_LOG: APP_LOG.info("Falha no handshake TLS de %s: %s", addr[0], e)
+            try: conn.close()
+            except Exception: pass
+            return None, None, 0
+        if conn.selected_alpn_protocol() == "h2":
+            try:
+                serve_h2(conn, lambda m, t, h, b: _h2_request(addr, m, t, h, b),
+                         max_body=MAX_BODY, max_header=MAX_HEADER, stop=_STOP,
+                         submit=H2_POOL.submit if H2_POOL is not None else None)
+            finally:
+                try: conn.close()
+                except Exception: pass
+            return None, None, 0
     try:
-        method, target, version, headers, body = read_request(conn)
-        req = to_request(method, target, version, headers, body, addr[0], is_secure)
-        resp = dispatch(req)
+        with timing.phase("read"):
+            method, target, version, headers, body = read_request(conn, deadline)
+            probe = _probe(method, target)
+            if probe is not None:
+                # fora das métricas e do access log: (None, None) para o serve_connection
+                _send_and_close(conn, probe)
+                return None, None, 0
+            req = to_request(method, target, version, headers, body, addr[0], is_secure)
+        with timing.phase("dispatch"):
+            resp = _rate_limited(req) or dispatch(req)
     except (TimeoutError, socket.timeout):
         # cliente conectou mas não enviou request completo a tempo
         if APP_LOG: APP_LOG.info("408 Request Timeout de %s", addr[0])
         resp = build_response(408, b"<!doctype html><meta charset='utf-8'><h1>408 Request Timeout</h1>")        
+    except BodyTooLarge as e:
+        if APP_LOG: APP_LOG.info("413 de %s: corpo acima de %d bytes em %s", addr[0], MAX_BODY, e.target)
+        resp = body_too_large(urlsplit(e.target).path, MAX_BODY)
+        with timing.phase("send"):
+            return req, resp, _send_and_linger(conn, resp)
     except ValueError as e:
         if APP_LOG: APP_LOG.info("400 Bad Request de %s: %s", addr[0], e)
         resp = build_response(400, f"<h1>400 Bad Request</h1><p>{e}</p>".encode("utf-8"))
     except Exception as e:
         if APP_LOG: APP_LOG.exception("Erro inesperado atendendo %s", addr[0])
         resp = build_response(400, b"<h1>400 Bad Request</h1>")
+    if isinstance(resp.body, EventStream):
+        # SSE: head e eventos saem pelo hub (não bloqueante); este worker volta ao pool
+        lim, ip = CONN_LIMITER, addr[0]
+        SSE_HUB.attach(conn, resp.head(), resp.body,
+                       on_close=(lambda: lim.release(ip)) if lim else None)
+        return req, resp, 0
+    with timing.phase("send"):
+        sent = _send_and_close(conn, resp)
+    return req, resp, sent
+
+def _send_and_close(conn: socket.socket, resp: Response) -> int:
+    sent = 0
     try:
-        conn.sendall(resp)
+        sent = send_response(conn, resp)
     except Exception:
         pass
     finally:
@@ -192,30 +405,419 @@ def serve_connection(conn: socket.socket, addr: tuple[str, int], is_secure: bool
         except Exception:
             pass
         conn.close()
-        # Access log (só depois de enviar)
+    return sent
+
+def _send_and_linger(conn: socket.socket, resp: Response) -> int:
+    """Envia e fecha só depois de descartar o que o cliente ainda manda (até LINGER_TIME):
+    fechar com o corpo não lido gera RST, e o cliente perde a resposta antes de lê-la."""
+    sent = 0
+    try:
+        sent = send_response(conn, resp)
+        conn.shutdown(socket.SHUT_WR)
+        deadline = time.monotonic() + LINGER_TIME
+        while _recv_until(conn, 65536, deadline):
+            pass
+    except Exception:
+        pass
+    finally:
+        conn.close()
+    return sent
+
+def _access_log(addr: tuple[str, int], req: Request | None, resp: Response | None, sent: int) -> None:
+    """Access log (só depois de enviar)."""
+    if not ACC_LOG or resp is None:
+        return
+    try:
+        status, clen = resp.status, sent
+        ua = (req.headers.get("user-agent") if req else "-") or "-"
+        # Formato: IP "METHOD PATH VERSION" status bytes UA
+        ACC_LOG.info('%s "%s %s %s" %d %d "%s"',
+                     addr[0],
+                     req.method if req else "-",
+                     req.path if req else "-",
+                     req.version if req else "-",
+                     status, clen, ua)
+    except Exception:
+        pass
+
+def _apply_runtime_settings(cfg: Settings) -> None:
+    """Aplica o que pode mudar sem reiniciar (boot e SIGHUP): logs, limites e prazos."""
+    global APP_LOG, ACC_LOG, RATE_LIMITER, CONN_LIMITER
+    global HEADER_TIMEOUT, BODY_MIN_RATE, BODY_GRACE, RETRY_AFTER, SLOW_REQUEST_MS
+    APP_LOG, ACC_LOG = setup_logging(cfg.logging)
+    if not cfg.ratelimit.enabled:
+        RATE_LIMITER = None
+    elif RATE_LIMITER is None:
+        RATE_LIMITER = RateLimiter(cfg.ratelimit, shared=shm.table("ratelimit"))
+    else:
+        # mantém os baldes: um limiter novo devolveria o burst inteiro a todo IP
+        RATE_LIMITER.configure(cfg.ratelimit)
+    if cfg.server.max_conns_per_ip <= 0:
+        CONN_LIMITER = None
+    elif CONN_LIMITER is None:
+        CONN_LIMITER = ConnectionLimiter(cfg.server.max_conns_per_ip, shared=shm.table("conns"))
+    else:
+        # mantém as contagens das conexões já abertas
+        CONN_LIMITER.max_per_ip = cfg.server.max_conns_per_ip
+    HEADER_TIMEOUT = cfg.server.header_timeout
+    BODY_MIN_RATE = cfg.server.body_min_rate
+    BODY_GRACE = cfg.server.body_grace
+    RETRY_AFTER = cfg.server.retry_after
+    SLOW_REQUEST_MS = cfg.diagnostics.slow_request_ms
+    PROFILER.top_n = cfg.diagnostics.profile_top
+    PROFILER.out_dir = PROJECT_ROOT / cfg.diagnostics.profile_dir
+    staticserve.configure(cfg.static)
+    RESPONSE_CACHE.enabled = cfg.cache.enabled
+    RESPONSE_CACHE.max_bytes = cfg.cache.max_bytes
+    FLIGHT.timeout = cfg.cache.coalesce_timeout
+    snapshot.enabled = cfg.cache.prerender
+
+def _reload(old: Settings) -> Settings:
+    """SIGHUP: relê config.json, manifesto de estáticos e templates. Endereço/TLS/workers só mudam com restart."""
+    try:
+        cfg = load_settings()
+    except Exception:
+        if APP_LOG: APP_LOG.exception("SIGHUP: config.json inválido; mantendo o atual")
+        return old
+    _apply_runtime_settings(cfg)
+    staticserve.build_index()
+    clear_template_cache()
+    preload_templates()
+    RESPONSE_CACHE.clear()  # páginas guardadas foram renderizadas com os templates antigos
+    snapshot.rebuild()
+    if (cfg.server.host, cfg.server.port, cfg.tls, cfg.server.workers) != (old.server.host, old.server.port, old.tls, old.server.workers):
+        if APP_LOG: APP_LOG.warning("SIGHUP: host/porta/TLS/workers mudaram; isso exige restart (ou upgrade via SIGUSR2)")
+    if APP_LOG: APP_LOG.info("SIGHUP: configuração e templates recarregados")
+    return cfg
+
+def _open_listener(host: str, port: int, backlog: int) -> socket.socket:
+    """Socket de escuta: herdado do processo anterior (upgrade) ou criado do zero."""
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is not None:
+        srv = socket.socket(fileno=int(fd))
+        if APP_LOG: APP_LOG.info("Socket de escuta herdado (fd=%s)", fd)
+        return srv
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind((host, port))
+    srv.listen(backlog)
+    return srv
+
+def _notify_ready() -> None:
+    """Avisa o processo pai (upgrade) que já estamos aceitando conexões."""
+    fd = os.environ.pop(READY_FD_ENV, None)
+    if fd is None:
+        return
+    try:
+        os.write(int(fd), b"1")
+        os.close(int(fd))
+    except OSError:
+        pass
+
+def _spawn_successor(srv: socket.socket, timeout: float) -> bool:
+    """
+    SIGUSR2: sobe um processo novo (código/config novos) que herda o socket de escuta.
+    True quando o filho avisou que está pronto; aí este processo só drena e sai.
+    Conexões que chegam no meio ficam na fila do kernel e o filho as aceita.
+    """
+    import subprocess, sys, select
+    lfd = srv.fileno()
+    rfd, wfd = os.pipe()
+    env = dict(os.environ, **{LISTEN_FD_ENV: str(lfd), READY_FD_ENV: str(wfd)})
+    try:
+        child = subprocess.Popen([sys.executable, "-m", "app.server"], cwd=PROJECT_ROOT,
+                                 env=env, pass_fds=(lfd, wfd))
+    except OSError:
+        if APP_LOG: APP_LOG.exception("Upgrade: falha ao iniciar o novo processo")
+        os.close(rfd); os.close(wfd)
+        return False
+    os.close(wfd)
+    try:
+        ready, _, _ = select.select([rfd], [], [], timeout)
+        ok = bool(ready) and os.read(rfd, 1) == b"1"
+    finally:
+        os.close(rfd)
+    if ok:
+        if APP_LOG: APP_LOG.info("Upgrade: novo processo pid=%d pronto; drenando este", child.pid)
+    else:
+        if APP_LOG: APP_LOG.error("Upgrade: novo processo pid=%d não ficou pronto; seguimos atendendo", child.pid)
+        child.terminate()
+    return ok
+
+def _install_signal_handlers() -> None:
+    import signal
+    def _set(ev: threading.Event):
+        return lambda signum, frame: ev.set()
+    signal.signal(signal.SIGTERM, _set(_STOP))
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, _set(_RELOAD))
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, _set(_UPGRADE))
+    if hasattr(signal, "SIGUSR1"):
+        # liga/desliga o profiler (no loop: ao desligar grava arquivos e loga)
+        signal.signal(signal.SIGUSR1, _set(_PROFILE))
+
+def _open_shared(cfg: Settings) -> str | None:
+    """
+    Tabelas em memória compartilhada (ver app/shm.py) ligadas aos módulos. Retorna o erro, se houver.
+    Só com mais de um processo (ou shared.enabled): com um só, cada operação
+    pagaria lockf + lock de thread sem ninguém do outro lado.
+    """
+    if not (cfg.shared.enabled or cfg.server.processes > 1):
+        return None
+    try:
+        shm.open_tables(cfg.shared.slots)
+    except (OSError, ValueError) as e:
+        # sem /dev/shm (ou segmento estranho): cada processo fica com o seu estado
+        shm.close_tables(unlink=False)
+        return str(e)
+    sessions.use_shared(shm.table("sessions"))
+    metrics.share_counters(shm.table("counters"))
+    pubsub.bridge(shm.table("topics"))
+    return None
+
+def _shared_sync() -> None:
+    """Thread do estado compartilhado: traz avisos de outros processos e empurra os contadores."""
+    n = 0
+    while True:
+        time.sleep(SHARED_POLL)
+        n += 1
         try:
-            status, clen = _parse_status_and_cl(resp)
-            ua = (req.headers.get("user-agent") if 'req' in locals() else "-") or "-"
-            if ACC_LOG:
-                # Formato: IP "METHOD PATH VERSION" status bytes UA
-                ACC_LOG.info('%s "%s %s %s" %d %d "%s"',
-                             addr[0],
-                             req.method if 'req' in locals() else "-",
-                             req.path if 'req' in locals() else "-",
-                             req.version if 'req' in locals() else "-",
-                             status, clen, ua)
+            pubsub.poll_remote()
+            if n % 5 == 0:
+                metrics.flush()
         except Exception:
-            pass
+            if APP_LOG: APP_LOG.exception("Falha sincronizando o estado compartilhado")
+
+def _reap(children: dict[int, float]) -> list[tuple[int, int, float]]:
+    """Recolhe filhos que saíram: [(pid, código de saída, quando subiu)]."""
+    out = []
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            break
+        started = children.pop(pid, None)
+        if started is not None:  # outro filho (ex.: sucessor do upgrade) não é nosso
+            out.append((pid, os.waitstatus_to_exitcode(status), started))
+            # morreu segurando conexões (crash, SIGKILL): devolve as contagens por IP
+            freed = CONN_LIMITER.forget_process(pid) if CONN_LIMITER else 0
+            if freed and APP_LOG:
+                APP_LOG.warning("Processo pid=%d saiu com %d conexão(ões) contadas; liberadas", pid, freed)
+    return out
+
+def _supervise(srv: socket.socket, cfg: Settings, serve: Callable[[], str]) -> str:
+    """
+    Pre-fork (server.processes > 1): este processo só cuida dos filhos. Cada
+    filho roda o loop de accept inteiro (pool, hub SSE, varredura de estáticos)
+    no mesmo socket de escuta e o kernel reparte as conexões. Filho que morre é
+    reposto; SIGHUP e SIGUSR1 (profiler) são repassados; SIGUSR2 (upgrade) e o SIGTERM ficam com o mestre.
+    """
+    import signal
+    children: dict[int, float] = {}  # pid -> quando subiu
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+                serve()
+            except BaseException:
+                code = 1
+                if APP_LOG: APP_LOG.exception("Processo pid=%d caiu", os.getpid())
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    for _ in range(cfg.server.processes):
+        spawn()
+    if APP_LOG: APP_LOG.info("Pre-fork: %d processos atendendo (%s)", len(children), ", ".join(map(str, children)))
+    _notify_ready()
+    reason = "SIGTERM"
+    try:
+        while not _STOP.wait(0.2):
+            for pid, code, started in _reap(children):
+                if APP_LOG: APP_LOG.warning("Processo pid=%d saiu (código %d); repondo", pid, code)
+                if time.monotonic() - started < 1.0:
+                    time.sleep(1.0)  # caindo logo ao subir: não vira laço de fork
+                spawn()
+            if _RELOAD.is_set():
+                _RELOAD.clear()
+                cfg = _reload(cfg)
+                for pid in children:
+                    os.kill(pid, signal.SIGHUP)
+            if _PROFILE.is_set():
+                _PROFILE.clear()
+                for pid in children:
+                    os.kill(pid, signal.SIGUSR1)
+            if _UPGRADE.is_set():
+                _UPGRADE.clear()
+                if _spawn_successor(srv, cfg.server.drain_timeout):
+                    reason = "upgrade"
+                    break
+    except KeyboardInterrupt:
+        reason = "KeyboardInterrupt"
+    finally:
+        srv.close()
+        for pid in children:
+            try: os.kill(pid, signal.SIGTERM)
+            except OSError: pass
+        deadline = time.monotonic() + cfg.server.drain_timeout + 2.0
+        while children and time.monotonic() < deadline:
+            _reap(children)
+            time.sleep(0.1)
+        for pid in list(children):
+            if APP_LOG: APP_LOG.warning("Processo pid=%d não terminou o drain; SIGKILL", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+    return reason
+
+def _serve_loop(srv: socket.socket, cfg: Settings, tls_ctx: "ssl.SSLContext | None",
+                min_workers: int, max_workers: int, *, supervised: bool = False) -> str:
+    """Loop de accept de UM processo: pool de workers até SIGTERM/upgrade, depois drena. Retorna o motivo."""
+    use_tls = tls_ctx is not None
+
+    def _expired(conn, addr, _sec):
+        # esperou demais na fila: o cliente provavelmente já desistiu
+        try:
+            _shed(conn, addr, 503, RETRY_AFTER, "tempo de fila esgotado", can_block=True)
+        finally:
+            if CONN_LIMITER: CONN_LIMITER.release(addr[0])
+
+    pool = WorkerPool(
+        _serve_and_release,
+        min_workers=min_workers,
+        max_workers=max_workers,
+        queue_size=cfg.server.queue_size,
+        queue_timeout=cfg.server.queue_timeout,
+        on_expired=_expired,
+        target_wait=cfg.server.target_queue_wait,
+    )
+
+    global H2_POOL
+    if use_tls and cfg.tls.http2:
+        H2_POOL = WorkerPool(
+            lambda run, _expire: run(),
+            min_workers=min(2, max_workers),
+            max_workers=max_workers,
+            queue_size=cfg.server.queue_size,
+            queue_timeout=cfg.server.queue_timeout,
+            on_expired=lambda _run, expire: expire(),
+            target_wait=cfg.server.target_queue_wait,
+            name="brasa_h2",
+            metrics_prefix="h2_",
+        )
+
+    # threads só aqui: no pre-fork, o mestre não pode ter nenhuma antes do fork
+    pool.start()
+    if H2_POOL is not None:
+        H2_POOL.start()
+    SSE_HUB.start()
+    staticserve.start_rescan()
+    if shm.table("topics") is not None:
+        threading.Thread(target=_shared_sync, name="brasa_shared", daemon=True).start()
+    if not supervised:
+        _notify_ready()
+    global _PHASE
+    _PHASE = "ready"
+    reason = "SIGTERM"
+    try:
+        while not _STOP.is_set():
+            if _RELOAD.is_set():
+                _RELOAD.clear()
+                cfg = _reload(cfg)
+            if _PROFILE.is_set():
+                _PROFILE.clear()
+                PROFILER.toggle()
+            if _UPGRADE.is_set():
+                _UPGRADE.clear()
+                if _spawn_successor(srv, cfg.server.drain_timeout):
+                    reason = "upgrade"
+                    break
+            try:
+                conn, addr = srv.accept()
+            except socket.timeout:
+                continue
+            try:
+                # head e corpo saem em envios separados no TLS: sem Nagle segurando o segundo
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+            if use_tls:
+                # handshake fica para o worker (com prazo); aqui só embrulha
+                try:
+                    conn = tls_ctx.wrap_socket(conn, server_side=True, do_handshake_on_connect=False)
+                except (ssl.SSLError, OSError) as e:
+                    if APP_LOG: APP_LOG.info("Falha preparando TLS de %s: %s", addr[0], e)
+                    try: conn.close()
+                    except Exception: pass
+                    continue
+            if CONN_LIMITER and not CONN_LIMITER.acquire(addr[0]):
+                _shed(conn, addr, 429, RETRY_AFTER, "conexões simultâneas demais deste IP")
+                continue
+            if not pool.submit(conn, addr, use_tls):
+                if CONN_LIMITER: CONN_LIMITER.release(addr[0])
+                _shed(conn, addr, 503, RETRY_AFTER, f"fila cheia ({pool.depth()})")
+    except KeyboardInterrupt:
+        reason = "KeyboardInterrupt"
+    finally:
+        # para de aceitar já; o que está na fila/em andamento tem drain_timeout para terminar
+        _PHASE = "draining"
+        srv.close()
+        if not supervised:
+            print("\nEncerrando BrasaHTTP...")
+        if APP_LOG: APP_LOG.info("Encerrando por %s: drenando até %.0fs", reason, cfg.server.drain_timeout)
+        SSE_HUB.close_all()  # streams SSE não terminam sozinhos; o navegador reconecta
+        drain_until = time.monotonic() + cfg.server.drain_timeout
+        left = pool.shutdown(timeout=cfg.server.drain_timeout)
+        if H2_POOL is not None:
+            # depois das conexões: até a última, os streams dela precisam de quem os rode
+            left += H2_POOL.shutdown(timeout=max(0.5, drain_until - time.monotonic()))
+        if left and APP_LOG:
+            APP_LOG.warning("Drain esgotado: %d worker(s) ainda ocupados foram abandonados", left)
+        metrics.flush()
+    return reason
+
+def _warm_up() -> None:
+    """
+    Primeiro request sem custo de boot: templates compilados, mimetypes, chave
+    de sessão + HMAC/JSON e leituras quentes do SQLite. Roda antes do fork do
+    pre-fork, então os filhos já nascem aquecidos.
+    """
+    mimetypes.init()
+    preload_templates()
+    sessions.verify_token(sessions.issue_token({"warm": 1}, 60))
+    warm_up_db()
 
 def serve_forever():
-    from app.db import init_db
-    cfg = load_settings()
-    app_log, acc_log = setup_logging(cfg.logging)
-    global APP_LOG, ACC_LOG
-    APP_LOG, ACC_LOG = app_log, acc_log
+    global ssl
+    report = timing.StartupReport(_BOOT_T0)
+    report.mark("imports", _BOOT_T0)
+    with report.step("config"):
+        cfg = load_settings()
+        shared_error = _open_shared(cfg)
+        _apply_runtime_settings(cfg)
+    if shared_error and APP_LOG:
+        APP_LOG.warning("Estado compartilhado indisponível (%s); cada processo fica com o seu", shared_error)
 
-    init_db()
-    init_routes()
+    with report.step("db"):
+        init_db()
+    with report.step("routes"):
+        init_routes()
+    with report.step("static"):
+        staticserve.build_index()
+    # depois do índice: as páginas embutem as URLs com hash dos assets
+    with report.step("snapshots"):
+        n = snapshot.rebuild()
+    if APP_LOG: APP_LOG.info("Snapshots: %d página(s) pré-renderizada(s) %s", n, " ".join(snapshot.paths()))
+    with report.step("warmup"):
+        _warm_up()
 
     use_tls = cfg.tls.enabled
     host = cfg.server.host
@@ -224,38 +826,48 @@ def serve_forever():
 
     tls_ctx = None
     if use_tls:
-        tls_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        tls_ctx.minimum_version = ssl.TLSVersion.TLSv1_2
-        tls_ctx.load_cert_chain(certfile=cfg.tls.cert_file, keyfile=cfg.tls.key_file)
-        # ciphers e opções adicionais poderiam ser ajustados aqui
+        with report.step("tls"):
+            import ssl
+            tls_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            tls_ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+            tls_ctx.load_cert_chain(certfile=cfg.tls.cert_file, keyfile=cfg.tls.key_file)
+            # ALPN: h2 quando o cliente oferece, senão HTTP/1.1
+            tls_ctx.set_alpn_protocols(["h2", "http/1.1"] if cfg.tls.http2 else ["http/1.1"])
+            # ciphers e opções adicionais poderiam ser ajustados aqui
+
+    if cfg.server.workers > 0:
+        min_workers = max_workers = cfg.server.workers
+    else:
+        max_workers = cfg.server.max_workers or MAX_WORKERS
+        min_workers = min(cfg.server.min_workers, max_workers)
+    # cada conexão h2 com SSE prende um worker: sobra pool para o resto do tráfego
+    h2.LIVE_CONN_LIMIT = cfg.tls.h2_live_max or max(1, max_workers // 4)
 
     if APP_LOG:
-        APP_LOG.info("Iniciando BrasaHTTP em %s://%s:%d (workers=%d)",
-                     "https" if use_tls else "http", host, port, MAX_WORKERS)
+        APP_LOG.info("Iniciando BrasaHTTP em %s://%s:%d (processos=%d, workers=%d..%d, fila=%d, pid=%d)",
+                     "https" if use_tls else "http", host, port, max(1, cfg.server.processes),
+                     min_workers, max_workers, cfg.server.queue_size, os.getpid())
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv:
-        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        srv.bind((host, port))
-        srv.listen(backlog)
-        print(f"BrasaHTTP escutando em {'https' if use_tls else 'http'}://{host}:{port} (CTRL+C para sair)")
-        if APP_LOG: APP_LOG.info("Servidor iniciado e escutando")
+    _install_signal_handlers()
+    with report.step("listen"):
+        srv = _open_listener(host, port, backlog)
+    # accept com timeout curto: o loop confere os sinais (SIGTERM/SIGHUP/SIGUSR2) entre um accept e outro
+    srv.settimeout(0.5)
+    metrics.set_gauge("startup_ms", round(report.total_ms(), 1))
+    if APP_LOG: APP_LOG.info("Startup em %.1fms: %s", report.total_ms(), report.summary())
+    print(f"BrasaHTTP escutando em {'https' if use_tls else 'http'}://{host}:{port} (CTRL+C para sair)")
+    if APP_LOG: APP_LOG.info("Servidor iniciado e escutando")
 
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="brasa") as pool:
-            try:
-                while True:
-                    conn, addr = srv.accept()
-                    if use_tls:
-                        try:
-                            conn = tls_ctx.wrap_socket(conn, server_side=True)
-                        except ssl.SSLError as e:
-                            if APP_LOG: APP_LOG.info("Falha no handshake TLS de %s: %s", addr[0], e)
-                            try: conn.close()
-                            except Exception: pass
-                            continue
-                    pool.submit(serve_connection, conn, addr, use_tls)
-            except KeyboardInterrupt:
-                print("\nEncerrando BrasaHTTP...")
-                if APP_LOG: APP_LOG.info("Encerrando por KeyboardInterrupt")
+    reason = "SIGTERM"
+    try:
+        if cfg.server.processes > 1:
+            reason = _supervise(srv, cfg, lambda: _serve_loop(srv, cfg, tls_ctx, min_workers, max_workers, supervised=True))
+            print("\nEncerrando BrasaHTTP...")
+        else:
+            reason = _serve_loop(srv, cfg, tls_ctx, min_workers, max_workers)
+    finally:
+        # no upgrade o sucessor segue usando as mesmas tabelas
+        shm.close_tables(unlink=reason != "upgrade")
 
 
 if __name__ == "__main__":
@@ -1,22 +1,38 @@
-import os, hmac, hashlib, time, json, secrets, base64
+import os, hmac, hashlib, time, json, secrets, base64, heapq, threading
+from collections import OrderedDict
 from pathlib import Path
 from email.utils import formatdate
 
 SECRET_PATH = Path(__file__).resolve().parent.parent / "config" / "secret.key"
 COOKIE_NAME = "brasa_sess"
 
+VERIFY_CACHE_SIZE = 1024   # tokens assinados já verificados (LRU)
+REVOKED_LOCAL_SIZE = 10_000  # revogados guardados em memória sem o estado compartilhado
+STORE_MIN_BYTES = 1024     # payload JSON acima disso vai para o store no servidor
+STORE_MEM_SIZE = 4096      # sessões do store mantidas em memória (o resto fica no SQLite)
+SID_PREFIX = "s."          # token de sessão no servidor: "s.<id aleatório>"
+
 def _ensure_secret() -> bytes:
     """Lê (ou cria) um segredo persistente para assinar tokens"""
     SECRET_PATH.parent.mkdir(parents=True, exist_ok=True)
     if SECRET_PATH.exists():
         return SECRET_PATH.read_bytes()
     key = secrets.token_bytes(32)
-    SECRET_PATH.write_bytes(key)
+    tmp = SECRET_PATH.with_name(f"{SECRET_PATH.name}.{os.getpid()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
     try:
-        os.chmod(SECRET_PATH, 0o600)
-    except Exception:
-        pass
-    return key 
+        os.write(fd, key)
+    finally:
+        os.close(fd)
+    try:
+        # link() falha se já existe: com vários processos subindo juntos só um
+        # segredo vale, e ninguém lê um arquivo pela metade
+        os.link(tmp, SECRET_PATH)
+    except FileExistsError:
+        key = SECRET_PATH.read_bytes()
+    finally:
+        os.unlink(tmp)
+    return key
 
 _SECRET = None
 def get_secret() -> bytes:
@@ -32,17 +48,184 @@ def _b64u_decode(s: str) -> bytes:
     pad = "=" * ((4 - len(s) % 4) % 4)
     return base64.urlsafe_b64decode((s + pad).encode("ascii"))
 
+class _VerifiedCache:
+    """
+    LRU limitado de tokens já verificados -> (payload, exp).
+    Quando enche, primeiro saem os vencidos (heap por expiração), depois o menos usado.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: OrderedDict[str, tuple[dict, int]] = OrderedDict()
+        self._by_exp: list[tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> dict | None:
+        with self._lock:
+            hit = self._items.get(token)
+            if hit is None:
+                return None
+            data, exp = hit
+            if time.time() > exp:
+                del self._items[token]
+                return None
+            self._items.move_to_end(token)
+        return dict(data)  # cópia rasa: handler não altera o cache
+
+    def put(self, token: str, data: dict, exp: int) -> None:
+        with self._lock:
+            if token not in self._items and len(self._items) >= self.maxsize:
+                self._evict(int(time.time()))
+            self._items[token] = (data, exp)
+            self._items.move_to_end(token)
+            heapq.heappush(self._by_exp, (exp, token))
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            self._items.pop(token, None)
+
+    def _evict(self, now: int) -> None:
+        # vencidos primeiro (entradas do heap podem estar obsoletas; conferimos o exp)
+        while self._by_exp and self._by_exp[0][0] < now:
+            exp, tok = heapq.heappop(self._by_exp)
+            hit = self._items.get(tok)
+            if hit is not None and hit[1] == exp:
+                del self._items[tok]
+        if len(self._items) >= self.maxsize:
+            self._items.popitem(last=False)
+        # heap não cresce sem limite com lixo de tokens já removidos
+        if len(self._by_exp) > 2 * self.maxsize:
+            self._by_exp = [(e, t) for (e, t) in self._by_exp if t in self._items]
+            heapq.heapify(self._by_exp)
+
+_verified = _VerifiedCache(VERIFY_CACHE_SIZE)
+
+class _LocalRevoked:
+    """Revogados deste processo: chave -> expiração, limitado (saem primeiro os que vencem antes)."""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._exp: dict[str, float] = {}
+        self._by_exp: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, key: str, exp: float) -> None:
+        with self._lock:
+            self._exp[key] = exp
+            heapq.heappush(self._by_exp, (exp, key))
+            now = time.time()
+            while self._by_exp and (self._by_exp[0][0] <= now or len(self._exp) > self.maxsize):
+                e, k = heapq.heappop(self._by_exp)
+                if self._exp.get(k) == e:
+                    del self._exp[k]
+            if len(self._by_exp) > 2 * self.maxsize:
+                self._by_exp = [(e, k) for k, e in self._exp.items()]
+                heapq.heapify(self._by_exp)
+
+    def __contains__(self, key: str) -> bool:
+        exp = self._exp.get(key)
+        return exp is not None and exp > time.time()
+
+# Tokens revogados (logout) até o token expirar. Chave: a assinatura do token
+# (ou o próprio "s.<id>"). Com o estado compartilhado ligado ficam na memória
+# compartilhada (o cache acima é por processo e aceitaria o token em outro
+# processo); sem ele, em _local_revoked.
+_revoked = None
+_local_revoked = _LocalRevoked(REVOKED_LOCAL_SIZE)
+REVOKED_SID_TTL = 30 * 86400   # sessão no store: expiração não está no token
+
+def use_shared(table) -> None:
+    """Liga a lista de revogados compartilhada (shm.SharedTable)."""
+    global _revoked
+    _revoked = table
+
+def _revocation_key(token: str) -> str:
+    return token if token.startswith(SID_PREFIX) else "m." + token.rpartition(".")[2]
+
+def _is_revoked(token: str) -> bool:
+    key = _revocation_key(token)
+    if _revoked is not None:
+        return _revoked.get(key) is not None
+    return key in _local_revoked
+
+class SessionStore:
+    """
+    Sessões do lado do servidor para payloads grandes: o cookie leva só um id curto.
+    Memória (LRU) na frente, SQLite como persistência (sobrevive a restart).
+    """
+    def __init__(self, mem_size: int = STORE_MEM_SIZE):
+        self.mem_size = mem_size
+        self._mem: OrderedDict[str, tuple[dict, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, payload: dict, max_age: int) -> str:
+        from app.db import save_session
+        sid = secrets.token_urlsafe(18)
+        exp = int(time.time()) + max_age
+        save_session(sid, json.dumps(payload, separators=(",", ":"), ensure_ascii=False), exp)
+        self._remember(sid, payload, exp)
+        return sid
+
+    def get(self, sid: str) -> dict | None:
+        with self._lock:
+            hit = self._mem.get(sid)
+            if hit is not None:
+                self._mem.move_to_end(sid)
+        if hit is None:
+            from app.db import load_session
+            row = load_session(sid)
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            if not isinstance(data, dict):
+                return None
+            hit = (data, int(row[1]))
+            self._remember(sid, *hit)
+        data, exp = hit
+        if time.time() > exp:
+            self.delete(sid)
+            return None
+        return dict(data)
+
+    def delete(self, sid: str) -> None:
+        from app.db import delete_session
+        with self._lock:
+            self._mem.pop(sid, None)
+        delete_session(sid)
+
+    def _remember(self, sid: str, data: dict, exp: int) -> None:
+        with self._lock:
+            self._mem[sid] = (data, exp)
+            self._mem.move_to_end(sid)
+            while len(self._mem) > self.mem_size:
+                self._mem.popitem(last=False)
+
+store = SessionStore()
+
 def issue_token(payload: dict, max_age: int = 7200) -> str:
-    """Cria token: base64url(data) . base64url(exp) . base64url(hmac)."""
+    """
+    Cria token: base64url(data) . base64url(exp) . base64url(hmac).
+    Payload grande (> STORE_MIN_BYTES) vai para o store e o token vira "s.<id>".
+    """
     now = int(time.time())
     exp = now + max_age
     data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(data) > STORE_MIN_BYTES:
+        return SID_PREFIX + store.create(payload, max_age)
     head = _b64u_encode(data) + "." + _b64u_encode(str(exp).encode("ascii"))
     mac = hmac.new(get_secret(), head.encode("ascii"), hashlib.sha256).digest()
     return head + "." + _b64u_encode(mac)
 
 def verify_token(token: str) -> dict | None:
     """Valida assinatura e expiração. Retorna payload (dict) ou None."""
+    if _is_revoked(token):
+        return None
+    if token.startswith(SID_PREFIX):
+        try:
+            return store.get(token[len(SID_PREFIX):])
+        except Exception:
+            return None
+    cached = _verified.get(token)
+    if cached is not None:
+        return cached
     try:
         part_data, part_exp, part_mac = token.split(".", 3)
         head = part_data + "." + part_exp
@@ -54,9 +237,37 @@ def verify_token(token: str) -> dict | None:
         if time.time() > exp:
             return None
         data = json.loads(_b64u_decode(part_data).decode("utf-8"))
-        return data if isinstance(data, dict) else None
+        if not isinstance(data, dict):
+            return None
+        _verified.put(token, data, exp)
+        return dict(data)
     except Exception:
         return None
+
+def revoke_token(token: str) -> None:
+    """
+    Token deixa de valer até expirar (e, se for sessão no servidor, sai do store). Com estado compartilhado, em todos os processos.
+    Só token válido entra na lista: um cookie forjado com exp distante não ocupa
+    lugar (nem empurra para fora as revogações de verdade).
+    """
+    if verify_token(token) is None:
+        return  # inválido, vencido ou já revogado: nunca seria aceito mesmo
+    _verified.discard(token)
+    if token.startswith(SID_PREFIX):
+        ttl = REVOKED_SID_TTL
+        try:
+            store.delete(token[len(SID_PREFIX):])
+        except Exception:
+            pass
+    else:
+        # assinatura já conferida: o exp do token é o verificado
+        ttl = int(_b64u_decode(token.split(".")[1]).decode("ascii")) - time.time()
+    if ttl <= 0:
+        return
+    if _revoked is not None:
+        _revoked.set(_revocation_key(token), 1.0, ttl=ttl)
+    else:
+        _local_revoked.add(_revocation_key(token), time.time() + ttl)
     
 def build_set_cookie(name: str, value: str, *, path="/", http_only=True, secure=False, same_site="Lax", max_age: int | None = None, expires_ts: int | None = None) -> str:
     """Monta um header Set-Cookie canônico."""
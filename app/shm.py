@@ -0,0 +1,274 @@
+"""
+Estado compartilhado entre processos em multiprocessing.shared_memory.
+
+Com mais de um processo atendendo (server.processes > 1, ou o antigo e o novo
+durante um upgrade), estado em memória do Python fica um por processo:
+contadores divergem, logout num processo não vale no outro, o rate limit
+multiplica. Aqui esse estado quente mora num segmento de memória compartilhada,
+sem ida ao SQLite.
+
+Formato de uma SharedTable: cabeçalho + `buckets` baldes de WAYS slots fixos
+(hash "set-associative"). Slot = chave (até KEY_BYTES, ou hash se maior) +
+dois doubles (a, b) + expiração (epoch). Chave nova num balde cheio toma o slot
+vencido ou, sem vencidos, o que vence primeiro — o tamanho nunca cresce.
+
+Atomicidade: cada balde pertence a uma faixa de lock (LOCK_STRIPES). Travar
+uma faixa = threading.Lock (threads deste processo; lockf é por processo) +
+fcntl.lockf de 1 byte num arquivo de lock (outros processos, inclusive um
+sucessor via exec). Toda operação é um lê-modifica-grava dentro dessa trava.
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Iterator
+
+WAYS = 8                 # slots por balde
+LOCK_STRIPES = 64        # faixas de lock por tabela
+KEY_BYTES = 48           # chave maior que isso é guardada como hash
+SHM_NAME_ENV = "BRASA_SHM_NAME"  # sucessor (upgrade) anexa ao mesmo estado
+
+_MAGIC = b"BRSHM1"
+_HEADER = struct.Struct("<6s2xII")            # magic, baldes, slots por balde
+_SLOT = struct.Struct(f"<{KEY_BYTES}sddd")     # chave, a, b, expira_em (epoch)
+_EMPTY = bytes(KEY_BYTES)
+
+Updater = Callable[[float | None, float | None], tuple[float | None, float | None, object]]
+PairUpdater = Callable[[float | None, float | None, float | None, float | None],
+                       tuple[float | None, float | None, float | None, float | None, object]]
+
+def _encode_key(key: str) -> bytes:
+    raw = key.encode("utf-8")
+    if len(raw) <= KEY_BYTES and not raw.startswith(b"\xff"):
+        return raw.ljust(KEY_BYTES, b"\0")
+    # longa demais: 0xff + blake2b (não dá para listar de volta, mas continua única)
+    return b"\xff" + hashlib.blake2b(raw, digest_size=32).digest() + bytes(KEY_BYTES - 33)
+
+class SharedTable:
+    def __init__(self, name: str, slots: int = 8192):
+        # adiados: multiprocessing custa ~10ms de import e só interessa com o estado compartilhado ligado
+        import tempfile
+        from multiprocessing import resource_tracker, shared_memory
+        self.name = name
+        buckets = max(1, slots // WAYS)
+        size = _HEADER.size + buckets * WAYS * _SLOT.size
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            _HEADER.pack_into(self._shm.buf, 0, _MAGIC, buckets, WAYS)
+            self.created = True
+        except FileExistsError:
+            # segmento já existe (processo anterior no upgrade): herda o estado
+            self._shm = shared_memory.SharedMemory(name=name)
+            magic, buckets, ways = _HEADER.unpack_from(self._shm.buf, 0)
+            if magic != _MAGIC or ways != WAYS:
+                self._shm.close()
+                raise ValueError(f"segmento {name!r} com formato desconhecido")
+            self.created = False
+        # o resource_tracker apagaria o segmento quando ESTE processo saísse,
+        # mesmo com outros (filhos, sucessor) usando; quem apaga é close(unlink=True)
+        try:
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        except Exception:
+            pass
+        self.buckets = buckets
+        self._buf = self._shm.buf
+        self._lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._lock_fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._tlocks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    # --- trava ---
+
+    def _acquire(self, bucket: int) -> int:
+        stripe = bucket % LOCK_STRIPES
+        self._lock_stripe(stripe)
+        return stripe
+
+    def _lock_stripe(self, stripe: int) -> None:
+        self._tlocks[stripe].acquire()
+        try:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, stripe)
+        except BaseException:
+            self._tlocks[stripe].release()
+            raise
+
+    def _release(self, stripe: int) -> None:
+        try:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, stripe)
+        finally:
+            self._tlocks[stripe].release()
+
+    def _locate(self, key: str) -> tuple[bytes, int, int]:
+        # crc32 e não hash(): precisa dar o mesmo balde em todo processo
+        k = _encode_key(key)
+        bucket = zlib.crc32(k) % self.buckets
+        return k, bucket, _HEADER.size + bucket * WAYS * _SLOT.size
+
+    # --- operações ---
+
+    def _slot(self, k: bytes, base: int, now: float) -> tuple[int, bool]:
+        """(offset, True) do slot vivo da chave, ou (offset, False) de onde ela entraria."""
+        buf = self._buf
+        free = victim = None
+        victim_exp = float("inf")
+        for i in range(WAYS):
+            off = base + i * _SLOT.size
+            sk, _a, _b, exp = _SLOT.unpack_from(buf, off)
+            if sk == k and exp > now:
+                return off, True
+            if free is None and (sk == _EMPTY or exp <= now):
+                free = off
+            elif exp < victim_exp:
+                victim, victim_exp = off, exp
+        # balde cheio: sai quem venceria primeiro
+        return (free if free is not None else victim), False
+
+    def _read(self, k: bytes, base: int, now: float) -> tuple[float | None, float | None]:
+        off, found = self._slot(k, base, now)
+        if not found:
+            return None, None
+        _sk, a, b, _exp = _SLOT.unpack_from(self._buf, off)
+        return a, b
+
+    def _write(self, k: bytes, base: int, now: float, a: float | None, b: float | None, ttl: float) -> None:
+        off, found = self._slot(k, base, now)
+        if a is not None:
+            _SLOT.pack_into(self._buf, off, k, a, b or 0.0, now + ttl)
+        elif found:
+            _SLOT.pack_into(self._buf, off, _EMPTY, 0.0, 0.0, 0.0)
+
+    def update(self, key: str, fn: Updater, ttl: float) -> object:
+        """
+        Lê-modifica-grava atômico entre threads e processos.
+        fn(a, b) recebe None, None se a chave não existe (ou venceu) e devolve
+        (novo_a, novo_b, resultado); novo_a None apaga a chave. O slot passa a
+        vencer em agora + ttl. Retorna o resultado de fn.
+        """
+        k, bucket, base = self._locate(key)
+        now = time.time()
+        stripe = self._acquire(bucket)
+        try:
+            a, b = self._read(k, base, now)
+            na, nb, res = fn(a, b)
+            self._write(k, base, now, na, nb, ttl)
+            return res
+        finally:
+            self._release(stripe)
+
+    def update_pair(self, key1: str, key2: str, fn: PairUpdater, ttl: float) -> object:
+        """
+        Como update(), mas para duas chaves de uma vez (as duas faixas travadas,
+        sempre em ordem crescente: sem deadlock entre processos).
+        fn(a1, b1, a2, b2) -> (novo_a1, novo_b1, novo_a2, novo_b2, resultado).
+        """
+        k1, bucket1, base1 = self._locate(key1)
+        k2, bucket2, base2 = self._locate(key2)
+        now = time.time()
+        stripes = sorted({bucket1 % LOCK_STRIPES, bucket2 % LOCK_STRIPES})
+        locked = []
+        try:
+            for stripe in stripes:
+                self._lock_stripe(stripe)
+                locked.append(stripe)
+            na1, nb1, na2, nb2, res = fn(*self._read(k1, base1, now), *self._read(k2, base2, now))
+            # uma escrita depois da outra: no mesmo balde, a segunda já vê o slot da primeira ocupado
+            self._write(k1, base1, now, na1, nb1, ttl)
+            self._write(k2, base2, now, na2, nb2, ttl)
+            return res
+        finally:
+            for stripe in reversed(locked):
+                self._release(stripe)
+
+    def get(self, key: str) -> tuple[float, float] | None:
+        k, bucket, base = self._locate(key)
+        now = time.time()
+        stripe = self._acquire(bucket)
+        try:
+            for i in range(WAYS):
+                sk, a, b, exp = _SLOT.unpack_from(self._buf, base + i * _SLOT.size)
+                if sk == k and exp > now:
+                    return a, b
+            return None
+        finally:
+            self._release(stripe)
+
+    def set(self, key: str, a: float, b: float = 0.0, ttl: float = 3600.0) -> None:
+        self.update(key, lambda _a, _b: (a, b, None), ttl)
+
+    def add(self, key: str, delta: float, ttl: float = 10 * 365 * 86400.0) -> float:
+        """Contador atômico: soma delta e devolve o novo valor."""
+        def fn(a, b):
+            n = (a or 0.0) + delta
+            return n, b, n
+        return self.update(key, fn, ttl)
+
+    def delete(self, key: str) -> None:
+        self.update(key, lambda a, b: (None, None, None), 0)
+
+    def items(self) -> Iterator[tuple[str, float, float]]:
+        """Varre a tabela (sem trava global: foto aproximada). Pula chaves guardadas como hash."""
+        now = time.time()
+        for bucket in range(self.buckets):
+            base = _HEADER.size + bucket * WAYS * _SLOT.size
+            for i in range(WAYS):
+                sk, a, b, exp = _SLOT.unpack_from(self._buf, base + i * _SLOT.size)
+                if sk != _EMPTY and exp > now and not sk.startswith(b"\xff"):
+                    yield sk.rstrip(b"\0").decode("utf-8", "replace"), a, b
+
+    def close(self, unlink: bool = False) -> None:
+        self._buf = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # alguma view ainda aberta; o mapeamento some com o processo
+        if unlink:
+            try:
+                # unlink() desregistra no resource_tracker; registra de volta para não dar KeyError lá
+                from multiprocessing import resource_tracker
+                resource_tracker.register(self._shm._name, "shared_memory")
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+            try:
+                os.unlink(self._lock_path)
+            except OSError:
+                pass
+        os.close(self._lock_fd)
+
+# --- tabelas do servidor ---
+
+_tables: dict[str, SharedTable] = {}
+
+def open_tables(slots: int) -> bool:
+    """
+    Cria (ou, no upgrade, anexa) as tabelas do servidor. O nome base vai para o
+    ambiente: um sucessor iniciado pelo SIGUSR2 herda e enxerga o mesmo estado.
+    Retorna True se este processo criou os segmentos.
+    """
+    base = os.environ.get(SHM_NAME_ENV) or f"brasa-{os.getpid()}"
+    os.environ[SHM_NAME_ENV] = base
+    sizes = {
+        "sessions": slots,       # tokens revogados
+        "ratelimit": slots,      # baldes por IP / IP + rota
+        "conns": slots // 2,     # conexões abertas por IP (total + anotação por processo)
+        "counters": 1024,        # contadores de metrics
+        "topics": 256,           # sequência por tópico do pubsub
+    }
+    created = False
+    for name, n in sizes.items():
+        t = _tables[name] = SharedTable(f"{base}-{name}", max(WAYS, n))
+        created = created or t.created
+    return created
+
+def table(name: str) -> SharedTable | None:
+    """Tabela pelo nome lógico (None com o estado compartilhado desligado)."""
+    return _tables.get(name)
+
+def close_tables(unlink: bool) -> None:
+    for t in _tables.values():
+        t.close(unlink=unlink)
+    _tables.clear()
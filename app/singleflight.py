@@ -0,0 +1,62 @@
+"""
+Single-flight: requests idênticos e simultâneos viram UMA execução.
+
+O primeiro a chegar com uma chave (o "líder") roda a função; quem chega com a
+mesma chave enquanto ela roda espera e recebe o mesmo resultado (ou a mesma
+exceção). Quem esperar mais que `timeout` desiste de esperar e roda sozinho —
+um líder travado não pode segurar todo mundo.
+"""
+import threading
+from typing import Any, Callable, Hashable
+
+from app import metrics
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """Retorna (resultado, compartilhado). compartilhado=True: veio da execução de outro."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if leader:
+            try:
+                call.result = fn()
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+                if call.waiters:
+                    metrics.inc("coalesced", call.waiters)
+        if not call.done.wait(self.timeout):
+            metrics.inc("coalesce_timeouts")
+            return fn(), False
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+FLIGHT = SingleFlight()
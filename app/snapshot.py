@@ -0,0 +1,125 @@
+"""
+Snapshots pré-renderizados das rotas marcadas com prerender=True (ver add_route).
+
+São páginas que, sem query string, só dependem de template: renderizadas uma
+vez — HTML + gzip nível 9 — e servidas direto da memória, sem handler, sem
+render_layout e sem passar pelo cache de respostas. Com query string o request
+segue o caminho normal (handler ao vivo).
+
+Refeitos no SIGHUP e quando a varredura de estáticos muda um hash (as páginas
+embutem as URLs dos assets). `python -m app.snapshot [DIR]` grava os mesmos
+arquivos em disco para o deploy (ex.: um proxy na frente com gzip_static).
+"""
+import gzip
+import hashlib
+import logging
+import sys
+from pathlib import Path
+from typing import Callable
+
+from app import metrics, pubsub
+from app.responses import Response, build_response
+
+GZIP_MIN = 512              # mesmo limiar do render_page
+SNAPSHOT_DIR = Path(__file__).resolve().parent.parent / "data" / "snapshot"
+
+_log = logging.getLogger("brasa.app")
+
+class _Snapshot:
+    __slots__ = ("plain", "gz", "etags")
+
+    def __init__(self, plain: Response, gz: Response | None):
+        self.plain = plain
+        self.gz = gz
+        self.etags = {plain.headers["ETag"], *((gz.headers["ETag"],) if gz else ())}
+
+# caminho -> função que renderiza a página (registrado pelo router)
+_renders: dict[str, Callable[[], Response]] = {}
+# caminho -> snapshot pronto; trocado inteiro a cada rebuild()
+_snaps: dict[str, _Snapshot] = {}
+enabled = True
+
+def register(path: str, render: Callable[[], Response]) -> None:
+    _renders[path] = render
+
+def rebuild() -> int:
+    """Renderiza de novo todas as páginas registradas. Retorna quantas ficaram prontas."""
+    global _snaps
+    snaps = {}
+    for path, render in list(_renders.items()):
+        try:
+            snap = _freeze(render())
+        except Exception:
+            _log.exception("Snapshot: falha renderizando %s; segue ao vivo", path)
+            continue
+        if snap is not None:
+            snaps[path] = snap
+    _snaps = snaps
+    return len(snaps)
+
+def serve(path: str, headers: dict) -> Response | None:
+    """Resposta pronta para GET `path` sem query (None = não há snapshot; renderize ao vivo)."""
+    snap = _snaps.get(path) if enabled else None
+    if snap is None:
+        return None
+    metrics.inc("snapshot_hits")
+    ae = headers.get("accept-encoding")
+    hit = snap.gz if snap.gz is not None and ae and "gzip" in ae.lower() else snap.plain
+    inm = headers.get("if-none-match")
+    if inm and any(t.strip().removeprefix("W/") in snap.etags for t in inm.split(",")):
+        return build_response(304, b"", extra_headers={k: v for k, v in hit.headers.items() if k in ("ETag", "Vary")})
+    return hit
+
+def paths() -> list[str]:
+    return sorted(_snaps)
+
+def _freeze(resp: Response) -> _Snapshot | None:
+    """Resposta do handler -> versões identidade e gzip, com ETag. Só 200 sem codificação."""
+    if resp.status != 200 or resp.chunked or not isinstance(resp.body, list) or "Content-Encoding" in resp.headers:
+        return None
+    body = resp.body_bytes()
+    tag = hashlib.sha256(body).hexdigest()[:16]
+    base = {k: v for k, v in resp.headers.items() if k not in ("Content-Length", "Vary")}
+    base["X-Cache"] = "SNAPSHOT"
+    if len(body) < GZIP_MIN:
+        return _Snapshot(Response(200, [body], dict(base, ETag=f'"{tag}"'), resp.content_type), None)
+    gz_body = gzip.compress(body, compresslevel=9, mtime=0)  # feito uma vez: vale o nível máximo
+    vary = {"Vary": "Accept-Encoding"}
+    plain = Response(200, [body], dict(base, ETag=f'"{tag}"', **vary), resp.content_type)
+    gz = Response(200, [gz_body], dict(base, ETag=f'"{tag}-gz"', **{"Content-Encoding": "gzip"}, **vary),
+                  resp.content_type)
+    return _Snapshot(plain, gz)
+
+# páginas embutem URLs de estáticos com hash (o templating já limpou o cache dele)
+pubsub.subscribe("static", lambda _names: rebuild())
+
+def write_dir(out: Path) -> list[Path]:
+    """Grava cada snapshot como <caminho>/index.html (+ .gz) em `out`."""
+    written = []
+    for path, snap in _snaps.items():
+        target = out / path.strip("/") / "index.html"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(snap.plain.body_bytes())
+        written.append(target)
+        if snap.gz is not None:
+            gz_target = target.with_name("index.html.gz")
+            gz_target.write_bytes(snap.gz.body_bytes())
+            written.append(gz_target)
+    return written
+
+def main(argv: list[str] | None = None) -> int:
+    # via -m este arquivo roda como __main__; o router registra em app.snapshot
+    from app import snapshot, staticserve
+    from app.router import init_routes
+    args = sys.argv[1:] if argv is None else argv
+    out = Path(args[0]) if args else SNAPSHOT_DIR
+    staticserve.build_index()   # URLs com hash dos assets
+    init_routes()
+    n = snapshot.rebuild()
+    for p in snapshot.write_dir(out):
+        print(p)
+    print(f"{n} página(s) em {out}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+Server-Sent Events (text/event-stream) sem prender um worker por conexão.
+
+- Channel: assina UM tópico do pubsub e formata cada mensagem uma única vez;
+  os bytes prontos vão para a fila de cada EventStream aberto.
+- EventStream: a fila de um cliente vista como iterável. next() devolve bytes,
+  None quando não há nada agora e StopIteration quando fechou; nunca bloqueia.
+- SSEHub: UMA thread com selectors bombeia os EventStreams das conexões
+  HTTP/1.1. O worker lê o request, entrega socket + head ao hub e volta ao pool.
+  No HTTP/2 o stream segue na própria conexão h2 (que já ocupa um worker).
+
+Cliente que não lê acumula no máximo MAX_PENDING bytes; passou disso, cai
+(o EventSource do navegador reconecta sozinho e pede o que perdeu via Last-Event-ID).
+"""
+import collections
+import json
+import selectors
+import socket
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from app import metrics, pubsub
+
+HEARTBEAT = 15.0            # ": ping" periódico: mantém proxies abertos e revela cliente morto
+MAX_PENDING = 256 * 1024    # bytes na fila de um cliente antes de derrubá-lo
+MAX_CLIENTS = 1000          # streams abertos no processo (todos os canais)
+RETRY_MS = 3000             # sugestão de reconexão enviada ao navegador
+_OUT_LOW = 64 * 1024        # o hub só puxa mais eventos quando o buffer do socket baixa disso
+_PING = b": ping\n\n"
+_CRLF = b"\r\n"
+_LAST_CHUNK = b"0\r\n\r\n"
+
+_count_lock = threading.Lock()
+_open_streams = 0
+
+def format_event(data: str, *, event: str | None = None, id: int | None = None) -> bytes:
+    """Um evento no formato text/event-stream (data multilinha vira várias linhas data:)."""
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+class EventStream:
+    def __init__(self, channel: "Channel", backlog: Iterable[bytes]):
+        self._channel = channel
+        self._q: collections.deque[bytes] = collections.deque(backlog)
+        self._pending = sum(len(b) for b in self._q)
+        self._lock = threading.Lock()
+        self._last = time.monotonic()
+        self.closed = False
+        self.wake: Callable[[], None] | None = None  # quem consome pede para ser acordado
+
+    def push(self, data: bytes) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            if self._pending + len(data) > MAX_PENDING:
+                metrics.inc("sse_dropped_slow")
+                self._q.clear()
+                self._pending = 0
+                drop = True
+            else:
+                self._q.append(data)
+                self._pending += len(data)
+                drop = False
+        if drop:
+            self.close()
+        elif self.wake is not None:
+            self.wake()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes | None:
+        now = time.monotonic()
+        with self._lock:
+            if self._q:
+                data = self._q.popleft()
+                self._pending -= len(data)
+                self._last = now
+                return data
+            if self.closed:
+                raise StopIteration
+        if now - self._last >= HEARTBEAT:
+            self._last = now
+            return _PING
+        return None
+
+    def close(self) -> None:
+        global _open_streams
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        self._channel._remove(self)
+        with _count_lock:
+            _open_streams -= 1
+        if self.wake is not None:
+            self.wake()
+
+class Channel:
+    """
+    Tópico do pubsub -> eventos SSE. Mensagens são dicts; `id` (se houver) vira o id do evento.
+
+    Com `since(after_id)` e `head()` o canal não confia na mensagem: a cada aviso
+    (inclusive o None de outro processo, ver pubsub.share) relê da fonte o que
+    veio depois do último id entregue — nada se perde nem sai fora de ordem.
+    """
+
+    def __init__(self, topic: str, event: str, *,
+                 since: Callable[[int], list[dict]] | None = None, head: Callable[[], int] | None = None):
+        self.topic = topic
+        self.event = event
+        self._since = since
+        self._head = head
+        self._last: int | None = None   # último id entregue (só com since/head)
+        self._streams: set[EventStream] = set()
+        self._lock = threading.Lock()
+        self._catchup_lock = threading.Lock()
+        pubsub.subscribe(topic, self._on_message)
+
+    def format(self, msg: dict) -> bytes:
+        return format_event(json.dumps(msg, ensure_ascii=False), event=self.event, id=msg.get("id"))
+
+    def open(self, backlog: Iterable[dict] = (), *, after: int = 0) -> EventStream | None:
+        """
+        Novo stream (com eventos perdidos em `backlog`), ou None se já há MAX_CLIENTS.
+        Com since/head, `after` (Last-Event-ID da reconexão) reenvia o que veio depois
+        dele: o stream entra no canal ANTES da releitura, então nada escapa entre as duas.
+        """
+        global _open_streams
+        with _count_lock:
+            if _open_streams >= MAX_CLIENTS:
+                metrics.inc("sse_rejected")
+                return None
+            _open_streams += 1
+        first = f"retry: {RETRY_MS}\n\n".encode("ascii")
+        stream = EventStream(self, [first, *(self.format(m) for m in backlog)])
+        with self._catchup_lock:
+            if self._head is not None and self._last is None:
+                self._last = self._head()
+            with self._lock:
+                self._streams.add(stream)
+            if after and self._since is not None:
+                # só até onde o canal já entregou; o que vier depois chega pelo _catch_up
+                upto = self._last or 0
+                while after < upto:
+                    rows = [m for m in self._since(after) if int(m["id"]) <= upto]
+                    if not rows:
+                        break
+                    for msg in rows:
+                        stream.push(self.format(msg))
+                    after = int(rows[-1]["id"])
+        return stream
+
+    def _on_message(self, msg: dict | None) -> None:
+        if self._since is not None:
+            self._catch_up()
+        elif msg is not None:
+            self._push(self.format(msg))
+
+    def _catch_up(self) -> None:
+        with self._catchup_lock:
+            if not self._streams:
+                self._last = None  # ninguém ouvindo: o próximo open() relê o ponto de partida
+                return
+            while True:
+                rows = self._since(self._last or 0)
+                if not rows:
+                    break
+                for msg in rows:
+                    self._last = max(self._last or 0, int(msg["id"]))
+                    self._push(self.format(msg))
+
+    def _push(self, data: bytes) -> None:
+        # formatado uma vez, para todos
+        with self._lock:
+            streams = list(self._streams)
+        for s in streams:
+            s.push(data)
+
+    def _remove(self, stream: EventStream) -> None:
+        with self._lock:
+            self._streams.discard(stream)
+
+class _Client:
+    __slots__ = ("conn", "stream", "out", "on_close", "mask", "done")
+
+    def __init__(self, conn: socket.socket, head: bytes, stream: EventStream, on_close):
+        self.conn = conn
+        self.stream = stream
+        self.out = bytearray(head)
+        self.on_close = on_close
+        self.mask = 0
+        self.done = False
+
+# completado em start() com os SSLWant* se o TLS estiver ligado (ssl só é importado nesse caso)
+_WOULD_BLOCK: tuple[type[BaseException], ...] = (BlockingIOError,)
+
+class SSEHub:
+    """Bomba dos streams HTTP/1.1 (chunked): uma thread, sockets não bloqueantes."""
+
+    def __init__(self, name: str = "brasa_sse"):
+        self.name = name
+        self._new: collections.deque = collections.deque()
+        self._clients: dict[int, _Client] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        global _WOULD_BLOCK
+        ssl = sys.modules.get("ssl")
+        if ssl is not None:
+            _WOULD_BLOCK = (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError)
+        # selector e socketpair só aqui: criados no import seriam herdados e
+        # divididos por todos os processos filhos do pre-fork
+        self._sel = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        metrics.gauge_fn("sse_clients", lambda: _open_streams)
+
+    def attach(self, conn: socket.socket, head: bytes, stream: EventStream,
+               on_close: Callable[[], None] | None = None) -> None:
+        """Assume o socket: o hub manda o head, os eventos e fecha no fim."""
+        stream.wake = self._wake
+        self._new.append(_Client(conn, head, stream, on_close))
+        self._wake()
+
+    def close_all(self, timeout: float = 2.0) -> None:
+        """Encerramento: fecha os streams (o navegador reconecta no próximo processo)."""
+        self._stop.set()
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _wake(self) -> None:
+        if self._thread is None:
+            return
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass  # buffer cheio = já tem acordar pendente
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # timeout de 1s: também é o relógio do heartbeat
+            for key, _mask in self._sel.select(timeout=1.0):
+                cl = key.data
+                if cl is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    data = cl.conn.recv(4096)
+                except _WOULD_BLOCK:
+                    continue
+                except OSError:
+                    data = b""
+                if not data:
+                    self._drop(cl)  # o cliente fechou; o que ele mandar fora isso é ignorado
+            while self._new:
+                cl = self._new.popleft()
+                try:
+                    cl.conn.setblocking(False)
+                    cl.mask = selectors.EVENT_READ
+                    self._sel.register(cl.conn, cl.mask, cl)
+                except (OSError, ValueError):
+                    self._drop(cl)
+                    continue
+                self._clients[id(cl)] = cl
+                metrics.inc("sse_connections")
+            for cl in list(self._clients.values()):
+                self._pump(cl)
+        for cl in list(self._clients.values()):
+            try:
+                cl.conn.send(_LAST_CHUNK)
+            except OSError:
+                pass
+            self._drop(cl)
+
+    def _pump(self, cl: _Client) -> None:
+        # só puxa do stream com o buffer local baixo: o excesso fica na fila (limitada) do stream
+        while not cl.done and len(cl.out) < _OUT_LOW:
+            try:
+                ev = next(cl.stream)
+            except StopIteration:
+                cl.out += _LAST_CHUNK
+                cl.done = True
+                break
+            if ev is None:
+                break
+            cl.out += b"%X\r\n" % len(ev) + ev + _CRLF
+        if cl.out:
+            try:
+                n = cl.conn.send(cl.out)
+                del cl.out[:n]
+            except _WOULD_BLOCK:
+                pass
+            except OSError:
+                self._drop(cl)
+                return
+        if cl.done and not cl.out:
+            self._drop(cl)
+            return
+        want = selectors.EVENT_READ | (selectors.EVENT_WRITE if cl.out else 0)
+        if want != cl.mask:
+            cl.mask = want
+            self._sel.modify(cl.conn, want, cl)
+
+    def _drop(self, cl: _Client) -> None:
+        if self._clients.pop(id(cl), None) is not None:
+            try:
+                self._sel.unregister(cl.conn)
+            except (KeyError, ValueError):
+                pass
+        cl.stream.close()
+        try:
+            cl.conn.close()
+        except OSError:
+            pass
+        if cl.on_close is not None:
+            try:
+                cl.on_close()
+            except Exception:
+                pass
+            cl.on_close = None
+
+HUB = SSEHub()
@@ -0,0 +1,26 @@
+// Recados novos chegam por SSE (/ninissa/recados/eventos) sem recarregar a página.
+(function () {
+  var lista = document.querySelector(".notes");
+  if (!lista || !window.EventSource) return;
+  var es = new EventSource("/ninissa/recados/eventos");
+  es.addEventListener("recado", function (ev) {
+    var r = JSON.parse(ev.data);
+    if (!lista.querySelector(".note")) lista.textContent = "";  // tira o "seja o primeiro"
+    var art = document.createElement("article");
+    art.className = "note";
+    var msg = document.createElement("p");
+    msg.textContent = r.message;
+    var meta = document.createElement("p");
+    var autor = document.createElement("strong");
+    autor.textContent = "— " + r.author;
+    var quando = document.createElement("time");
+    quando.dateTime = r.created_at;
+    quando.textContent = r.created_at;
+    meta.appendChild(autor);
+    meta.appendChild(document.createTextNode(" · "));
+    meta.appendChild(quando);
+    art.appendChild(msg);
+    art.appendChild(meta);
+    lista.insertBefore(art, lista.firstChild);
+  });
+})();
@@ -2,28 +2,183 @@ from pathlib import Path
 from urllib.parse import unquote
 import mimetypes
 from email.utils import formatdate, parsedate_to_datetime
-from app.responses import build_response
+from app.responses import Response, build_response
+from app.timing import phase
+from app.config import StaticCfg
+from app import metrics, pubsub
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from app.router import Request
+from collections import OrderedDict
 import gzip
+import hashlib
+import logging
+import stat
+import threading
+import time
 
 # Raiz dos estáticos: app/static
 STATIC_ROOT = Path(__file__).resolve().parent / "static"
 
-def _safe_path(url_path: str) -> Path | None:
+DEFAULT_CACHE = "public, max-age=3600"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"  # URL com hash nunca muda de conteúdo
+
+# Ajustados por configure() (config.json, seção "static")
+RESCAN_INTERVAL = 5.0
+NEGATIVE_CACHE_MAX = 1024
+MEMORY_MAX_FILE = 256 * 1024
+
+_COMPRESSIBLE = {"application/javascript", "application/json", "application/xml", "image/svg+xml"}
+
+_log = logging.getLogger("brasa.app")
+
+class _Entry:
+    """Um arquivo do índice: stat, tipo e validadores já calculados (e o corpo, se pequeno)."""
+    __slots__ = ("path", "size", "mtime", "mtime_ns", "ctype", "last_mod", "etag", "digest",
+                 "compressible", "data", "gz")
+
+    def __init__(self, path: Path, st, digest: str | None, data: bytes | None):
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.ctype = _guess_content_type(path)
+        self.last_mod = _http_date_from_timestamp(st.st_mtime)
+        self.digest = digest
+        self.etag = f'"{digest}"' if digest else None
+        self.compressible = self.ctype.startswith("text/") or self.ctype in _COMPRESSIBLE
+        self.data = data if data is not None and len(data) <= MEMORY_MAX_FILE else None
+        self.gz: bytes | None = None
+
+    def read(self) -> bytes:
+        return self.data if self.data is not None else self.path.read_bytes()
+
+    def gzipped(self) -> bytes:
+        """gzip do corpo; calculado uma vez quando o arquivo fica em memória."""
+        if self.gz is not None:
+            return self.gz
+        with phase("gzip"):
+            gz = gzip.compress(self.read(), mtime=0)
+        if self.data is not None:
+            self.gz = gz
+        return gz
+
+class _Snapshot:
     """
-    Converte a parte da URL após /static/ em um caminho seguro dentro de STATIC_ROOT.
-    Retorna Path absoluto seguro ou None se inválido/fora da raiz.
+    Resultado de uma varredura, publicado inteiro numa atribuição só: quem pegou
+    o snapshot vê índice e manifesto da MESMA varredura, nunca um misturado.
     """
-    # remove o prefixo '/static/' (já garantido pelo caller) e decodifica %xx
-    rel = url_path[len("/static/"):]
-    rel = unquote(rel)
+    __slots__ = ("index", "manifest", "fingerprinted")
 
-    # Não permitir caminhos absolutos ou voltando diretórios
-    # resolve() normaliza .. e .
-    candidate = (STATIC_ROOT / rel).resolve()
+    def __init__(self, index: dict[str, _Entry], manifest: dict[str, str]):
+        # caminho relativo -> _Entry. Montado no boot, no SIGHUP e a cada
+        # RESCAN_INTERVAL; um hit não toca no disco (nem stat).
+        self.index = index
+        # nome lógico -> nome com hash do conteúdo, ex.: "style.css" -> "style.3f2a9c1b0d.css"
+        self.manifest = manifest
+        # o inverso: nome com hash -> (nome lógico, hash que a URL carrega)
+        self.fingerprinted = {v: (k, index[k].digest) for k, v in manifest.items()}
+
+_snap = _Snapshot({}, {})
 
+# Caminhos que não existem (bots sondando) -> status (404/403), LRU limitado.
+# Zerado quando uma varredura encontra mudança.
+_negative: "OrderedDict[str, int]" = OrderedDict()
+_neg_lock = threading.Lock()
+_scan_lock = threading.Lock()
+_rescan_thread: threading.Thread | None = None
+
+def configure(cfg: StaticCfg) -> None:
+    global RESCAN_INTERVAL, NEGATIVE_CACHE_MAX, MEMORY_MAX_FILE
+    RESCAN_INTERVAL = cfg.rescan_interval
+    NEGATIVE_CACHE_MAX = cfg.negative_cache
+    MEMORY_MAX_FILE = cfg.memory_max_file
+
+def build_index() -> bool:
+    """
+    Varre STATIC_ROOT e troca índice + manifesto de uma vez. Arquivo com
+    mesmo tamanho e mtime reaproveita hash e corpo da varredura anterior.
+    Retorna True se algo mudou.
+    """
+    global _snap
+    with _scan_lock:
+        old = _snap.index
+        index: dict[str, _Entry] = {}
+        manifest: dict[str, str] = {}
+        for path in sorted(STATIC_ROOT.rglob("*")):
+            try:
+                st = path.stat()
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                # symlink apontando para fora da raiz não entra
+                path.resolve().relative_to(STATIC_ROOT)
+            except (OSError, ValueError):
+                continue
+            rel = path.relative_to(STATIC_ROOT).as_posix()
+            entry = old.get(rel)
+            if entry is None or entry.digest is None or (entry.size, entry.mtime_ns) != (st.st_size, st.st_mtime_ns):
+                try:
+                    data = path.read_bytes()
+                except OSError:
+                    continue
+                entry = _Entry(path, st, hashlib.sha256(data).hexdigest()[:10], data)
+            index[rel] = entry
+            stem, dot, suffix = rel.rpartition(".")
+            manifest[rel] = f"{stem}.{entry.digest}.{suffix}" if dot and "/" not in suffix else f"{rel}.{entry.digest}"
+        changed = index.keys() != old.keys() or any(index[k] is not old[k] for k in index)
+        manifest_changed = manifest != _snap.manifest
+        _snap = _Snapshot(index, manifest)
+    if changed:
+        with _neg_lock:
+            _negative.clear()
+        metrics.inc("static_rescans_changed")
+    if manifest_changed and old:
+        # templates guardam a URL com hash resolvida; precisam ser relidos
+        pubsub.publish("static", sorted(manifest))
+        _log.info("Estáticos: índice atualizado (%d arquivos)", len(index))
+    return changed
+
+def start_rescan() -> None:
+    """Thread que revarre STATIC_ROOT a cada RESCAN_INTERVAL (0 = não varre)."""
+    global _rescan_thread
+    metrics.gauge_fn("static_files", lambda: len(_snap.index))
+    metrics.gauge_fn("static_negative", lambda: len(_negative))
+    if _rescan_thread is not None or RESCAN_INTERVAL <= 0:
+        return
+    def _loop():
+        while True:
+            # relido a cada volta: SIGHUP pode mudar o intervalo (0 pausa)
+            time.sleep(RESCAN_INTERVAL if RESCAN_INTERVAL > 0 else 5.0)
+            if RESCAN_INTERVAL <= 0:
+                continue
+            try:
+                build_index()
+            except Exception:
+                _log.exception("Estáticos: falha na varredura")
+    _rescan_thread = threading.Thread(target=_loop, name="brasa_static", daemon=True)
+    _rescan_thread.start()
+
+def asset_url(name: str) -> str:
+    """URL pública de um asset pelo nome lógico; sem manifesto, cai no nome puro."""
+    return "/static/" + _snap.manifest.get(name, name)
+
+def not_found_body() -> bytes | None:
+    """Corpo do 404.html, já em memória (None se não existir)."""
+    entry = _snap.index.get("404.html")
+    if entry is None:
+        return None
+    try:
+        return entry.read()
+    except OSError:
+        return None
+
+def _safe_path(rel: str) -> Path | None:
+    """
+    Converte a parte da URL após /static/ (já decodificada) em um caminho seguro
+    dentro de STATIC_ROOT. Retorna Path absoluto seguro ou None se fora da raiz.
+    """
+    # resolve() normaliza .. e . (e segue symlinks)
+    candidate = (STATIC_ROOT / rel).resolve()
     try:
         # Garante que candidate está DENTRO de STATIC_ROOT
         candidate.relative_to(STATIC_ROOT)
@@ -31,6 +186,53 @@ def _safe_path(url_path: str) -> Path | None:
         return None
     return candidate
 
+def _lookup(rel: str, index: dict[str, _Entry]) -> tuple[_Entry | None, int]:
+    """rel -> (entrada, 200) ou (None, 404/403). Só vai ao disco fora do índice e fora do cache negativo."""
+    entry = index.get(rel)
+    if entry is not None:
+        return entry, 200
+    with _neg_lock:
+        status = _negative.get(rel)
+        if status is not None:
+            _negative.move_to_end(rel)
+    if status is not None:
+        metrics.inc("static_negative_hits")
+        return None, status
+    # fora do índice: caminho não canônico (./x, a/../x) ou arquivo criado depois da varredura
+    status = 404
+    target = _safe_path(rel)
+    if target is None:
+        status = 403
+    else:
+        canonical = target.relative_to(STATIC_ROOT).as_posix()
+        entry = index.get(canonical)
+        if entry is not None:
+            return entry, 200
+        try:
+            st = target.stat()
+            if stat.S_ISREG(st.st_mode):
+                # entra no índice (sem hash); a próxima varredura completa o resto
+                entry = index[canonical] = _Entry(target, st, None, None)
+                return entry, 200
+        except OSError:
+            pass
+    if NEGATIVE_CACHE_MAX > 0:
+        with _neg_lock:
+            _negative[rel] = status
+            while len(_negative) > NEGATIVE_CACHE_MAX:
+                _negative.popitem(last=False)
+    return None, status
+
+def _unchanged(entry: _Entry) -> bool:
+    """Corpo em memória é o da varredura; do disco, só se tamanho e mtime ainda batem."""
+    if entry.data is not None:
+        return True
+    try:
+        st = entry.path.stat()
+    except OSError:
+        return False
+    return (st.st_size, st.st_mtime_ns) == (entry.size, entry.mtime_ns)
+
 def _guess_content_type(path: Path) -> str:
     ctype, enc = mimetypes.guess_type(path.name)
     if not ctype:
@@ -43,118 +245,73 @@ def _guess_content_type(path: Path) -> str:
 def _http_date_from_timestamp(ts: float) -> str:
     return formatdate(ts, usegmt=True)
 
-def serve_static(req: 'Request') -> bytes:
+def _not_modified(req: 'Request', entry: _Entry) -> bool:
+    inm = req.headers.get("if-none-match")
+    if inm is not None:
+        # If-None-Match vence If-Modified-Since (RFC 9110)
+        return entry.etag is not None and (inm.strip() == "*" or entry.etag in [t.strip().removeprefix("W/") for t in inm.split(",")])
+    ims = req.headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(entry.mtime) <= int(parsedate_to_datetime(ims).timestamp())
+        except Exception:
+            # header malformado -> ignora e envia normalmente
+            return False
+    return False
+
+def serve_static(req: 'Request') -> Response:
     """
-    Atende URLs /static/... com GET e HEAD.
+    Atende URLs /static/... com GET e HEAD, a partir do índice em memória.
     Segurança: path traversal bloqueado. Sem listagem de diretório.
-    Cache simples: Last-Modified / If-Modified-Since.
+    Cache: ETag/If-None-Match e Last-Modified/If-Modified-Since.
     Suporta gzip quando o cliente envia Accept-Encoding: gzip.
     """
     if req.method not in ("GET", "HEAD"):
         return build_response(405, b"<h1>405 Method Not Allowed</h1>", {"Allow": "GET, HEAD"})
 
-    # Segurança de caminho
-    target = _safe_path(req.path)
-    if target is None:
-        return build_response(403, b"<h1>403 Forbidden</h1>")
-
-    # Não listamos diretórios
-    if not target.exists() or not target.is_file():
+    rel = unquote(req.path[len("/static/"):])
+    snap = _snap
+    # URL com hash -> arquivo lógico, com cache "para sempre"
+    logical, url_digest = snap.fingerprinted.get(rel, (None, None))
+    entry, status = _lookup(logical or rel, snap.index)
+    if entry is None:
+        if status == 403:
+            return build_response(403, b"<h1>403 Forbidden</h1>")
         return build_response(404, b"<h1>404 Not Found</h1>")
 
-    # Metadados do arquivo
-    st = target.stat()
-    last_mod = _http_date_from_timestamp(st.st_mtime)
-    size = st.st_size
-    ctype = _guess_content_type(target)
+    # "immutable" só se os bytes são os do hash da URL; arquivo grande é lido do
+    # disco na hora, então confere também se não mudou desde a varredura
+    immutable = logical is not None and entry.digest == url_digest and _unchanged(entry)
+    if logical is not None and not immutable:
+        metrics.inc("static_fingerprint_stale")
+    headers = {
+        "Last-Modified": entry.last_mod,
+        "Cache-Control": IMMUTABLE_CACHE if immutable else DEFAULT_CACHE,
+        "X-Content-Type-Options": "nosniff",
+    }
+    if entry.etag:
+        headers["ETag"] = entry.etag
+    if entry.compressible:
+        headers["Vary"] = "Accept-Encoding"
 
-    # Cache condicional (If-Modified-Since)
-    ims = req.headers.get("if-modified-since")
-    if ims:
-        try:
-            ims_dt = parsedate_to_datetime(ims)
-            if int(st.st_mtime) <= int(ims_dt.timestamp()):
-                # 304 sem corpo
-                return build_response(
-                    304,
-                    b"",
-                    extra_headers={
-                        "Last-Modified": last_mod,
-                        "Cache-Control": "public, max-age=3600",
-                        "X-Content-Type-Options": "nosniff",
-                        "Vary": "Accept-Encoding",
-                    },
-                )
-        except Exception:
-            # header malformado -> ignora e envia normalmente
-            pass
+    if _not_modified(req, entry):
+        return build_response(304, b"", extra_headers=headers)
 
-    # Negociação de gzip
     ae = (req.headers.get("accept-encoding") or "").lower()
-    can_gzip = "gzip" in ae
-    compressible = ctype.startswith("text/") or ctype in {
-        "application/javascript",
-        "application/json",
-        "application/xml",
-        "image/svg+xml",
-    }
+    use_gzip = entry.compressible and "gzip" in ae
+    try:
+        if use_gzip:
+            body = entry.gzipped()
+            headers["Content-Encoding"] = "gzip"
+        elif req.method == "HEAD":
+            body = None
+        else:
+            body = entry.read()
+    except OSError:
+        # sumiu entre uma varredura e outra
+        return build_response(404, b"<h1>404 Not Found</h1>")
 
     if req.method == "HEAD":
-        if can_gzip and compressible:
-            # precisamos do tamanho comprimido, então comprimimos mas não enviamos corpo
-            src = target.read_bytes()
-            gz = gzip.compress(src, mtime=0)
-            return build_response(
-                200,
-                b"",
-                extra_headers={
-                    "Content-Length": str(len(gz)),
-                    "Last-Modified": last_mod,
-                    "Cache-Control": "public, max-age=3600",
-                    "X-Content-Type-Options": "nosniff",
-                    "Content-Encoding": "gzip",
-                    "Vary": "Accept-Encoding",
-                },
-                content_type=ctype,
-            )
-        else:
-            return build_response(
-                200,
-                b"",
-                extra_headers={
-                    "Content-Length": str(size),
-                    "Last-Modified": last_mod,
-                    "Cache-Control": "public, max-age=3600",
-                    "X-Content-Type-Options": "nosniff",
-                },
-                content_type=ctype,
-            )
-
-    # GET
-    data = target.read_bytes()
-    if can_gzip and compressible:
-        gz = gzip.compress(data, mtime=0)
-        return build_response(
-            200,
-            gz,
-            extra_headers={
-                "Last-Modified": last_mod,
-                "Cache-Control": "public, max-age=3600",
-                "X-Content-Type-Options": "nosniff",
-                "Content-Encoding": "gzip",
-                "Vary": "Accept-Encoding",
-            },
-            content_type=ctype,
-        )
-
-    # GET sem gzip
-    return build_response(
-        200,
-        data,
-        extra_headers={
-            "Last-Modified": last_mod,
-            "Cache-Control": "public, max-age=3600",
-            "X-Content-Type-Options": "nosniff",
-        },
-        content_type=ctype,
-    )
\ No newline at end of file
+        headers["Content-Length"] = str(len(body) if body is not None else entry.size)
+        return build_response(200, b"", extra_headers=headers, content_type=entry.ctype)
+    return build_response(200, body, extra_headers=headers, content_type=entry.ctype)
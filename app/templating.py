@@ -1,12 +1,19 @@
+import re
 from pathlib import Path
 from string import Template
 from html import escape as html_escape
 from typing import Any, Mapping
 import gzip
-from app.responses import build_response
+from app.responses import Response, build_response
+from app.timing import phase
+from app.staticserve import asset_url
+from app import pubsub
 
 TEMPLATES_ROOT = Path(__file__).resolve().parent / "templates"
 
+# ${static:style.css} -> URL com hash do manifesto (resolvido ao carregar o template)
+_STATIC_REF = re.compile(r"\$\{static:([^}]+)\}")
+
 class Safe(str):
     """Marca conteudo como 'já seguro' (não escapar de novo)"""
     pass
@@ -21,12 +28,36 @@ def _prepare_context(ctx: Mapping[str, Any]) -> dict[str, str]:
     # Converte para strings já escapadas (ou mantidas se Safe)
     return {k: _escape_value(v) for k, v in ctx.items()}
 
+_cache: dict[str, Template] = {}
+
 def load_template(name: str) -> Template:
+    """
+    Lê e compila uma vez; SIGHUP (clear_template_cache) força reler do disco.
+    Referências ${static:arquivo} viram a URL com hash já aqui, então o
+    manifesto precisa estar montado antes do primeiro load.
+    """
+    tpl = _cache.get(name)
+    if tpl is not None:
+        return tpl
     path = TEMPLATES_ROOT / name
     if not path.exists() or not path.is_file():
         raise FileNotFoundError(f"Template não encontrado: {name}")
     text = path.read_text(encoding="utf-8")
-    return Template(text)
+    text = _STATIC_REF.sub(lambda m: asset_url(m.group(1).strip()), text)
+    tpl = _cache[name] = Template(text)
+    return tpl
+
+def clear_template_cache() -> None:
+    _cache.clear()
+
+def preload() -> int:
+    """Compila todos os templates de uma vez (boot), para o primeiro request não ler disco."""
+    for path in TEMPLATES_ROOT.glob("*.html"):
+        load_template(path.name)
+    return len(_cache)
+
+# varredura de estáticos mudou algum hash: URLs resolvidas no cache ficaram velhas
+pubsub.subscribe("static", lambda _names: clear_template_cache())
 
 def render_template_to_str(name: str, **context: Any) -> str:
     tpl = load_template(name)
@@ -43,16 +74,18 @@ def render_layout(content_template: str, **context: Any) -> str:
     inner_html = render_template_to_str(content_template, **context)
     return render_template_to_str("base.html", content=Safe(inner_html), **context)
 
-def render_page(content_template: str, status: int = 200, accept_encoding: str | None = None, **context: Any) -> bytes:
-    html = render_layout(content_template, **context)
-    body = html.encode("utf-8")
+def render_page(content_template: str, status: int = 200, accept_encoding: str | None = None, **context: Any) -> Response:
+    with phase("render"):
+        html = render_layout(content_template, **context)
+        body = html.encode("utf-8")
     # Negociação simples de gzip
     wants_gzip = False
     if accept_encoding and "gzip" in accept_encoding.lower():
         # limiar p/ não gastar CPU com corpos muito pequenos
         wants_gzip = len(body) >= 512
     if wants_gzip and status not in (204, 304):
-        gz = gzip.compress(body, mtime=0)  # mtime=0 -> output estável (bom p/ testes)
+        with phase("gzip"):
+            gz = gzip.compress(body, mtime=0)  # mtime=0 -> output estável (bom p/ testes)
         return build_response(
             status,
             gz,
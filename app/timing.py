@@ -0,0 +1,94 @@
+"""
+Cronometragem por fase de cada request (tls, read, dispatch, db, render, gzip, send).
+
+O cronômetro vive num threading.local: cada worker atende uma conexão por vez,
+então db.py/templating.py marcam suas fases sem precisar receber nada por
+parâmetro. Fora de um request (scripts, testes) `phase` não mede nada.
+StartupReport faz o mesmo para as etapas do boot do servidor.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_local = threading.local()
+
+class RequestTimer:
+    __slots__ = ("start", "phases")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def summary(self) -> str:
+        """Ex.: "read=0.4ms dispatch=12.1ms db=9.8ms send=0.2ms"."""
+        return " ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.phases.items())
+
+def begin() -> RequestTimer:
+    t = _local.current = RequestTimer()
+    return t
+
+def end() -> None:
+    _local.current = None
+
+def current() -> RequestTimer | None:
+    return getattr(_local, "current", None)
+
+@contextmanager
+def phase(name: str):
+    t = getattr(_local, "current", None)
+    if t is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        t.add(name, time.perf_counter() - t0)
+
+def timed(name: str):
+    """Decorator: soma o tempo da função na fase `name` do request atual."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t = getattr(_local, "current", None)
+            if t is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                t.add(name, time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+class StartupReport:
+    """Etapas do boot (config, db, rotas, ...) com a duração de cada uma, para o log de início."""
+
+    def __init__(self, start: float | None = None):
+        self.start = time.perf_counter() if start is None else start
+        self.steps: dict[str, float] = {}
+
+    @contextmanager
+    def step(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = self.steps.get(name, 0.0) + time.perf_counter() - t0
+
+    def mark(self, name: str, since: float) -> None:
+        """Etapa medida por fora (ex.: imports, de `since` até agora)."""
+        self.steps[name] = time.perf_counter() - since
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def summary(self) -> str:
+        return " ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.steps.items())
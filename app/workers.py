@@ -0,0 +1,190 @@
+"""
+Pool de workers com fila LIMITADA e tamanho ADAPTATIVO.
+
+O ThreadPoolExecutor tem fila sem limite: sob rajada, conexões aceitas ficam
+esperando na memória até o cliente já ter desistido. Aqui a fila tem tamanho
+máximo (quem não cabe recebe 503 na hora) e um prazo de espera: conexão que
+ficou tempo demais na fila é descartada sem rodar o handler.
+
+O número de threads varia entre min_workers e max_workers. Uma thread monitora,
+a cada `interval` segundos, a espera média na fila, quantos workers estão
+ocupados e o uso de CPU do processo (em núcleos; o GIL limita a ~1):
+- espera alta + todos ocupados + CPU com folga -> cresce (handlers bloqueando em I/O,
+  ex.: SQLite; mais threads ajudam);
+- espera alta mas CPU saturada -> NÃO cresce (gzip/templates: mais threads só
+  disputam o GIL);
+- ociosidade por alguns ciclos seguidos -> encolhe um worker por vez.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+from app import metrics
+
+_log = logging.getLogger("brasa.app")
+
+class WorkerPool:
+    def __init__(
+        self,
+        handler: Callable[..., None],
+        *,
+        min_workers: int,
+        max_workers: int,
+        queue_size: int,
+        queue_timeout: float,
+        on_expired: Callable[..., None] | None = None,
+        target_wait: float = 0.05,
+        cpu_high: float = 0.85,
+        interval: float = 1.0,
+        name: str = "brasa",
+        metrics_prefix: str = "",
+    ):
+        self.handler = handler
+        self.on_expired = on_expired
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.queue_timeout = queue_timeout
+        self.target_wait = target_wait
+        self.cpu_high = cpu_high
+        self.interval = interval
+        self.name = name
+        self._mp = metrics_prefix   # outro pool no mesmo processo (ex.: "h2_") não sobrescreve as métricas
+        self._q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._threads: set[threading.Thread] = set()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._seq = 0
+        self._wait_ewma = 0.0
+        self._idle_ticks = 0
+        self._cpu_util = 0.0
+        self._stop = threading.Event()
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return len(self._threads)
+
+    def start(self) -> None:
+        for _ in range(self.min_workers):
+            self._spawn()
+        mp = self._mp
+        metrics.gauge_fn(mp + "queue_depth", self.depth)
+        metrics.gauge_fn(mp + "workers", lambda: self.size)
+        metrics.gauge_fn(mp + "workers_busy", lambda: self._busy)
+        metrics.gauge_fn(mp + "queue_wait_ms", lambda: round(self._wait_ewma * 1000, 2))
+        metrics.gauge_fn(mp + "cpu_util", lambda: round(self._cpu_util, 3))
+        if self.max_workers > self.min_workers:
+            threading.Thread(target=self._monitor, name=f"{self.name}_monitor", daemon=True).start()
+
+    def submit(self, *args) -> bool:
+        """Enfileira sem bloquear. False = fila cheia (caller deve responder 503)."""
+        try:
+            self._q.put_nowait((time.monotonic(), args))
+        except queue.Full:
+            metrics.inc(self._mp + "queue_rejected")
+            return False
+        return True
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def shutdown(self, timeout: float | None = None) -> int:
+        """
+        Sinaliza fim para cada worker (depois do que já está na fila) e espera
+        até `timeout` segundos no total. Retorna quantos workers não terminaram.
+        """
+        self._stop.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            threads = list(self._threads)
+        for _ in threads:
+            # fila cheia: put sem prazo travaria o drain além do timeout
+            try:
+                self._q.put((0.0, None), timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in threads:
+            t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return sum(1 for t in threads if t.is_alive())
+
+    def _spawn(self) -> None:
+        with self._lock:
+            self._seq += 1
+            t = threading.Thread(target=self._run, name=f"{self.name}_{self._seq}", daemon=True)
+            self._threads.add(t)
+        t.start()
+
+    def _run(self) -> None:
+        me = threading.current_thread()
+        try:
+            while True:
+                enq_t, args = self._q.get()
+                if args is None:
+                    return
+                waited = time.monotonic() - enq_t
+                # EWMA simples; corrida entre threads aqui só borra a média, não quebra nada
+                self._wait_ewma += 0.2 * (waited - self._wait_ewma)
+                if waited > self.queue_timeout:
+                    metrics.inc(self._mp + "queue_expired")
+                    if self.on_expired:
+                        try:
+                            self.on_expired(*args)
+                        except Exception:
+                            pass
+                    continue
+                with self._lock:
+                    self._busy += 1
+                try:
+                    self.handler(*args)
+                except Exception:
+                    pass  # o handler já loga; worker não pode morrer
+                finally:
+                    with self._lock:
+                        self._busy -= 1
+        finally:
+            with self._lock:
+                self._threads.discard(me)
+
+    def _monitor(self) -> None:
+        last_wall, last_cpu = time.monotonic(), time.process_time()
+        while not self._stop.wait(self.interval):
+            wall, cpu = time.monotonic(), time.process_time()
+            # relativo a UM núcleo, não a os.cpu_count(): bytecode Python só roda com o
+            # GIL, então o pool satura em ~1 núcleo (C sem GIL — gzip, TLS — passa de 1.0)
+            self._cpu_util = (cpu - last_cpu) / max(1e-6, wall - last_wall)
+            last_wall, last_cpu = wall, cpu
+            # sem tráfego a EWMA não se move; decai para não travar o pool no tamanho grande
+            if self._q.empty() and self._busy == 0:
+                self._wait_ewma *= 0.5
+            self._adapt()
+
+    def _adapt(self) -> None:
+        size, busy, depth = self.size, self._busy, self.depth()
+        waiting = self._wait_ewma > self.target_wait or depth > 0
+        if waiting and busy >= size and size < self.max_workers:
+            self._idle_ticks = 0
+            if self._cpu_util >= self.cpu_high:
+                metrics.inc(self._mp + "pool_grow_skipped_cpu")
+                _log.info("Pool: fila esperando (%.0f ms) mas CPU em %.0f%%; mantendo %d workers",
+                          self._wait_ewma * 1000, self._cpu_util * 100, size)
+                return
+            add = min(self.max_workers - size, max(1, size // 4))
+            for _ in range(add):
+                self._spawn()
+            metrics.inc(self._mp + "pool_grow")
+            _log.info("Pool: %d -> %d workers (espera %.0f ms, fila %d, CPU %.0f%%)",
+                      size, size + add, self._wait_ewma * 1000, depth, self._cpu_util * 100)
+        elif not waiting and busy < size // 2 and size > self.min_workers:
+            self._idle_ticks += 1
+            if self._idle_ticks >= 5:
+                self._idle_ticks = 0
+                try:
+                    self._q.put_nowait((0.0, None))  # o primeiro worker livre sai
+                except queue.Full:
+                    return
+                metrics.inc(self._mp + "pool_shrink")
+                _log.info("Pool: %d -> %d workers (ocioso: %d ocupados)", size, size - 1, busy)
+        else:
+            self._idle_ticks = 0
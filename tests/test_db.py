@@ -0,0 +1,119 @@
+"""Busca FTS5 (saneamento e paginação) e backup NDJSON/CSV ida e volta, num banco temporário."""
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app import backup, db
+
+class _TempDB(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for patcher in (mock.patch.object(db, "DB_PATH", Path(tmp.name) / "brasa.db"),
+                        mock.patch.object(db, "FTS_ENABLED", db.FTS_ENABLED)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        db.init_db()
+
+class FtsQueryTest(unittest.TestCase):
+    def test_terms_quoted_last_is_prefix(self):
+        self.assertEqual(db.fts_query("meu amo"), '"meu" "amo"*')
+
+    def test_operators_and_columns_dropped(self):
+        self.assertEqual(db.fts_query('author:x OR "y" NEAR(z) -w'), '"author" "x" "OR" "y" "NEAR" "z" "w"*')
+
+    def test_empty_and_punctuation_only(self):
+        self.assertEqual(db.fts_query(""), "")
+        self.assertEqual(db.fts_query(None), "")
+        self.assertEqual(db.fts_query('"*():-'), "")
+
+    def test_term_limit(self):
+        self.assertEqual(db.fts_query(" ".join(f"t{i}" for i in range(20))).count('"') // 2,
+                         db._SEARCH_MAX_TERMS)
+
+class SearchTest(_TempDB):
+    def setUp(self):
+        super().setUp()
+        if not db.FTS_ENABLED:
+            self.skipTest("SQLite sem FTS5")
+
+    def test_ranked_with_snippet(self):
+        db.insert_love_note("Ana", "um recado qualquer sobre o dia")
+        best = db.insert_love_note("Bia", "coração coração coração")
+        db.insert_eco("127.0.0.1", "Caio", "meu coracao bate forte", "ua")
+        rows, more = db.search("coracao")
+        self.assertFalse(more)
+        self.assertEqual([(r["tipo"], r["autor"]) for r in rows], [("recado", "Bia"), ("eco", "Caio")])
+        self.assertEqual(rows[0]["id"], best)
+        self.assertIn(f"{db._HL_OPEN}coração{db._HL_CLOSE}", rows[0]["trecho"])
+
+    def test_pages_do_not_overlap(self):
+        ids = {db.insert_love_note("Ana", f"amor número {i}") for i in range(7)}
+        seen = []
+        page, more = 1, True
+        while more:
+            rows, more = db.search("amo", page=page, per_page=3)
+            seen += [r["id"] for r in rows]
+            page += 1
+        self.assertEqual(page - 1, 3)
+        self.assertEqual(sorted(seen), sorted(ids))
+
+    def test_no_match(self):
+        db.insert_love_note("Ana", "oi")
+        self.assertEqual(db.search("inexistente"), ([], False))
+        self.assertEqual(db.search("  ::  "), ([], False))
+
+class BackupTest(_TempDB):
+    def _fill(self):
+        db.insert_love_note("Ana", "primeiro, com vírgula")
+        db.insert_love_note("Bia", 'segundo "com aspas"\ne quebra de linha')
+        return db.fetch_love_notes()
+
+    def _export(self, fmt: str) -> bytes:
+        return b"".join(backup.export_chunks("love_notes", fmt))
+
+    def _roundtrip(self, fmt: str):
+        before = self._fill()
+        data = self._export(fmt)
+        # apaga tudo e reimporta
+        with db._connect() as conn:
+            conn.execute("DELETE FROM love_notes")
+        stats = backup.import_file("love_notes", io.BytesIO(data), fmt)
+        self.assertEqual((stats.read, stats.skipped, stats.inserted), (2, 0, 2))
+        self.assertEqual(db.fetch_love_notes(), before)
+        # de novo: mesmos ids, nada entra
+        again = backup.import_file("love_notes", io.BytesIO(data), fmt)
+        self.assertEqual((again.read, again.inserted), (2, 0))
+
+    def test_ndjson_roundtrip(self):
+        self._roundtrip("ndjson")
+
+    def test_csv_roundtrip(self):
+        self._roundtrip("csv")
+
+    def test_ndjson_one_record_per_line(self):
+        self._fill()
+        lines = self._export("ndjson").splitlines()
+        self.assertEqual([json.loads(x)["author"] for x in lines], ["Ana", "Bia"])
+
+    def test_missing_required_field_skipped_and_defaults_filled(self):
+        data = b'{"author":"Ana"}\n\n{"message":"sem id nem data"}\n'
+        stats = backup.import_file("love_notes", io.BytesIO(data), "ndjson")
+        self.assertEqual((stats.read, stats.skipped, stats.inserted), (2, 1, 1))
+        (row,) = db.fetch_love_notes()
+        self.assertEqual((row["author"], row["message"]), ("", "sem id nem data"))
+        self.assertTrue(row["created_at"].endswith("Z"))
+
+    def test_invalid_json_reports_line(self):
+        with self.assertRaisesRegex(ValueError, "linha 2"):
+            backup.import_file("love_notes", io.BytesIO(b'{"message":"a"}\n{nope\n'), "ndjson")
+
+    def test_guess_format(self):
+        self.assertEqual(backup.guess_format("recados.CSV"), "csv")
+        self.assertEqual(backup.guess_format("recados.json"), "ndjson")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,417 @@
+"""HPACK (vetores do RFC 7541, Apêndice C) e framing HTTP/2 sobre um socketpair."""
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from app import h2
+from app.h2 import HPACKDecoder, HPACKError, HeaderListTooLarge, _decode_int, _encode_int, hpack_encode, huffman_decode
+from app.responses import Response, build_response
+
+def _hex(s: str) -> bytes:
+    return bytes.fromhex("".join(s.split()))
+
+class IntegerTest(unittest.TestCase):
+    # C.1
+    def test_encode(self):
+        self.assertEqual(_encode_int(10, 5), _hex("0a"))
+        self.assertEqual(_encode_int(1337, 5), _hex("1f 9a 0a"))
+        self.assertEqual(_encode_int(42, 8), _hex("2a"))
+
+    def test_decode(self):
+        self.assertEqual(_decode_int(_hex("0a"), 0, 5), (10, 1))
+        self.assertEqual(_decode_int(_hex("1f 9a 0a"), 0, 5), (1337, 3))
+        self.assertEqual(_decode_int(_hex("2a"), 0, 8), (42, 1))
+
+    def test_truncated(self):
+        with self.assertRaises(HPACKError):
+            _decode_int(_hex("1f 9a"), 0, 5)
+
+class HuffmanTest(unittest.TestCase):
+    def test_strings_from_c4_c6(self):
+        self.assertEqual(huffman_decode(_hex("f1e3 c2e5 f23a 6ba0 ab90 f4ff")), b"www.example.com")
+        self.assertEqual(huffman_decode(_hex("a8eb 1064 9cbf")), b"no-cache")
+        self.assertEqual(huffman_decode(_hex("25a8 49e9 5ba9 7d7f")), b"custom-key")
+        self.assertEqual(huffman_decode(_hex("6402")), b"302")
+        self.assertEqual(huffman_decode(_hex("aec3 771a 4b")), b"private")
+
+    def test_bad_padding(self):
+        # padding precisa ser prefixo do EOS (só bits 1)
+        with self.assertRaises(HPACKError):
+            huffman_decode(_hex("a8eb 1064 9cbe"))
+
+class DecoderTest(unittest.TestCase):
+    def _run(self, dec: HPACKDecoder, blocks):
+        for block, headers, size in blocks:
+            self.assertEqual(dec.decode(_hex(block)), headers)
+            self.assertEqual(dec.size, size)
+
+    def test_c2_single_representations(self):
+        dec = HPACKDecoder()
+        self._run(dec, [
+            ("400a 6375 7374 6f6d 2d6b 6579 0d63 7573 746f 6d2d 6865 6164 6572",
+             [("custom-key", "custom-header")], 55),
+        ])
+        self._run(HPACKDecoder(), [("040c 2f73 616d 706c 652f 7061 7468", [(":path", "/sample/path")], 0)])
+        self._run(HPACKDecoder(), [("1008 7061 7373 776f 7264 0673 6563 7265 74", [("password", "secret")], 0)])
+        self._run(HPACKDecoder(), [("82", [(":method", "GET")], 0)])
+
+    _REQ1 = [(":method", "GET"), (":scheme", "http"), (":path", "/"), (":authority", "www.example.com")]
+    _REQ2 = _REQ1 + [("cache-control", "no-cache")]
+    _REQ3 = [(":method", "GET"), (":scheme", "https"), (":path", "/index.html"),
+             (":authority", "www.example.com"), ("custom-key", "custom-value")]
+
+    def test_c3_requests(self):
+        self._run(HPACKDecoder(), [
+            ("8286 8441 0f77 7777 2e65 7861 6d70 6c65 2e63 6f6d", self._REQ1, 57),
+            ("8286 84be 5808 6e6f 2d63 6163 6865", self._REQ2, 110),
+            ("8287 85bf 400a 6375 7374 6f6d 2d6b 6579 0c63 7573 746f 6d2d 7661 6c75 65", self._REQ3, 164),
+        ])
+
+    def test_c4_requests_huffman(self):
+        self._run(HPACKDecoder(), [
+            ("8286 8441 8cf1 e3c2 e5f2 3a6b a0ab 90f4 ff", self._REQ1, 57),
+            ("8286 84be 5886 a8eb 1064 9cbf", self._REQ2, 110),
+            ("8287 85bf 4088 25a8 49e9 5ba9 7d7f 8925 a849 e95b b8e8 b4bf", self._REQ3, 164),
+        ])
+
+    _DATE1 = "Mon, 21 Oct 2013 20:13:21 GMT"
+    _DATE2 = "Mon, 21 Oct 2013 20:13:22 GMT"
+    _LOC = "https://www.example.com"
+    _COOKIE = "foo=ASDJKHQKBZXOQWEOPIUAXQWEOIU; max-age=3600; version=1"
+
+    def _responses(self):
+        return [
+            [(":status", "302"), ("cache-control", "private"), ("date", self._DATE1), ("location", self._LOC)],
+            [(":status", "307"), ("cache-control", "private"), ("date", self._DATE1), ("location", self._LOC)],
+            [(":status", "200"), ("cache-control", "private"), ("date", self._DATE2), ("location", self._LOC),
+             ("content-encoding", "gzip"), ("set-cookie", self._COOKIE)],
+        ]
+
+    def test_c5_responses_with_eviction(self):
+        r1, r2, r3 = self._responses()
+        dec = HPACKDecoder(256)
+        self._run(dec, [
+            ("4803 3330 3258 0770 7269 7661 7465 611d 4d6f 6e2c 2032 3120 4f63 7420 3230 3133"
+             "2032 303a 3133 3a32 3120 474d 546e 1768 7474 7073 3a2f 2f77 7777 2e65 7861 6d70"
+             "6c65 2e63 6f6d", r1, 222),
+            ("4803 3330 37c1 c0bf", r2, 222),
+            ("88c1 611d 4d6f 6e2c 2032 3120 4f63 7420 3230 3133 2032 303a 3133 3a32 3220 474d"
+             "54c0 5a04 677a 6970 7738 666f 6f3d 4153 444a 4b48 514b 425a 584f 5157 454f 5049"
+             "5541 5851 5745 4f49 553b 206d 6178 2d61 6765 3d33 3630 303b 2076 6572 7369 6f6e"
+             "3d31", r3, 215),
+        ])
+        self.assertEqual(list(dec.dynamic), [("set-cookie", self._COOKIE), ("content-encoding", "gzip"),
+                                             ("date", self._DATE2)])
+
+    def test_c6_responses_huffman(self):
+        r1, r2, r3 = self._responses()
+        self._run(HPACKDecoder(256), [
+            ("4882 6402 5885 aec3 771a 4b61 96d0 7abe 9410 54d4 44a8 2005 9504 0b81 66e0 82a6"
+             "2d1b ff6e 919d 29ad 1718 63c7 8f0b 97c8 e9ae 82ae 43d3", r1, 222),
+            ("4883 640e ffc1 c0bf", r2, 222),
+            ("88c1 6196 d07a be94 1054 d444 a820 0595 040b 8166 e084 a62d 1bff c05a 839b d9ab"
+             "77ad 94e7 821d d7f2 e6c7 b335 dfdf cd5b 3960 d5af 2708 7f36 72c1 ab27 0fb5 291f"
+             "9587 3160 65c0 03ed 4ee5 b106 3d50 07", r3, 215),
+        ])
+
+    def test_table_size_update_above_announced(self):
+        with self.assertRaises(HPACKError):
+            HPACKDecoder(4096).decode(_encode_int(8192, 5, 0x20))
+
+    def test_index_out_of_range(self):
+        with self.assertRaises(HPACKError):
+            HPACKDecoder().decode(_encode_int(70, 7, 0x80))
+
+    def test_header_list_limit_counts_indexed_references(self):
+        # uma entrada de ~4 KB na tabela e depois 100 referências de 1 byte a ela
+        entry = b"\x40" + _encode_int(1, 7) + b"x" + _encode_int(4000, 7) + b"v" * 4000
+        dec = HPACKDecoder()
+        with self.assertRaises(HeaderListTooLarge):
+            dec.decode(entry + _encode_int(62, 7, 0x80) * 100, max_list=16384)
+        # o bloco foi lido inteiro: a tabela segue igual à do cliente
+        self.assertEqual(dec.size, 4033)
+        self.assertEqual(dec.decode(_encode_int(62, 7, 0x80), max_list=16384), [("x", "v" * 4000)])
+
+class EncoderTest(unittest.TestCase):
+    def test_static_exact_match_is_one_byte(self):
+        self.assertEqual(hpack_encode([(":status", "200")]), b"\x88")
+
+    def test_roundtrip(self):
+        headers = [(":status", "404"), ("content-type", "text/html; charset=utf-8"),
+                   ("x-brasa", "sim"), ("cache-control", "no-store")]
+        dec = HPACKDecoder()
+        self.assertEqual(dec.decode(hpack_encode(headers)), headers)
+        self.assertEqual(dec.size, 0)  # encoder sem indexação: não mexe na tabela do outro lado
+
+# ---------- framing ----------
+
+def _frame(ftype: int, flags: int, sid: int, payload: bytes = b"") -> bytes:
+    return struct.pack(">I", len(payload))[1:] + struct.pack(">BBI", ftype, flags, sid) + payload
+
+def _read_frame(sock: socket.socket) -> tuple[int, int, int, bytes]:
+    def exact(n):
+        buf = b""
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError
+            buf += chunk
+        return buf
+    head = exact(9)
+    length = int.from_bytes(head[:3], "big")
+    return head[3], head[4], int.from_bytes(head[5:9], "big"), exact(length) if length else b""
+
+class ConnectionTest(unittest.TestCase):
+    submit = None  # sem pool: handlers na thread da conexão
+
+    def setUp(self):
+        self.client, server = socket.socketpair()
+        self.client.settimeout(5)
+        self.handled = []
+
+        def handle(method, path, headers, body):
+            self.handled.append((method, path, headers, body))
+            return self.respond(path)
+
+        self.respond = lambda path: build_response(200, b"oi " + path.encode())
+        self.handle = handle
+        self.server = server
+        self.thread = None
+
+    def tearDown(self):
+        self.client.close()
+        if self.thread is not None:
+            self.thread.join(5)
+        self.server.close()
+
+    def _spawn(self):
+        self.thread = threading.Thread(
+            target=h2.serve_h2, args=(self.server, self.handle),
+            kwargs={"max_body": 1 << 20, "max_header": 16384, "submit": self.submit}, daemon=True)
+        self.thread.start()
+
+    def _start(self):
+        self._spawn()
+        self.client.sendall(h2.PREFACE + _frame(h2.SETTINGS, 0, 0))
+
+    def _request(self, sid: int, path: str, body: bytes = b"") -> None:
+        block = hpack_encode([(":method", "POST" if body else "GET"), (":scheme", "https"),
+                              (":path", path), (":authority", "x")])
+        flags = h2.FLAG_END_HEADERS | (0 if body else h2.FLAG_END_STREAM)
+        self.client.sendall(_frame(h2.HEADERS, flags, sid, block))
+        if body:
+            self.client.sendall(_frame(h2.DATA, h2.FLAG_END_STREAM, sid, body))
+
+    def _collect(self, sids: set[int]) -> dict[int, tuple[list, bytes]]:
+        """Lê frames até todos os `sids` terminarem: sid -> (headers, corpo)."""
+        dec = HPACKDecoder()
+        out: dict[int, list] = {}
+        open_ = set(sids)
+        while open_:
+            ftype, flags, sid, payload = _read_frame(self.client)
+            if ftype == h2.HEADERS:
+                out[sid] = [dec.decode(payload), b""]
+            elif ftype == h2.DATA:
+                out[sid][1] += payload
+            if ftype in (h2.HEADERS, h2.DATA) and flags & h2.FLAG_END_STREAM:
+                open_.discard(sid)
+        return {k: (v[0], v[1]) for k, v in out.items()}
+
+    def test_server_settings_first(self):
+        self._start()
+        ftype, flags, sid, payload = _read_frame(self.client)
+        self.assertEqual((ftype, flags, sid), (h2.SETTINGS, 0, 0))
+        settings = dict(struct.unpack(">HI", payload[i:i + 6]) for i in range(0, len(payload), 6))
+        self.assertEqual(settings[h2.SETTINGS_MAX_CONCURRENT_STREAMS], h2.MAX_STREAMS)
+
+    def test_multiplexed_streams(self):
+        self._start()
+        self._request(1, "/a")
+        self._request(3, "/b", body=b"corpo")
+        got = self._collect({1, 3})
+        self.assertEqual(got[1][1], b"oi /a")
+        self.assertEqual(got[3][1], b"oi /b")
+        self.assertIn((":status", "200"), got[1][0])
+        self.assertEqual(self.handled[1][3], b"corpo")
+
+    def test_ping_is_acked(self):
+        self._start()
+        self.client.sendall(_frame(h2.PING, 0, 0, b"12345678"))
+        while True:
+            ftype, flags, _sid, payload = _read_frame(self.client)
+            if ftype == h2.PING:
+                break
+        self.assertEqual((flags, payload), (h2.FLAG_ACK, b"12345678"))
+
+    def test_first_frame_must_be_settings(self):
+        self._spawn()
+        self.client.sendall(h2.PREFACE + _frame(h2.PING, 0, 0, b"12345678"))
+        while True:
+            ftype, _flags, _sid, payload = _read_frame(self.client)
+            if ftype == h2.GOAWAY:
+                break
+        self.assertEqual(struct.unpack(">II", payload)[1], h2.PROTOCOL_ERROR)
+
+    def _wait_rst(self) -> tuple[int, int]:
+        while True:
+            ftype, _flags, sid, payload = _read_frame(self.client)
+            if ftype == h2.RST_STREAM:
+                return sid, struct.unpack(">I", payload)[0]
+
+    def test_duplicate_headers_joined(self):
+        self._start()
+        block = hpack_encode([(":method", "GET"), (":scheme", "https"), (":path", "/"),
+                              ("cookie", "a=1"), ("x-a", "1"), ("cookie", "b=2"), ("x-a", "2")])
+        self.client.sendall(_frame(h2.HEADERS, h2.FLAG_END_HEADERS | h2.FLAG_END_STREAM, 1, block))
+        self._collect({1})
+        headers = self.handled[0][2]
+        self.assertEqual((headers["cookie"], headers["x-a"]), ("a=1; b=2", "1, 2"))
+
+    def test_header_bomb_resets_stream_only(self):
+        self._start()
+        entry = b"\x40" + _encode_int(1, 7) + b"x" + _encode_int(4000, 7) + b"v" * 4000
+        bomb = entry + _encode_int(62, 7, 0x80) * 100
+        self.client.sendall(_frame(h2.HEADERS, h2.FLAG_END_HEADERS | h2.FLAG_END_STREAM, 1, bomb))
+        self.assertEqual(self._wait_rst(), (1, h2.ENHANCE_YOUR_CALM))
+        self.assertEqual(self.handled, [])
+        # a conexão continua utilizável (tabela dinâmica em dia)
+        self._request(3, "/depois")
+        self.assertEqual(self._collect({3})[3][1], b"oi /depois")
+
+    def test_headers_on_half_closed_stream(self):
+        gate = threading.Event()
+
+        class Slow:
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                if not gate.is_set():
+                    return None
+                raise StopIteration
+
+        self.respond = lambda path: Response(200, Slow(), chunked=True)
+        self._start()
+        self._request(1, "/a")
+        while not self.handled:
+            pass
+        # HEADERS+END_STREAM de novo no mesmo stream: não roda o handler outra vez
+        self._request(1, "/a")
+        self.assertEqual(self._wait_rst(), (1, h2.STREAM_CLOSED))
+        gate.set()
+        self.assertEqual(len(self.handled), 1)
+
+    def test_event_stream_over_cap_is_shed(self):
+        closed = []
+
+        class Endless:
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                return None
+
+            def close(self):
+                closed.append(True)
+
+        self.respond = lambda path: Response(200, Endless(), content_type="text/event-stream", chunked=True)
+        old = h2.LIVE_CONN_LIMIT
+        h2.LIVE_CONN_LIMIT = 0
+        try:
+            self._start()
+            self._request(1, "/eventos")
+            got = self._collect({1})
+        finally:
+            h2.LIVE_CONN_LIMIT = old
+        self.assertEqual(got[1][1], f"retry: {h2.SHED_RETRY_MS}\n\n".encode())
+        self.assertEqual(closed, [True])
+
+def _thread_submit(run, expire) -> bool:
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
+class PooledConnectionTest(ConnectionTest):
+    """Os mesmos casos com os handlers rodando fora da thread da conexão, e mais os do pool."""
+    submit = staticmethod(_thread_submit)
+
+    def test_slow_stream_does_not_block_others(self):
+        gate = threading.Event()
+
+        def respond(path):
+            if path == "/lento":
+                gate.wait(5)
+            return build_response(200, path.encode())
+
+        self.respond = respond
+        self._start()
+        self._request(1, "/lento")
+        self._request(3, "/rapido")
+        self.assertEqual(self._collect({3})[3][1], b"/rapido")
+        gate.set()
+        self.assertEqual(self._collect({1})[1][1], b"/lento")
+
+    def test_inflight_bounded_per_connection(self):
+        gate = threading.Event()
+        running = []
+
+        def respond(path):
+            running.append(path)
+            gate.wait(5)
+            return build_response(200, b"ok")
+
+        self.respond = respond
+        self._start()
+        sids = set(range(1, 2 * (h2.MAX_INFLIGHT + 2), 2))
+        for sid in sorted(sids):
+            self._request(sid, f"/{sid}")
+        time.sleep(0.2)
+        self.assertEqual(len(running), h2.MAX_INFLIGHT)
+        gate.set()
+        self.assertEqual(set(self._collect(sids)), sids)
+
+    def test_pool_full_refuses_stream(self):
+        self.submit = lambda run, expire: False
+        self._start()
+        self._request(1, "/a")
+        self.assertEqual(self._wait_rst(), (1, h2.REFUSED_STREAM))
+        self.assertEqual(self.handled, [])
+
+    def test_expired_in_queue_gets_503(self):
+        self.submit = lambda run, expire: threading.Thread(target=expire, daemon=True).start() or True
+        self._start()
+        self._request(1, "/a")
+        headers, _body = self._collect({1})[1]
+        self.assertIn((":status", "503"), headers)
+        self.assertEqual(self.handled, [])
+
+    def test_reset_while_running_closes_body(self):
+        gate = threading.Event()
+        closed = threading.Event()
+
+        class Body:
+            def __iter__(self):
+                return iter([b"x"])
+
+            def close(self):
+                closed.set()
+
+        def respond(path):
+            gate.wait(5)
+            return Response(200, Body(), chunked=True)
+
+        self.respond = respond
+        self._start()
+        self._request(1, "/a")
+        while not self.handled:
+            pass
+        self.client.sendall(_frame(h2.RST_STREAM, 0, 1, struct.pack(">I", h2.CANCEL)))
+        self.client.sendall(_frame(h2.PING, 0, 0, b"sincroni"))
+        while _read_frame(self.client)[0] != h2.PING:
+            pass
+        gate.set()
+        self.assertTrue(closed.wait(5))
+
+if __name__ == "__main__":
+    unittest.main()
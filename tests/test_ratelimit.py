@@ -0,0 +1,175 @@
+"""Contas do token bucket (local e compartilhado) e do teto de conexões por IP."""
+import os
+import unittest
+from unittest import mock
+
+from app.config import RateLimitCfg
+from app.ratelimit import ConnectionLimiter, RateLimiter, SharedBuckets, TokenBuckets
+from app.shm import SharedTable
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+class _BucketMath:
+    """Mesmos casos para TokenBuckets e SharedBuckets."""
+    def make(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch("app.ratelimit.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buckets = self.make()
+
+    def test_burst_then_wait(self):
+        b = self.buckets
+        for _ in range(3):
+            self.assertEqual(b.take("ip", 2.0, 3.0), 0.0)
+        # balde vazio a 2 fichas/s: falta meio segundo
+        self.assertAlmostEqual(b.take("ip", 2.0, 3.0), 0.5)
+
+    def test_refill_capped_at_burst(self):
+        b = self.buckets
+        for _ in range(3):
+            b.take("ip", 1.0, 3.0)
+        self.clock.now += 1.25
+        self.assertEqual(b.take("ip", 1.0, 3.0), 0.0)      # 1.25 -> 0.25
+        self.assertAlmostEqual(b.take("ip", 1.0, 3.0), 0.75)
+        self.clock.now += 100.0
+        for _ in range(3):
+            self.assertEqual(b.take("ip", 1.0, 3.0), 0.0)
+        self.assertGreater(b.take("ip", 1.0, 3.0), 0.0)   # não acumulou além do burst
+
+    def test_keys_are_independent(self):
+        b = self.buckets
+        self.assertEqual(b.take("a", 1.0, 1.0), 0.0)
+        self.assertGreater(b.take("a", 1.0, 1.0), 0.0)
+        self.assertEqual(b.take(("a", "POST /recados"), 1.0, 1.0), 0.0)
+
+    def test_zero_rate_waits_idle_ttl(self):
+        b = self.buckets
+        b.take("ip", 0.0, 1.0)
+        self.assertEqual(b.take("ip", 0.0, 1.0), 600.0)
+
+class TokenBucketsTest(_BucketMath, unittest.TestCase):
+    def make(self):
+        return TokenBuckets(shards=1, max_keys=2, idle_ttl=600.0)
+
+    def test_lru_bounded(self):
+        b = self.buckets
+        for key in ("a", "b", "c"):
+            b.take(key, 1.0, 1.0)
+        self.assertEqual(len(b), 2)
+        # "a" saiu: volta com balde cheio
+        self.assertEqual(b.take("a", 1.0, 1.0), 0.0)
+
+    def test_idle_keys_evicted(self):
+        b = TokenBuckets(shards=1, max_keys=100, idle_ttl=10.0)
+        b.take("a", 1.0, 1.0)
+        self.clock.now += 11.0
+        b.take("b", 1.0, 1.0)
+        self.assertEqual(len(b), 1)
+
+class SharedBucketsTest(_BucketMath, unittest.TestCase):
+    def make(self):
+        self.table = SharedTable(f"brasa-test-{os.getpid()}-{id(self)}", slots=64)
+        self.addCleanup(self.table.close, True)
+        return SharedBuckets(self.table, idle_ttl=600.0)
+
+    def test_tuple_keys_joined(self):
+        self.buckets.take(("1.2.3.4", "POST /recados"), 1.0, 2.0)
+        self.assertEqual(self.table.get("1.2.3.4|POST /recados"), (1.0, 1000.0))
+
+class RateLimiterReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch("app.ratelimit.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reload_keeps_spent_buckets(self):
+        lim = RateLimiter(RateLimitCfg(rate=1.0, burst=2.0))
+        lim.check("ip", "GET", "/")
+        lim.check("ip", "GET", "/")
+        self.assertGreater(lim.check("ip", "GET", "/"), 0)
+        # SIGHUP com o mesmo config, ou com burst maior: nada de balde cheio de graça
+        lim.configure(RateLimitCfg(rate=1.0, burst=2.0))
+        self.assertGreater(lim.check("ip", "GET", "/"), 0)
+        lim.configure(RateLimitCfg(rate=1.0, burst=50.0))
+        self.assertGreater(lim.check("ip", "GET", "/"), 0)
+
+    def test_reload_applies_new_limits(self):
+        lim = RateLimiter(RateLimitCfg(rate=1.0, burst=2.0))
+        lim.configure(RateLimitCfg(rate=1.0, burst=2.0, routes={"POST /eco": {"burst": 1}}))
+        self.assertEqual(lim.check("ip", "POST", "/eco"), 0.0)
+        self.assertGreater(lim.check("ip", "POST", "/eco"), 0)
+        lim.configure(RateLimitCfg(rate=1.0, burst=2.0, max_keys=16))
+        self.assertEqual(lim.buckets._per_shard, 1)
+
+class ConnectionLimiterTest(unittest.TestCase):
+    def test_local_cap(self):
+        lim = ConnectionLimiter(2)
+        self.assertTrue(lim.acquire("ip"))
+        self.assertTrue(lim.acquire("ip"))
+        self.assertFalse(lim.acquire("ip"))
+        self.assertTrue(lim.acquire("outro"))
+        lim.release("ip")
+        self.assertTrue(lim.acquire("ip"))
+        for _ in range(3):
+            lim.release("ip")
+        self.assertEqual(lim._open, {"outro": 1})
+
+    def _shared(self):
+        table = SharedTable(f"brasa-test-{os.getpid()}-{id(self)}", slots=64)
+        self.addCleanup(table.close, True)
+        return table
+
+    def test_shared_cap_and_ledger(self):
+        table = self._shared()
+        lim = ConnectionLimiter(2, shared=table)
+        self.assertTrue(lim.acquire("ip"))
+        self.assertTrue(lim.acquire("ip"))
+        self.assertFalse(lim.acquire("ip"))
+        self.assertEqual(table.get("ip")[0], 2.0)
+        self.assertEqual(table.get(f"{os.getpid()}|ip")[0], 2.0)
+        lim.release("ip")
+        lim.release("ip")
+        self.assertIsNone(table.get("ip"))
+        self.assertIsNone(table.get(f"{os.getpid()}|ip"))
+
+    def test_forget_process_returns_dead_counts(self):
+        table = self._shared()
+        lim = ConnectionLimiter(3, shared=table)
+        lim.acquire("ip")
+        # outro processo (já morto) segurava duas conexões do mesmo IP
+        table.add("99999999|ip", 2.0)
+        table.add("ip", 2.0)
+        self.assertFalse(lim.acquire("ip"))
+        self.assertEqual(lim.forget_process(99999999), 2)
+        self.assertEqual(table.get("ip")[0], 1.0)
+        self.assertIsNone(table.get("99999999|ip"))
+        self.assertTrue(lim.acquire("ip"))
+        self.assertEqual(lim.forget_process(99999999), 0)
+
+    def test_total_and_ledger_move_together(self):
+        table = self._shared()
+        lim = ConnectionLimiter(1, shared=table)
+        calls = []
+        real = table.update
+        with mock.patch.object(table, "update", side_effect=lambda *a: calls.append(a) or real(*a)):
+            self.assertTrue(lim.acquire("ip"))
+            self.assertFalse(lim.acquire("ip"))
+            lim.release("ip")
+        self.assertEqual(calls, [])  # só update_pair: nada fica anotado pela metade
+        self.assertEqual(list(table.items()), [])
+
+    def test_forget_process_local_is_noop(self):
+        self.assertEqual(ConnectionLimiter(1).forget_process(1), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+"""Cache de respostas (variantes identidade/gzip, invalidação por tópico) e single-flight."""
+import gzip
+import threading
+import unittest
+
+from app import pubsub
+from app.respcache import GZIP_MIN, ResponseCache, cache_key
+from app.responses import build_response
+from app.singleflight import SingleFlight
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_bytes=1 << 20)
+        self.calls = 0
+
+    def _compute(self, body: bytes = b"x" * GZIP_MIN):
+        def fn():
+            self.calls += 1
+            return build_response(200, body, content_type="text/html; charset=utf-8")
+        return fn
+
+    def test_key_normalizes_query(self):
+        self.assertEqual(cache_key("/p", {"b": ["2"], "a": ["1"]}), cache_key("/p", {"a": ["1"], "b": ["2"]}))
+        self.assertEqual(cache_key("/p", {}), "/p")
+
+    def test_miss_then_hit_in_both_encodings(self):
+        first = self.cache.fetch("/p", None, 60, (), self._compute())
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        self.assertEqual(first.headers["Vary"], "Accept-Encoding")
+        plain = self.cache.fetch("/p", None, 60, (), self._compute())
+        gz = self.cache.fetch("/p", "br, GZIP", 60, (), self._compute())
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(plain.headers["X-Cache"], "HIT")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.body_bytes(), b"x" * GZIP_MIN)
+        self.assertEqual(gz.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(gz.body_bytes()), b"x" * GZIP_MIN)
+
+    def test_small_body_has_no_gzip_variant(self):
+        self.cache.fetch("/p", "gzip", 60, (), self._compute(b"curto"))
+        hit = self.cache.fetch("/p", "gzip", 60, (), self._compute(b"curto"))
+        self.assertEqual(hit.headers["X-Cache"], "HIT")
+        self.assertNotIn("Content-Encoding", hit.headers)
+        self.assertNotIn("Vary", hit.headers)
+
+    def test_gzipped_handler_response_keeps_plain_variant(self):
+        body = b"y" * 1000
+        compute = lambda: build_response(200, gzip.compress(body), extra_headers={"Content-Encoding": "gzip"},
+                                         content_type="text/html; charset=utf-8")
+        self.cache.fetch("/p", "gzip", 60, (), compute)
+        self.assertEqual(self.cache.fetch("/p", None, 60, (), compute).body_bytes(), body)
+
+    def test_only_shareable_responses_stored(self):
+        for resp in (build_response(404, b"nada"),
+                     build_response(200, b"oi", extra_headers={"Set-Cookie": "sid=1"})):
+            self.cache.fetch("/p", None, 60, (), lambda: resp)
+        self.assertEqual(self.cache.stats()[0], 0)
+
+    def test_ttl_expiry(self):
+        self.cache.fetch("/p", None, -1, (), self._compute())
+        self.cache.fetch("/p", None, 60, (), self._compute())
+        self.assertEqual(self.calls, 2)
+
+    def test_topic_invalidation_via_pubsub(self):
+        topic = f"teste-{id(self)}"
+        self.cache.watch(topic)
+        self.cache.fetch("/a", None, 60, (topic,), self._compute())
+        self.cache.fetch("/b", None, 60, (), self._compute())
+        pubsub.publish(topic, None)
+        self.assertEqual(self.cache.fetch("/a", None, 60, (topic,), self._compute()).headers["X-Cache"], "MISS")
+        self.assertEqual(self.cache.fetch("/b", None, 60, (), self._compute()).headers["X-Cache"], "HIT")
+
+    def test_write_during_miss_not_stored(self):
+        topic = f"teste-{id(self)}"
+        self.cache.watch(topic)
+
+        def racing():
+            self.cache.invalidate(topic)  # escrita chegou enquanto o handler rodava
+            return self._compute()()
+
+        self.cache.fetch("/a", None, 60, (topic,), racing)
+        self.assertEqual(self.cache.stats(), (0, 0))
+
+    def test_lru_budget(self):
+        one = 100 + 512  # corpo + _ENTRY_OVERHEAD
+        cache = ResponseCache(max_bytes=8 * one)
+        for i in range(8):
+            cache.fetch(f"/p{i}", None, 60, (), self._compute(b"z" * 100))
+        cache.fetch("/p0", None, 60, (), self._compute(b"z" * 100))  # /p0 vira o mais recente
+        cache.fetch("/p8", None, 60, (), self._compute(b"z" * 100))
+        self.assertEqual(cache.stats(), (8, 8 * one))
+        self.assertEqual(cache.fetch("/p0", None, 60, (), self._compute()).headers["X-Cache"], "HIT")
+        self.assertEqual(cache.fetch("/p1", None, 60, (), self._compute()).headers["X-Cache"], "MISS")
+
+class SingleFlightTest(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight(timeout=5)
+        gate = threading.Event()
+        runs = []
+        results = []
+
+        def slow():
+            runs.append(1)
+            gate.wait(5)
+            return "feito"
+
+        def call():
+            results.append(flight.do("k", slow))
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        threads[0].start()
+        while not runs:
+            pass
+        for th in threads[1:]:
+            th.start()
+        while flight._calls["k"].waiters < 4:
+            pass
+        gate.set()
+        for th in threads:
+            th.join()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(sorted(results), [("feito", False)] + [("feito", True)] * 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_error_reaches_waiters(self):
+        flight = SingleFlight(timeout=5)
+        gate = threading.Event()
+        errors = []
+
+        def boom():
+            gate.wait(5)
+            raise RuntimeError("falhou")
+
+        def call():
+            try:
+                flight.do("k", boom)
+            except RuntimeError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        while "k" not in flight._calls:
+            pass
+        waiter = threading.Thread(target=call)
+        waiter.start()
+        while flight._calls["k"].waiters < 1:
+            pass
+        gate.set()
+        leader.join()
+        waiter.join()
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+
+    def test_waiter_timeout_runs_alone(self):
+        flight = SingleFlight(timeout=0.01)
+        gate = threading.Event()
+        leader = threading.Thread(target=flight.do, args=("k", lambda: gate.wait(5)))
+        leader.start()
+        while "k" not in flight._calls:
+            pass
+        self.assertEqual(flight.do("k", lambda: "sozinho"), ("sozinho", False))
+        gate.set()
+        leader.join()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Respostas HTTP/1.1: head pré-montado, framing chunked e envio scatter-gather."""
+import socket
+import threading
+import unittest
+
+from app import responses
+from app.responses import Response, build_chunked_response, build_response, send_response
+
+def _recv_all(sock: socket.socket) -> bytes:
+    out = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return out
+        out += chunk
+
+class HeadTest(unittest.TestCase):
+    def test_head_layout(self):
+        head = build_response(404, b"nada", {"X-A": "1"}).head().decode("iso-8859-1")
+        lines = head.split("\r\n")
+        self.assertEqual(lines[0], "HTTP/1.1 404 Not Found")
+        self.assertTrue(lines[1].startswith("Date: ") and lines[1].endswith(" GMT"))
+        self.assertIn("Content-Length: 4", lines)
+        self.assertIn("X-A: 1", lines)
+        self.assertIn("Connection: close", lines)
+        self.assertTrue(head.endswith("\r\n\r\n"))
+
+    def test_explicit_content_length_wins(self):
+        resp = build_response(200, b"", {"Content-Length": "99"})
+        self.assertEqual(resp.content_length, 99)
+        self.assertEqual(resp.head().count(b"Content-Length"), 1)
+
+    def test_chunked_framing(self):
+        resp = build_chunked_response(200, [b"abc", b"", b"0123456789abcdef"])
+        raw = bytes(resp)
+        head, body = raw.split(b"\r\n\r\n", 1)
+        self.assertIn(b"Transfer-Encoding: chunked", head)
+        self.assertNotIn(b"Content-Length", head)
+        self.assertEqual(body, b"3\r\nabc\r\n10\r\n0123456789abcdef\r\n0\r\n\r\n")
+
+class _FakeTLS:
+    """Sem sendmsg, como SSLSocket: registra cada sendall."""
+    def __init__(self):
+        self.calls: list[bytes] = []
+
+    def sendall(self, data) -> None:
+        self.calls.append(bytes(data))
+
+class _Partial:
+    """socket.socket de mentira cujo sendmsg aceita só alguns bytes por vez."""
+    def __init__(self, step: int):
+        self.step = step
+        self.out = b""
+
+    def sendmsg(self, views) -> int:
+        data = b"".join(bytes(v) for v in views)[:self.step]
+        self.out += data
+        return len(data)
+
+class SendTest(unittest.TestCase):
+    def test_sendmsg_over_socketpair(self):
+        a, b = socket.socketpair()
+        body = [b"x" * 100_000, b"y" * 10]
+        resp = Response(200, body)
+        got = []
+        reader = threading.Thread(target=lambda: got.append(_recv_all(b)))
+        reader.start()
+        try:
+            self.assertEqual(send_response(a, resp), 100_010)
+        finally:
+            a.close()
+        reader.join(5)
+        b.close()
+        self.assertEqual(got[0], resp.head() + b"".join(body))
+
+    def test_partial_sendmsg_resumes(self):
+        conn = _Partial(step=7)
+        bufs = [b"cabecalho\r\n", b"", b"corpo-1", b"corpo-2-maior"]
+        responses._sendmsg_all(conn, bufs)
+        self.assertEqual(conn.out, b"".join(bufs))
+
+    def test_tls_small_response_is_one_write(self):
+        conn = _FakeTLS()
+        resp = build_response(200, b"<p>oi</p>")
+        send_response(conn, resp)
+        self.assertEqual(len(conn.calls), 1)
+        self.assertTrue(conn.calls[0].endswith(b"\r\n\r\n<p>oi</p>"))
+
+    def test_tls_large_body_not_copied_into_head(self):
+        conn = _FakeTLS()
+        big = b"z" * responses._JOIN_MAX
+        send_response(conn, Response(200, [b"a", big, b"b"]))
+        self.assertEqual([len(c) for c in conn.calls[1:]], [len(big), 1])
+        self.assertTrue(conn.calls[0].endswith(b"\r\n\r\na"))
+
+    def test_tls_chunked_batched(self):
+        conn = _FakeTLS()
+        send_response(conn, build_chunked_response(200, [b"um", b"dois"]))
+        self.assertEqual(len(conn.calls), 1)
+        self.assertTrue(conn.calls[0].endswith(b"2\r\num\r\n4\r\ndois\r\n0\r\n\r\n"))
+
+    def test_head_only(self):
+        conn = _FakeTLS()
+        self.assertEqual(send_response(conn, build_response(200, b"corpo"), head_only=True), 0)
+        self.assertEqual(len(conn.calls), 1)
+        self.assertTrue(conn.calls[0].endswith(b"Content-Length: 5\r\n\r\n"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Servidor: prazos de leitura, probes, handoff do socket de escuta, recusa rápida (503/429) e 413 para corpo grande."""
+import os
+import socket
+import time
+import unittest
+from unittest import mock
+
+from app import server
+
+def _read_all(sock: socket.socket) -> bytes:
+    sock.settimeout(2)
+    out = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return out
+        out += chunk
+
+class DeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        self.addCleanup(self.a.close)
+        self.addCleanup(self.b.close)
+
+    def test_header_deadline_is_absolute(self):
+        # headers incompletos: estoura no prazo passado, que vale para a leitura inteira
+        self.a.sendall(b"GET / HTTP/1.1\r\n")
+        deadline = time.monotonic() + 0.2
+        t0 = time.monotonic()
+        with self.assertRaises(socket.timeout):
+            server.read_request(self.b, deadline)
+        self.assertLess(time.monotonic() - t0, 1.0)
+
+    def test_body_must_keep_min_rate(self):
+        self.a.sendall(b"POST / HTTP/1.1\r\nContent-Length: 1000\r\n\r\nabc")
+        with mock.patch.object(server, "BODY_GRACE", 0.1), mock.patch.object(server, "BODY_MIN_RATE", 1e6):
+            with self.assertRaises(socket.timeout):
+                server.read_request(self.b, time.monotonic() + 5)
+
+    def test_complete_request_within_deadline(self):
+        self.a.sendall(b"POST /eco HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc")
+        method, target, _version, headers, body = server.read_request(self.b, time.monotonic() + 1)
+        self.assertEqual((method, target, headers["content-length"], body), ("POST", "/eco", "3", b"abc"))
+
+class ProbeTest(unittest.TestCase):
+    def test_readyz_follows_phase(self):
+        for phase, status in (("warming", 503), ("ready", 200), ("draining", 503)):
+            with mock.patch.object(server, "_PHASE", phase):
+                resp = server._probe("GET", "/readyz")
+                self.assertEqual(resp.status, status, phase)
+                if status == 503:
+                    self.assertIn(phase.encode(), bytes(resp))
+
+    def test_healthz_ok_while_warming(self):
+        with mock.patch.object(server, "_PHASE", "warming"):
+            self.assertEqual(server._probe("GET", "/healthz?x=1").status, 200)
+
+    def test_other_requests_go_to_router(self):
+        with mock.patch.object(server, "_PHASE", "ready"):
+            self.assertIsNone(server._probe("POST", "/readyz"))
+            self.assertIsNone(server._probe("GET", "/readyz/x"))
+            self.assertIsNone(server._probe("GET", "/"))
+
+class HandoffTest(unittest.TestCase):
+    def test_inherits_listening_socket(self):
+        old = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        old.bind(("127.0.0.1", 0))
+        old.listen(1)
+        self.addCleanup(old.close)
+        fd = os.dup(old.fileno())
+        with mock.patch.dict(os.environ, {server.LISTEN_FD_ENV: str(fd)}):
+            srv = server._open_listener("127.0.0.1", 1, 1)  # porta ignorada: o socket já vem pronto
+            self.assertNotIn(server.LISTEN_FD_ENV, os.environ)  # netos não herdam
+        with srv:
+            self.assertEqual(srv.getsockname(), old.getsockname())
+            # conexões na fila do socket antigo chegam ao novo processo
+            with socket.create_connection(old.getsockname(), timeout=2):
+                conn, _ = srv.accept()
+                conn.close()
+
+    def test_notify_ready_writes_once(self):
+        r, w = os.pipe()
+        self.addCleanup(os.close, r)
+        with mock.patch.dict(os.environ, {server.READY_FD_ENV: str(w)}):
+            server._notify_ready()
+            server._notify_ready()  # segunda vez: env já consumido, não faz nada
+        self.assertEqual(os.read(r, 8), b"1")
+        self.assertEqual(os.read(r, 8), b"")  # o filho fechou a ponta de escrita
+
+class ShedTest(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        self.addCleanup(self.a.close)
+        self.addCleanup(self.b.close)
+
+    def test_503_and_429_have_own_messages(self):
+        server._shed(self.a, ("1.2.3.4", 0), 503, 2, "fila cheia")
+        busy = _read_all(self.b)
+        self.assertTrue(busy.startswith(b"HTTP/1.1 503 "))
+        self.assertIn(b"Retry-After: 2\r\n", busy)
+        self.assertIn("Servidor ocupado".encode(), busy)
+        a, b = socket.socketpair()
+        with a, b:
+            server._shed(a, ("1.2.3.4", 0), 429, 2, "conexões demais")
+            limited = _read_all(b)
+        self.assertTrue(limited.startswith(b"HTTP/1.1 429 "))
+        self.assertNotIn("Servidor ocupado".encode(), limited)
+        self.assertIn("seu endereço".encode(), limited)
+
+    def test_client_not_reading_does_not_block_accept_loop(self):
+        self.a.setblocking(False)
+        try:
+            while True:
+                self.a.send(b"x" * 65536)
+        except BlockingIOError:
+            pass
+        self.a.setblocking(True)
+        t0 = time.monotonic()
+        server._shed(self.a, ("1.2.3.4", 0), 503, 2, "fila cheia")
+        self.assertLess(time.monotonic() - t0, 0.2)
+        self.assertEqual(self.a.fileno(), -1)  # fechada
+
+class BodyLimitTest(unittest.TestCase):
+    def _post(self, target: str) -> bytes:
+        a, b = socket.socketpair()
+        with a, b:
+            a.sendall(f"POST {target} HTTP/1.1\r\nHost: x\r\n"
+                      f"Content-Length: {server.MAX_BODY + 1}\r\n\r\n".encode())
+            a.shutdown(socket.SHUT_WR)  # o servidor descarta o resto até o EOF antes de fechar
+            _req, resp, _sent = server._serve(b, ("1.2.3.4", 0), False)
+            self.assertEqual(resp.status, 413)
+            return _read_all(a)
+
+    def test_import_over_limit_points_to_cli(self):
+        # responde sem esperar o corpo: o cliente não chegou a mandar nada dele
+        out = self._post("/admin/import?tabela=love_notes")
+        self.assertTrue(out.startswith(b"HTTP/1.1 413 Payload Too Large\r\n"))
+        self.assertIn(b"python -m app.backup import", out)
+
+    def test_other_paths_get_plain_413(self):
+        out = self._post("/eco")
+        self.assertTrue(out.startswith(b"HTTP/1.1 413 "))
+        self.assertNotIn(b"app.backup", out)
+
+if __name__ == "__main__":
+    unittest.main()
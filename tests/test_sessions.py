@@ -0,0 +1,54 @@
+"""Tokens assinados: verificação e revogação (logout)."""
+import json
+import time
+import unittest
+from unittest import mock
+
+from app import sessions
+from app.sessions import _b64u_encode, issue_token, revoke_token, verify_token
+
+class RevokeTest(unittest.TestCase):
+    def setUp(self):
+        for patcher in (mock.patch.object(sessions, "_SECRET", b"k" * 32),
+                        mock.patch.object(sessions, "_revoked", None),
+                        mock.patch.object(sessions, "_local_revoked", sessions._LocalRevoked(4)),
+                        mock.patch.object(sessions, "_verified", sessions._VerifiedCache(16))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_logout_revokes_valid_token(self):
+        tok = issue_token({"u": "ana"}, max_age=60)
+        self.assertEqual(verify_token(tok), {"u": "ana"})
+        revoke_token(tok)
+        self.assertIsNone(verify_token(tok))
+        exp = sessions._local_revoked._exp[sessions._revocation_key(tok)]
+        self.assertAlmostEqual(exp, time.time() + 60, delta=2)
+
+    def test_forged_tokens_not_stored(self):
+        real = issue_token({"u": "ana"}, max_age=60)
+        revoke_token(real)
+        far = _b64u_encode(str(int(time.time()) + 10**9).encode())
+        data = _b64u_encode(json.dumps({"u": "x"}).encode())
+        for i in range(10):
+            revoke_token(f"{data}.{far}.{_b64u_encode(bytes([i]) * 32)}")
+        self.assertEqual(len(sessions._local_revoked._exp), 1)
+        self.assertIsNone(verify_token(real))  # a revogação de verdade continua lá
+
+    def test_malformed_token_ignored(self):
+        for tok in ("", "abc", "a.%%%.c", "a.b.c.d"):
+            revoke_token(tok)
+        self.assertEqual(sessions._local_revoked._exp, {})
+
+    def test_shared_table_gets_verified_ttl(self):
+        table = mock.Mock()
+        table.get.return_value = None
+        with mock.patch.object(sessions, "_revoked", table):
+            tok = issue_token({"u": "ana"}, max_age=120)
+            revoke_token(tok)
+            revoke_token("x.y.z")
+        ((key, value), kwargs), = [(c.args, c.kwargs) for c in table.set.call_args_list]
+        self.assertEqual(key, sessions._revocation_key(tok))
+        self.assertAlmostEqual(kwargs["ttl"], 120, delta=2)
+
+if __name__ == "__main__":
+    unittest.main()
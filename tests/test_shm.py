@@ -0,0 +1,104 @@
+"""SharedTable: atualização atômica, despejo no balde cheio e chaves longas."""
+import os
+import threading
+import unittest
+
+from app.shm import WAYS, SharedTable
+
+class SharedTableTest(unittest.TestCase):
+    def setUp(self):
+        # WAYS slots = um balde só: dá para prever quem sai
+        self.table = SharedTable(f"brasa-test-{os.getpid()}-{id(self)}", slots=WAYS)
+
+    def tearDown(self):
+        self.table.close(unlink=True)
+
+    def test_update_get_delete(self):
+        t = self.table
+        self.assertIsNone(t.get("a"))
+        self.assertEqual(t.update("a", lambda a, b: (1.0, 2.0, "novo" if a is None else "velho"), 60), "novo")
+        self.assertEqual(t.update("a", lambda a, b: (a, b, "novo" if a is None else "velho"), 60), "velho")
+        self.assertEqual(t.get("a"), (1.0, 2.0))
+        t.delete("a")
+        self.assertIsNone(t.get("a"))
+
+    def test_add_is_atomic_across_threads(self):
+        def worker():
+            for _ in range(500):
+                self.table.add("n", 1.0)
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.assertEqual(self.table.get("n"), (2000.0, 0.0))
+
+    def test_full_bucket_evicts_soonest_expiry(self):
+        t = self.table
+        for i in range(WAYS):
+            t.set(f"k{i}", float(i), ttl=100.0 + i)
+        t.set("novo", 99.0, ttl=50.0)
+        self.assertIsNone(t.get("k0"))  # vencia primeiro
+        self.assertEqual(t.get("novo"), (99.0, 0.0))
+        self.assertEqual(len(list(t.items())), WAYS)
+
+    def test_expired_slot_is_reused_first(self):
+        t = self.table
+        for i in range(WAYS):
+            t.set(f"k{i}", float(i), ttl=100.0)
+        t.set("k3", 3.0, ttl=-1.0)  # já vencida
+        self.assertIsNone(t.get("k3"))
+        t.set("novo", 1.0, ttl=10.0)  # vence antes de todas, mas há slot vencido
+        self.assertEqual({k for k, _a, _b in t.items()}, {f"k{i}" for i in range(WAYS) if i != 3} | {"novo"})
+
+    def test_update_returning_none_deletes(self):
+        self.table.set("a", 1.0)
+        self.assertEqual(self.table.update("a", lambda a, b: (None, None, a), 0), 1.0)
+        self.assertIsNone(self.table.get("a"))
+
+    def test_long_keys_hashed_and_not_listed(self):
+        long_key = "x" * 100
+        self.table.set(long_key, 7.0)
+        self.table.set("x" * 99, 8.0)
+        self.assertEqual(self.table.get(long_key), (7.0, 0.0))
+        self.assertEqual(self.table.get("x" * 99), (8.0, 0.0))
+        self.assertEqual(list(self.table.items()), [])
+
+    def test_update_pair_same_bucket(self):
+        t = self.table
+        t.set("a", 1.0)
+        res = t.update_pair("a", "b", lambda a1, b1, a2, b2: (a1 + 1.0, b1, (a2 or 0.0) + 5.0, b2, (a1, a2)), 60)
+        self.assertEqual(res, (1.0, None))
+        self.assertEqual((t.get("a"), t.get("b")), ((2.0, 0.0), (5.0, 0.0)))
+        t.update_pair("a", "b", lambda *_: (None, None, None, None, None), 0)
+        self.assertEqual(list(t.items()), [])
+
+    def test_update_pair_across_stripes_from_threads(self):
+        big = SharedTable(f"{self.table.name}-big", slots=WAYS * 128)
+        self.addCleanup(big.close, True)
+
+        def inc(a1, b1, a2, b2):
+            return (a1 or 0.0) + 1.0, b1, (a2 or 0.0) + 1.0, b2, None
+
+        def worker(k1, k2):
+            for _ in range(300):
+                big.update_pair(k1, k2, inc, 60)
+        # ordens opostas: sem a trava em ordem fixa isto travaria
+        threads = [threading.Thread(target=worker, args=("x", "y")), threading.Thread(target=worker, args=("y", "x"))]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join(10)
+        self.assertEqual((big.get("x"), big.get("y")), ((600.0, 0.0), (600.0, 0.0)))
+
+    def test_second_open_inherits_state(self):
+        self.table.set("a", 5.0)
+        other = SharedTable(self.table.name, slots=WAYS)
+        try:
+            self.assertFalse(other.created)
+            self.assertEqual(other.get("a"), (5.0, 0.0))
+        finally:
+            other.close()
+
+if __name__ == "__main__":
+    unittest.main()
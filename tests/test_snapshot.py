@@ -0,0 +1,72 @@
+"""Snapshots pré-renderizados: variantes, ETag, falhas de render e gravação em disco."""
+import gzip
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app import snapshot
+from app.responses import build_response
+
+def _page(body: bytes):
+    return lambda: build_response(200, body, content_type="text/html; charset=utf-8")
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        for patcher in (mock.patch.object(snapshot, "_renders", {}),
+                        mock.patch.object(snapshot, "_snaps", {}),
+                        mock.patch.object(snapshot, "enabled", True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.big = b"<p>sobre</p>" * 100
+        snapshot.register("/", _page(b"<h1>oi</h1>"))
+        snapshot.register("/sobre", _page(self.big))
+
+    def test_rebuild_and_serve(self):
+        self.assertEqual(snapshot.rebuild(), 2)
+        self.assertEqual(snapshot.paths(), ["/", "/sobre"])
+        plain = snapshot.serve("/sobre", {})
+        gz = snapshot.serve("/sobre", {"accept-encoding": "gzip, br"})
+        self.assertEqual(plain.body_bytes(), self.big)
+        self.assertEqual(gzip.decompress(gz.body_bytes()), self.big)
+        self.assertNotEqual(plain.headers["ETag"], gz.headers["ETag"])
+        self.assertEqual(plain.headers["X-Cache"], "SNAPSHOT")
+        # pequeno: sem variante gzip nem Vary
+        small = snapshot.serve("/", {"accept-encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", small.headers)
+        self.assertNotIn("Vary", small.headers)
+
+    def test_if_none_match(self):
+        snapshot.rebuild()
+        etag = snapshot.serve("/sobre", {}).headers["ETag"]
+        resp = snapshot.serve("/sobre", {"if-none-match": f'"x", W/{etag}'})
+        self.assertEqual(resp.status, 304)
+        self.assertEqual(resp.headers["ETag"], etag)
+
+    def test_failing_or_dynamic_render_stays_live(self):
+        def boom():
+            raise RuntimeError("template quebrado")
+        snapshot.register("/quebrada", boom)
+        snapshot.register("/nao", lambda: build_response(404, b"x"))
+        with self.assertLogs("brasa.app", "ERROR"):
+            self.assertEqual(snapshot.rebuild(), 2)
+        self.assertIsNone(snapshot.serve("/quebrada", {}))
+        self.assertIsNone(snapshot.serve("/nao", {}))
+
+    def test_disabled(self):
+        snapshot.rebuild()
+        with mock.patch.object(snapshot, "enabled", False):
+            self.assertIsNone(snapshot.serve("/", {}))
+
+    def test_write_dir(self):
+        snapshot.rebuild()
+        with tempfile.TemporaryDirectory() as tmp:
+            out = Path(tmp)
+            written = snapshot.write_dir(out)
+            self.assertEqual(sorted(p.relative_to(out).as_posix() for p in written),
+                             ["index.html", "sobre/index.html", "sobre/index.html.gz"])
+            self.assertEqual((out / "index.html").read_bytes(), b"<h1>oi</h1>")
+            self.assertEqual(gzip.decompress((out / "sobre" / "index.html.gz").read_bytes()), self.big)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""SSE: formato dos eventos e releitura pelo Last-Event-ID ao entrar no canal."""
+import json
+import unittest
+from unittest import mock
+
+from app import pubsub, sse
+from app.sse import Channel, format_event
+
+def _drain(stream) -> list[bytes]:
+    out = []
+    while True:
+        ev = next(stream)
+        if ev is None:
+            return out
+        out.append(ev)
+
+def _ids(events: list[bytes]) -> list[int]:
+    return [json.loads(ev.split(b"data: ", 1)[1])["id"] for ev in events if ev.startswith(b"id: ")]
+
+class FormatTest(unittest.TestCase):
+    def test_multiline_data(self):
+        self.assertEqual(format_event("a\nb", event="recado", id=7), b"id: 7\nevent: recado\ndata: a\ndata: b\n\n")
+        self.assertEqual(format_event("x"), b"data: x\n\n")
+
+class ChannelTest(unittest.TestCase):
+    def setUp(self):
+        self.rows = [{"id": i, "message": f"m{i}"} for i in range(1, 6)]
+        self.topic = f"teste-sse-{id(self)}"
+        self.channel = Channel(self.topic, "recado", since=self._since, head=lambda: self.rows[-1]["id"])
+        self.addCleanup(pubsub.unsubscribe, self.topic, self.channel._on_message)
+
+    def _since(self, after: int) -> list[dict]:
+        return [r for r in self.rows if r["id"] > after][:2]  # paginado, como o fetch do banco
+
+    def _add(self, n: int) -> None:
+        self.rows.append({"id": n, "message": f"m{n}"})
+        pubsub.publish(self.topic, {"id": n})
+
+    def test_first_event_is_retry(self):
+        st = self.channel.open()
+        self.assertEqual(next(st), f"retry: {sse.RETRY_MS}\n\n".encode())
+        st.close()
+
+    def test_reconnect_replays_after_last_event_id(self):
+        st = self.channel.open(after=2)
+        self.assertEqual(_ids(_drain(st)), [3, 4, 5])
+        self._add(6)
+        self.assertEqual(_ids(_drain(st)), [6])
+        st.close()
+
+    def test_replay_and_live_events_not_duplicated(self):
+        first = self.channel.open()
+        _drain(first)
+        # chegou um recado antes do segundo cliente entrar
+        self._add(6)
+        second = self.channel.open(after=4)
+        self._add(7)
+        self.assertEqual(_ids(_drain(first)), [6, 7])
+        self.assertEqual(_ids(_drain(second)), [5, 6, 7])
+        first.close()
+        second.close()
+
+    def test_slow_client_dropped(self):
+        st = self.channel.open()
+        with mock.patch.object(sse, "MAX_PENDING", 200):
+            for n in range(6, 12):
+                self._add(n)
+        self.assertTrue(st.closed)
+        with self.assertRaises(StopIteration):
+            next(st)
+        self.assertEqual(self.channel._streams, set())
+
+    def test_client_limit(self):
+        with mock.patch.object(sse, "MAX_CLIENTS", sse._open_streams + 1):
+            st = self.channel.open()
+            self.assertIsNone(self.channel.open())
+            st.close()
+            self.assertIsNotNone(self.channel.open())
+        for s in list(self.channel._streams):
+            s.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Estáticos: índice em memória, cache negativo e URLs com hash (manifesto, cabeçalhos de cache)."""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app import staticserve
+from app.router import Request
+
+def _get(path: str, **headers) -> "staticserve.Response":
+    req = Request(method="GET", path=path, query={}, version="HTTP/1.1", headers=headers,
+                  remote_addr="127.0.0.1", body=b"", form={}, cookies={}, is_secure=False)
+    return staticserve.serve_static(req)
+
+class _StaticRoot(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name).resolve()
+        (self.root / "css").mkdir()
+        (self.root / "css" / "style.css").write_text("body{}")
+        (self.root / "LICENSE").write_text("MIT")
+        for patcher in (mock.patch.object(staticserve, "STATIC_ROOT", self.root),
+                        mock.patch.object(staticserve, "_snap", staticserve._Snapshot({}, {})),
+                        mock.patch.object(staticserve, "_negative", staticserve.OrderedDict())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        staticserve.build_index()
+
+class FingerprintTest(_StaticRoot):
+    def test_manifest_names(self):
+        digest = staticserve._snap.index["css/style.css"].digest
+        self.assertEqual(len(digest), 10)
+        self.assertEqual(staticserve.asset_url("css/style.css"), f"/static/css/style.{digest}.css")
+        lic = staticserve._snap.index["LICENSE"].digest
+        self.assertEqual(staticserve.asset_url("LICENSE"), f"/static/LICENSE.{lic}")
+        self.assertEqual(staticserve.asset_url("nao-existe.js"), "/static/nao-existe.js")
+
+    def test_hashed_url_is_immutable_plain_is_not(self):
+        hashed = _get(staticserve.asset_url("css/style.css"))
+        plain = _get("/static/css/style.css")
+        self.assertEqual(hashed.body_bytes(), b"body{}")
+        self.assertEqual(hashed.headers["Cache-Control"], staticserve.IMMUTABLE_CACHE)
+        self.assertEqual(plain.headers["Cache-Control"], staticserve.DEFAULT_CACHE)
+
+    def test_rescan_moves_hash_and_old_url_404s(self):
+        old_url = staticserve.asset_url("css/style.css")
+        (self.root / "css" / "style.css").write_text("body{color:red}")
+        os.utime(self.root / "css" / "style.css", ns=(1, 1))
+        self.assertTrue(staticserve.build_index())
+        new_url = staticserve.asset_url("css/style.css")
+        self.assertNotEqual(new_url, old_url)
+        self.assertEqual(_get(old_url).status, 404)
+        self.assertEqual(_get(new_url).body_bytes(), b"body{color:red}")
+
+    def test_file_changed_on_disk_not_served_immutable(self):
+        # corpo fora da memória: lido do disco na hora
+        staticserve._snap = staticserve._Snapshot({}, {})
+        with mock.patch.object(staticserve, "MEMORY_MAX_FILE", 0):
+            staticserve.build_index()
+        self.assertIsNone(staticserve._snap.index["css/style.css"].data)
+        url = staticserve.asset_url("css/style.css")
+        (self.root / "css" / "style.css").write_text("body{color:blue}")
+        resp = _get(url)
+        self.assertEqual(resp.headers["Cache-Control"], staticserve.DEFAULT_CACHE)
+
+    def test_digest_mismatch_not_immutable(self):
+        url = staticserve.asset_url("css/style.css")
+        staticserve._snap.index["css/style.css"].digest = "0000000000"
+        self.assertEqual(_get(url).headers["Cache-Control"], staticserve.DEFAULT_CACHE)
+
+class IndexTest(_StaticRoot):
+    def test_hit_served_from_memory(self):
+        with mock.patch.object(staticserve.Path, "read_bytes", side_effect=AssertionError("leu do disco")):
+            self.assertEqual(_get("/static/css/style.css").body_bytes(), b"body{}")
+
+    def test_missing_path_cached_negative(self):
+        self.assertEqual(_get("/static/wp-login.php").status, 404)
+        self.assertEqual(dict(staticserve._negative), {"wp-login.php": 404})
+        with mock.patch.object(staticserve.Path, "stat", side_effect=AssertionError("foi ao disco")):
+            self.assertEqual(_get("/static/wp-login.php").status, 404)
+
+    def test_traversal_cached_as_403(self):
+        self.assertEqual(_get("/static/../config/secret.key").status, 403)
+        self.assertEqual(staticserve._negative["../config/secret.key"], 403)
+
+    def test_negative_cache_bounded(self):
+        with mock.patch.object(staticserve, "NEGATIVE_CACHE_MAX", 3):
+            for i in range(5):
+                _get(f"/static/nada{i}")
+        self.assertEqual(list(staticserve._negative), ["nada2", "nada3", "nada4"])
+
+    def test_rescan_with_change_clears_negative(self):
+        _get("/static/novo.js")
+        self.assertFalse(staticserve.build_index())  # nada mudou: o cache fica
+        self.assertIn("novo.js", staticserve._negative)
+        (self.root / "novo.js").write_text("x")
+        self.assertTrue(staticserve.build_index())
+        self.assertEqual(dict(staticserve._negative), {})
+        self.assertEqual(_get("/static/novo.js").body_bytes(), b"x")
+
+    def test_file_created_between_scans_found(self):
+        (self.root / "tarde.txt").write_text("oi")
+        resp = _get("/static/tarde.txt")
+        self.assertEqual(resp.body_bytes(), b"oi")
+        self.assertNotIn("ETag", resp.headers)  # sem hash até a próxima varredura
+
+    def test_conditional_get(self):
+        etag = _get("/static/css/style.css").headers["ETag"]
+        self.assertEqual(_get("/static/css/style.css", **{"if-none-match": f"W/{etag}"}).status, 304)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Pool de workers: fila limitada, prazo na fila e decisões de crescer/encolher."""
+import threading
+import time
+import unittest
+
+from app.workers import WorkerPool
+
+def _pool(handler=lambda *a: None, **kw) -> WorkerPool:
+    opts = {"min_workers": 1, "max_workers": 4, "queue_size": 2, "queue_timeout": 5.0}
+    opts.update(kw)
+    return WorkerPool(handler, **opts)
+
+class QueueTest(unittest.TestCase):
+    def test_full_queue_rejects_without_blocking(self):
+        pool = _pool()  # sem start: nada consome a fila
+        self.assertTrue(pool.submit(1))
+        self.assertTrue(pool.submit(2))
+        self.assertFalse(pool.submit(3))
+        self.assertEqual(pool.depth(), 2)
+
+    def test_expired_job_skips_handler(self):
+        ran, expired = [], []
+        done = threading.Event()
+        pool = _pool(ran.append, queue_timeout=0.05,
+                     on_expired=lambda x: (expired.append(x), done.set()))
+        pool.submit("velho")
+        time.sleep(0.1)
+        pool.start()
+        self.assertTrue(done.wait(2))
+        pool.shutdown(timeout=2)
+        self.assertEqual((ran, expired), ([], ["velho"]))
+
+    def test_runs_jobs(self):
+        ran = []
+        pool = _pool(ran.append)
+        pool.start()
+        pool.submit("a")
+        self.assertEqual(pool.shutdown(timeout=2), 0)  # o que já estava na fila roda antes de sair
+        self.assertEqual(ran, ["a"])
+
+    def test_shutdown_bounded_with_full_queue(self):
+        gate = threading.Event()
+        pool = _pool(lambda: gate.wait(5), min_workers=2, max_workers=2, queue_size=1)
+        pool.start()
+        self.addCleanup(gate.set)
+        for busy in (1, 2):
+            pool.submit()
+            while pool._busy < busy:
+                time.sleep(0.01)
+        pool.submit()  # fila cheia: não sobra vaga para o sinal de saída
+        t0 = time.monotonic()
+        self.assertEqual(pool.shutdown(timeout=0.2), 2)
+        self.assertLess(time.monotonic() - t0, 1.0)
+
+class AdaptTest(unittest.TestCase):
+    def setUp(self):
+        self.gate = threading.Event()
+        self.pool = _pool(lambda: self.gate.wait(5), min_workers=1, max_workers=4, queue_size=8)
+        self.pool._spawn()  # sem start(): sem monitor, _adapt chamado à mão
+        self.addCleanup(self.pool.shutdown, 2)
+        self.addCleanup(self.gate.set)
+
+    def _saturate(self):
+        self.pool.submit()
+        while self.pool._busy < self.pool.size:
+            time.sleep(0.01)
+        self.pool.submit()  # sobra um na fila
+
+    def test_grows_when_waiting_and_cpu_has_room(self):
+        self._saturate()
+        self.pool._cpu_util = 0.1
+        self.pool._adapt()
+        self.assertEqual(self.pool.size, 2)
+
+    def test_holds_when_cpu_saturated(self):
+        self._saturate()
+        self.pool._cpu_util = 0.95
+        self.pool._adapt()
+        self.assertEqual(self.pool.size, 1)
+
+    def test_shrinks_after_idle_ticks(self):
+        self.pool._spawn()
+        self.pool._spawn()
+        for _ in range(4):
+            self.pool._adapt()
+        self.assertEqual(self.pool.depth(), 0)
+        self.pool._adapt()  # 5º ciclo ocioso: um sinal de saída na fila
+        deadline = time.monotonic() + 2
+        while self.pool.size > 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.pool.size, 2)
+
+if __name__ == "__main__":
+    unittest.main()